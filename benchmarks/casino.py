@@ -0,0 +1,52 @@
+"""
+benchmark for the blackjack engine: hand values kept up to date on every card versus
+recomputing them from the whole hand, and the throughput of the numpy simulation.
+run from the repository root:
+python -m benchmarks.casino
+"""
+import random
+import time
+import timeit
+from cogs.utils.blackjack import CARD_VALUES, FULL_DECK, Hand, simulate
+
+NUMBER = 20000
+SIMULATED_HANDS = 1_000_000
+
+
+def recomputed_value(cards):
+    total = sum(CARD_VALUES[card] for card in cards)
+    if any(CARD_VALUES[card] == 1 for card in cards) and total <= 11:
+        total += 10
+    return total
+
+
+def play_recomputed(deck):
+    cards = [deck[0], deck[1]]
+    while recomputed_value(cards) < 17:
+        cards.append(deck[len(cards)])
+    return recomputed_value(cards)
+
+
+def play_incremental(deck):
+    hand = Hand((deck[0], deck[1]))
+    while hand.value < 17:
+        hand.add(deck[len(hand)])
+    return hand.value
+
+
+def main():
+    deck = list(FULL_DECK)
+    random.shuffle(deck)
+    for name, play in (("recomputed hand value", play_recomputed), ("incremental hand value", play_incremental)):
+        elapsed = timeit.timeit(lambda: play(deck), number=NUMBER)
+        print(f"{name:<30} {elapsed / NUMBER * 1e6:8.3f} µs per hand")
+
+    start = time.perf_counter()
+    result = simulate(SIMULATED_HANDS, seed=0)
+    elapsed = time.perf_counter() - start
+    print(f"simulated {result.hands:,} hands in {elapsed:.2f}s ({result.hands / elapsed:,.0f} hands/s), "
+          f"expected return {result.expected_return:+.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+microbenchmark for the global command checks (blacklisted users and disabled commands)
+compares the old list scans with the indexed lookups, run from the repository root:
+python -m benchmarks.global_checks
+"""
+import random
+import timeit
+from cogs.utils.permissions import PermissionContext
+
+GUILDS = 50
+COMMANDS_PER_GUILD = 40
+IGNORED_USERS = 5000
+NUMBER = 20000
+
+
+def list_disabled_check(disabled_commands, guild_id, command_name):
+    disabled = [dc["command"] for dc in disabled_commands if dc["server"] == guild_id]
+    return command_name in disabled
+
+
+def main():
+    disabled_commands = [{"server": guild_id, "command": f"command{i}"}
+                         for guild_id in range(GUILDS) for i in range(COMMANDS_PER_GUILD)]
+    global_ignores = random.sample(range(10 ** 9), IGNORED_USERS)
+    context = PermissionContext()
+    context._load_disabled_commands(disabled_commands)
+    ignored_users = frozenset(global_ignores)
+    user_id = -1
+    guild_id = GUILDS - 1
+    command_name = "missing"
+
+    results = [
+        ("disabled command, list scan", lambda: list_disabled_check(disabled_commands, guild_id, command_name)),
+        ("disabled command, index", lambda: command_name in context.disabled_commands.get(guild_id, ())),
+        ("ignored user, list", lambda: user_id in global_ignores),
+        ("ignored user, frozenset", lambda: user_id in ignored_users),
+    ]
+    for name, check in results:
+        elapsed = timeit.timeit(check, number=NUMBER)
+        print(f"{name:<30} {elapsed / NUMBER * 1e6:8.3f} µs per check")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,13 @@ from discord.ext import commands
 from discord import Intents
 import discord
 from cogs.utils.dataIO import DataIO
+from cogs.utils.http_clients import HTTPClients
+from cogs.utils.settings_store import SettingsStore
 import logging
 from logging.handlers import RotatingFileHandler
 import asyncpg
 import sys
 import asyncio
-import aiohttp
 
 description = 'Pouty Bot MKII by Saikimo'
 
@@ -30,9 +31,11 @@ async def connect_db_and_start_bot():
                                        host=db_info["hostaddr"])
 
     try:
-        async with aiohttp.ClientSession() as session, bot:
+        async with HTTPClients() as http_clients, SettingsStore() as settings_store, bot:
             bot.loop.create_task(bot.load_extension("cogs.default"))
-            bot.session = session
+            bot.http_clients = http_clients
+            bot.settings_store = settings_store
+            bot.session = http_clients.session
             await bot.start(token)
     except KeyboardInterrupt:
         print("closing connection")
@@ -5,10 +5,7 @@ from discord.ext import commands, tasks
 from discord.ext.commands.errors import CommandError
 from discord.interactions import Interaction
 from discord.utils import TimestampStyle, get
-import os.path
-import json
 from .utils import checks, paginator
-from .utils.dataIO import DataIO
 from random import choice
 import logging
 import textwrap
@@ -238,19 +235,12 @@ class Admin(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        if os.path.exists('data/report_channel.json'):
-            with open('data/report_channel.json') as f:
-                json_data = json.load(f)
-                self.report_channel = self.bot.get_channel(json_data['channel'])
-        else:
-            self.report_channel = None
+        self.store = bot.settings_store
+        self.report_settings = self.store.load('data/report_channel.json', default=lambda: {"channel": None})
+        self.report_channel = self.bot.get_channel(self.report_settings['channel'] or 0)
         self.unmute_loop.start()
-        if os.path.exists("data/reddit_settings.json"):
-            with open("data/reddit_settings.json") as f:
-                json_data = json.load(f)
-                self.check_channel = self.bot.get_channel(int(json_data["channel"]))
-        else:
-            self.check_channel = None
+        reddit_settings = self.store.load("data/reddit_settings.json", default=lambda: {"channel": None})
+        self.check_channel = self.bot.get_channel(int(reddit_settings["channel"] or 0))
         self.units = {"seconds": 1, "minutes": 60, "hours": 3600, "days": 86400}
         self.invocations = []
         self.report_countdown = 60
@@ -612,8 +602,8 @@ class Admin(commands.Cog):
         Set the channel where reports go to
         """
         self.report_channel = channel
-        with open('data/report_channel.json', 'w') as f:
-            json.dump({"channel": self.report_channel.id}, f)
+        self.report_settings["channel"] = channel.id
+        self.store.changed('data/report_channel.json')
         await interaction.response.send_message(f'{channel.mention} has been set to the report channel')
 
     @commands.command(name="mban", aliases=["banm"])
@@ -642,7 +632,8 @@ class Admin(commands.Cog):
             embed.add_field(name="By Moderator", value=ctx.author.mention)
             await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
-        await ctx.send(await self.get_ban_image(ctx.author.id))
+        if ban_image := await self.get_ban_image(ctx.author.id):
+            await ctx.send(ban_image)
         await self.check_channel.send(embed=embed)
 
     @commands.group(name="ban", usage="ban <User> <reason> `days:|dd:` <number of days>", invoke_without_command=True)
@@ -690,7 +681,8 @@ class Admin(commands.Cog):
             embed.add_field(name="By Moderator", value=ctx.author.mention)
             embed.add_field(name="Ban message", value=f"[jump url]({ctx.message.jump_url})", inline=False)
             await self.check_channel.send(embed=embed)
-            await ctx.send(await self.get_ban_image(ctx.author.id))
+            if ban_image := await self.get_ban_image(ctx.author.id):
+                await ctx.send(ban_image)
         except discord.Forbidden:
             await ctx.send("I don't have the permission to ban this user.")
         except discord.HTTPException as httpex:
@@ -761,9 +753,10 @@ class Admin(commands.Cog):
         personal_images = await self.fetch_ban_images(user_id)
         if personal_images:
             return choice([img["link"] for img in personal_images])
-        data_io = DataIO()
-        ban_images = data_io.load_json("ban_images")
-        return choice(ban_images)
+        ban_images = self.store.load("data/ban_images.json", default=list)
+        if ban_images:
+            return choice(ban_images)
+        return None
 
     @tasks.loop(seconds=5.0)
     async def unmute_loop(self):
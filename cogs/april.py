@@ -6,6 +6,7 @@ import re
 import random
 
 from discord.mentions import AllowedMentions
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
 
 ZOOMER_REGEX = re.compile(r"\b(ong|(fr)+|cap(ping)?|rizz)\b", flags=re.IGNORECASE)
 
@@ -42,13 +43,20 @@ class April(commands.Cog):
                 595585060909088774
                 ]
 
-    @commands.Cog.listener("on_message")
-    async def zoomer_reply(self, message: discord.Message):
-        if message.author == self.bot.user \
-                or message.channel.id in self.excluded_channels \
-                or not message.guild:
-            return
+    async def cog_load(self):
+        register_cog(self.bot, self)
 
+    async def cog_unload(self):
+        unregister_cog(self.bot, self)
+
+    def is_zoomer_channel(self, message):
+        return message.author != self.bot.user \
+                and message.channel.id not in self.excluded_channels \
+                and message.guild is not None
+
+    # replies randomly to any message as well, so it can't filter by pattern
+    @message_handler(predicate=is_zoomer_channel)
+    async def zoomer_reply(self, message: discord.Message, match):
         content = message.content
         chance = random.random()
         me = message.guild.me
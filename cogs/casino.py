@@ -3,11 +3,14 @@ from discord import Embed, Member
 import discord
 from enum import Enum, auto
 from .utils import checks
+from .utils.blackjack import FULL_DECK, Hand, card_value, simulate
 from typing import Optional
-import copy
 import random
 import asyncio
 
+# about 15 seconds of simulation
+MAX_SIMULATED_HANDS = 10_000_000
+
 class BetConversionError(commands.BadArgument):
     pass
 class Bet(commands.Converter):
@@ -33,16 +36,6 @@ class Bet(commands.Converter):
 
 
 
-class CardColor(Enum):
-    """
-    simple enum for getting emoji
-    """
-    heart = "\N{WHITE HEART SUIT}"
-    spade = "\N{WHITE SPADE SUIT}"
-    diamond = "\N{WHITE DIAMOND SUIT}"
-    club = "\N{WHITE CLUB SUIT}"
-
-
 class GameState(Enum):
     """
     BlackJack Game states
@@ -52,34 +45,6 @@ class GameState(Enum):
     GAME_OVER = auto()
 
 
-class Card():
-    """
-    A card Object with card value (numerical)
-    color (or suit) 
-    and a face [eg number or A(ce), Q(ueen), J(ack), K(ing)]
-    """
-    def __init__(self, value, color, face):
-        self.value = value
-        self.color = color
-        self.face = face
-
-    def __str__(self):
-        return f"{self.face}{self.color}"
-
-
-def generate_deck():
-    deck = []
-    for color in list(CardColor):
-        deck.append(Card(1, color.value, "A"))
-        deck.append(Card(10, color.value, "J"))
-        deck.append(Card(10, color.value, "Q"))
-        deck.append(Card(10, color.value, "K"))
-        for i in range(2, 11):
-            deck.append(Card(i, color.value, str(i)))
-    return deck
-
-deck = generate_deck()
-
 class BlackJackGame(discord.ui.View):
     """
     one game of blackjack
@@ -92,11 +57,11 @@ class BlackJackGame(discord.ui.View):
         self.displaying_help = False
         self.state = GameState.RUNNING
         self.bet = bet
-        self.deck = copy.copy(deck)
+        self.deck = list(FULL_DECK)
         self.folded = False
         random.shuffle(self.deck)
-        self.dealer_hand = [self.deck.pop(0), self.deck.pop(0)]
-        self.player_hand = [self.deck.pop(0), self.deck.pop(0)]
+        self.dealer_hand = Hand((self.deck.pop(), self.deck.pop()))
+        self.player_hand = Hand((self.deck.pop(), self.deck.pop()))
         if self.player_value == 21:
             self.state = GameState.GAME_OVER
 
@@ -127,18 +92,14 @@ class BlackJackGame(discord.ui.View):
 
     @property
     def player_value(self):
-        total = sum(c.value for c in self.player_hand)
-        if any(c.face == "A" for c in self.player_hand) and total <= 11:
-            total += 10
-        return total
+        return self.player_hand.value
 
     @property
     def dealer_value(self):
-        dealer_stop = 1 if self.state == GameState.RUNNING else len(self.dealer_hand)
-        total = sum(c.value for c in self.dealer_hand[:dealer_stop])
-        if any(c.face == "A" for c in self.dealer_hand[:dealer_stop]) and total <= 11:
-            total += 10
-        return total
+        # only the first card of the dealer is visible while the player is drawing
+        if self.state == GameState.RUNNING:
+            return card_value(self.dealer_hand[0])
+        return self.dealer_hand.value
 
     
     def get_winner(self):
@@ -146,8 +107,8 @@ class BlackJackGame(discord.ui.View):
         if self.state in (GameState.DEALER_PHASE, GameState.RUNNING):
             return "running", False
 
-        dealer_has_bj = len(self.dealer_hand) == 2 and self.dealer_value == 21
-        player_has_bj = len(self.player_hand) == 2 and self.player_value == 21
+        dealer_has_bj = self.dealer_hand.is_blackjack
+        player_has_bj = self.player_hand.is_blackjack
         if self.player_value > 21:
             return "dealer", False
         elif self.dealer_value > 21 or self.player_value > self.dealer_value:
@@ -162,8 +123,8 @@ class BlackJackGame(discord.ui.View):
             return "tie", False
 
     def player_draw(self):
-        card = self.deck.pop(0)
-        self.player_hand.append(card)
+        card = self.deck.pop()
+        self.player_hand.add(card)
         if self.player_value == 21:
             self.state = GameState.DEALER_PHASE
             self.stand()
@@ -172,8 +133,8 @@ class BlackJackGame(discord.ui.View):
         return card
 
     def dealer_draw(self):
-        card = self.deck.pop(0)
-        self.dealer_hand.append(card)
+        card = self.deck.pop()
+        self.dealer_hand.add(card)
         if self.dealer_value > 21:
             self.state = GameState.GAME_OVER
         return card
@@ -189,14 +150,14 @@ class BlackJackGame(discord.ui.View):
     def __str__(self):
         dealer_hand = ""
         player_hand = (f"**{self.player.display_name}** hand:"
-                       f" {', '.join([str(x) for x in self.player_hand])}"
+                       f" {self.player_hand}"
                        f" total: {self.player_value}")
         if self.state == GameState.RUNNING:
-            dealer_hand = (f"**dealer** hand: {self.dealer_hand[0]}, "
-                           f"? total: {self.dealer_hand[0].value}\n")
+            dealer_hand = (f"**dealer** hand: {self.dealer_hand.format(1)}, "
+                           f"? total: {self.dealer_value}\n")
         else:
             dealer_hand = (f"**dealer** hand:"
-                           f" {', '.join([str(x) for x in self.dealer_hand])}"
+                           f" {self.dealer_hand}"
                            f" total: {self.dealer_value}")
         return f"{dealer_hand}\n{player_hand}"
 
@@ -205,8 +166,8 @@ class BlackJackGame(discord.ui.View):
         dealer_stop = 1 if self.state == GameState.RUNNING else len(self.dealer_hand)
         hidden_card = ", ?" if self.state == GameState.RUNNING else ""
         player_name = self.player.display_name
-        player_hand = (f"{', '.join([str(x) for x in self.player_hand])}\ntotal: {self.player_value}")
-        dealer_hand = (f"{', '.join([str(x) for x in self.dealer_hand[:dealer_stop]])}{hidden_card}\ntotal: {self.dealer_value}")
+        player_hand = (f"{self.player_hand}\ntotal: {self.player_value}")
+        dealer_hand = (f"{self.dealer_hand.format(dealer_stop)}{hidden_card}\ntotal: {self.dealer_value}")
         game_embed = Embed(color=self.player.color)
         game_embed.set_author(name=player_name, icon_url=self.player.avatar.replace(format="png"))
         game_embed.add_field(name="Dealer's Hand", value=dealer_hand, inline=True)
@@ -336,14 +297,15 @@ class BlackJack(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.payday = self.bot.get_cog("Payday")
-        self.games = []
+        # player id -> running game
+        self.games = {}
         self.folds = []
 
     async def cog_unload(self):
         if not self.payday:
             return
         try:
-            for game in self.games:
+            for game in self.games.values():
                 await self.payday.add_money(game.player.id, game.bet)
                 game.clear_items()
                 game.stop()
@@ -354,7 +316,7 @@ class BlackJack(commands.Cog):
             logger.error("Exception while giving back blackjack bets", exc_info=1)
             owner = self.bot.get_user(self.bot.owner_id)
             pending_payouts = "Some BlackJack payouts are still pending\n"
-            for game in self.games:
+            for game in self.games.values():
                 pending_payouts += f"{game.player.mention}: {game.bet:,}"
             self.bot.loop.create_task(owner.send(pending_payouts))
 
@@ -366,7 +328,7 @@ class BlackJack(commands.Cog):
         """
         helper function to get the currently running game of a player
         """
-        game = next(iter(x for x in self.games if x.player == player), None)
+        game = self.games.get(player.id)
         if not game:
             raise commands.CommandError("No game running start one with `.bj`")
         return game
@@ -395,22 +357,21 @@ class BlackJack(commands.Cog):
             content = "Payday not loaded this game is just for fun"
         if bet < 1:
             return await ctx.send("You can't bet less than 1")
-        game = next(iter(x for x in self.games if x.player == ctx.author), None)
-        if game:
+        if ctx.author.id in self.games:
             return await ctx.send("You already started a game either hit or stand")
         game = BlackJackGame(ctx.author, bet, self.payday)
         if self.payday:
             balance = await self.payday.subtract_money(ctx.author.id, bet)
-        self.games.append(game)
+        self.games[ctx.author.id] = game
         if game.state == GameState.GAME_OVER:
             await game.payout(ctx=ctx)
-            self.games.remove(game)
+            self.games.pop(ctx.author.id, None)
             return
 
         game.message = await ctx.send(content=content, embed=game.build_embed(), view=game)
         await game.wait()
         await game.message.edit(view=game)
-        self.games.remove(game)
+        self.games.pop(ctx.author.id, None)
 
     @blackjack_group.command(name="hit", aliases=["draw"])
     async def draw_card(self, ctx):
@@ -454,6 +415,23 @@ class BlackJack(commands.Cog):
         game = self.get_game(ctx.author)
         await ctx.send(game.message.jump_url)
 
+    @blackjack_group.command(name="simulate", hidden=True)
+    @checks.is_owner()
+    async def simulate_games(self, ctx, hands: int = 1_000_000, stand_on: int = 17, blackjack_payout: float = 1.5):
+        """
+        play a lot of games with a player that hits below `stand_on` to check the house edge of the payouts
+        """
+        if hands < 1:
+            return await ctx.send("please choose at least 1 hand")
+        hands = min(hands, MAX_SIMULATED_HANDS)
+        result = await asyncio.to_thread(simulate, hands, stand_on, blackjack_payout)
+        await ctx.send(f"```\nhands:       {result.hands:,}\n"
+                       f"wins:        {result.wins:,} ({result.wins / result.hands:.2%})\n"
+                       f"losses:      {result.losses:,} ({result.losses / result.hands:.2%})\n"
+                       f"pushes:      {result.pushes:,} ({result.pushes / result.hands:.2%})\n"
+                       f"blackjacks:  {result.blackjacks:,}\n"
+                       f"house edge:  {-result.expected_return:.3%}\n```")
+
 
 class DeathrollStates(Enum):
     WAITING = auto()
@@ -507,7 +485,9 @@ class Deathroll(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.games = []
+        # start player id -> game and message id -> game of all running games
+        self.games = {}
+        self.games_by_message = {}
         self.join_reaction = "\N{SKULL}"
         self.roll_reaction = "\N{GAME DIE}"
         self.resolve_reaction = "\N{ROCKET}"
@@ -526,16 +506,19 @@ class Deathroll(commands.Cog):
             logger.error("Exception while giving back deathroll bets", exc_info=1)
             owner = self.bot.get_user(self.bot.owner_id)
             pending_payouts = "Some DeathRoll payouts are still pending\n"
-            for game in self.games:
+            for game in self.games.values():
                 pending_payouts += f"{game.start_player.mention}: {game.bet:,}\n"
                 pending_payouts += f"{game.challenger.mention}: {game.bet:,}\n"
             self.bot.loop.create_task(owner.send(pending_payouts))
 
     async def pay_back_all_games(self):
-        while len(self.games) > 0:
-            game =self.games.pop(0)
-            await self.payday.add_money(game.start_player.id, game.bet)
-            await self.payday.add_money(game.challenger.id, game.bet)
+        for game in list(self.games.values()):
+            self.remove_game(game)
+            refunds = {game.start_player.id: game.bet}
+            # the challenger only paid once the game started
+            if game.challenger and game.game_state == DeathrollStates.PLAYING:
+                refunds[game.challenger.id] = game.bet
+            await self.payday.transfer(refunds)
             await game.message.clear_reactions()
             del game
 
@@ -543,19 +526,28 @@ class Deathroll(commands.Cog):
         """
         helper function to get the currently running game of a player
         """
-        game = next(iter(x for x in self.games if x.start_player == player), None)
+        game = self.games.get(player.id)
         if not game:
             raise commands.CommandError("No game running start one with `.dr`")
         return game
 
     def get_game_by_message(self, message):
-        game = next(iter(x for x in self.games if x.message is not None and x.message.id == message.id), None)
+        game = self.games_by_message.get(message.id)
         if not game:
             raise commands.CommandError("No game running start one with `.dr`")
         return game
 
-    async def payout(self, game):
-        await self.payday.add_money(game.winner.id, game.bet * 2)
+    def add_game(self, game):
+        self.games[game.start_player.id] = game
+
+    def set_game_message(self, game, message):
+        game.message = message
+        self.games_by_message[message.id] = game
+
+    def remove_game(self, game):
+        self.games.pop(game.start_player.id, None)
+        if game.message:
+            self.games_by_message.pop(game.message.id, None)
 
     async def notify_player(self, game):
         await asyncio.sleep(30)
@@ -566,19 +558,18 @@ class Deathroll(commands.Cog):
         embed = game.message.embeds[0]
         embed.description = str(game)
         if self.payday:
-            await self.payout(game)
-            start_pl_money = await self.payday.fetch_money(game.start_player.id)
-            challenger_money = await self.payday.fetch_money(game.challenger.id)
-            embed.add_field(name=f"{game.start_player.display_name}'s balance:", value=f"{start_pl_money['money']:,}")
-            embed.add_field(name=f"{game.challenger.display_name}'s balance:", value=f"{challenger_money['money']:,}")
+            # pays the winner and reads both balances in a single statement
+            loser = game.challenger if game.winner == game.start_player else game.start_player
+            balances = await self.payday.transfer({game.winner.id: game.bet * 2, loser.id: 0})
+            embed.add_field(name=f"{game.start_player.display_name}'s balance:", value=f"{balances[game.start_player.id]:,}")
+            embed.add_field(name=f"{game.challenger.display_name}'s balance:", value=f"{balances[game.challenger.id]:,}")
         await game.message.edit(embed=embed)
-        self.games.remove(game)
+        self.remove_game(game)
 
     @commands.Cog.listener("on_reaction_add")
     async def button_reaction(self, reaction, user):
-        try:
-            game = self.get_game_by_message(reaction.message)
-        except commands.CommandError:
+        game = self.games_by_message.get(reaction.message.id)
+        if not game:
             return
         if user.id == self.bot.user.id:
             return
@@ -639,7 +630,7 @@ class Deathroll(commands.Cog):
                 try:
                     await self.payday.subtract_money(game.challenger.id, game.bet)
                 except commands.CommandError as e:
-                    await ctx.send(f"{game.challenger.mention} {e}")
+                    return await game.message.channel.send(f"{game.challenger.mention} {e}")
             game.game_state = DeathrollStates.PLAYING
             game.current_player = game.start_player
             embed = game.message.embeds[0]
@@ -655,7 +646,7 @@ class Deathroll(commands.Cog):
             await game.message.delete()
             if self.payday:
                 await self.payday.add_money(game.start_player.id, game.bet)
-            self.games.remove(game)
+            self.remove_game(game)
             del game
             return
 
@@ -690,29 +681,29 @@ class Deathroll(commands.Cog):
             embed = Embed(title="\N{SKULL} Deathroll \N{SKULL}", description=str(game),
                               color=ctx.author.colour)
             embed.add_field(name="Bet", value=game.bet)
-            self.games.append(game)
+            self.add_game(game)
             if challenger:
                 if self.payday:
                     money_challenger = await self.payday.fetch_money(challenger.id)
                     if not money_challenger:
                         await self.payday.add_money(ctx.author.id, game.bet)
-                        self.games.remove(game)
+                        self.remove_game(game)
                         del game
                         return await ctx.send("The player you challenged doesn't have an account they first need to start one with the `.payday` command")
                     if not money_challenger or money_challenger['money'] < game.bet:
                         await self.payday.add_money(ctx.author.id, game.bet)
-                        self.games.remove(game)
+                        self.remove_game(game)
                         del game
                         return await ctx.send("The player you challenged has not enough money.")
                 game.add_player(challenger)
                 embed.description = f"{game.start_player.mention} challenged {game.challenger.mention} react with {self.accept_reaction} to accept or {self.reject_reaction} to reject"
                 message = await ctx.send(embed=embed)
-                game.message = message
+                self.set_game_message(game, message)
                 await message.add_reaction(self.accept_reaction)
                 await message.add_reaction(self.reject_reaction)
                 return
             message = await ctx.send(embed=embed)
-            game.message = message
+            self.set_game_message(game, message)
             await message.add_reaction(self.join_reaction)
 
     @deathroll.command(name="cancel")
@@ -726,7 +717,7 @@ class Deathroll(commands.Cog):
                 return await ctx.send("You can't cancel a game that is already in progress!")
             if self.payday:
                 await self.payday.add_money(ctx.author.id, game.bet)
-            self.games.remove(game)
+            self.remove_game(game)
             await game.message.delete()
             await ctx.send("Game was cancelled")
             del game
@@ -1,19 +1,27 @@
-from discord.ext import commands
-import discord
-
-class Chazz(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
-        self.bucket = commands.CooldownMapping.from_cooldown(
-                1,
-                3600,
-                commands.BucketType.guild
-                )
-
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if not self.bucket.update_rate_limit(message) and "chazz" in message.content.lower():
-            await message.channel.send("https://tenor.com/view/confused-white-persian-guardian-why-gif-14053524")
-
-async def setup(bot: commands.Bot):
-    await bot.add_cog(Chazz(bot))
+from discord.ext import commands
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
+import discord
+import re
+
+class Chazz(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        self.bucket = commands.CooldownMapping.from_cooldown(
+                1,
+                3600,
+                commands.BucketType.guild
+                )
+
+    async def cog_load(self):
+        register_cog(self.bot, self)
+
+    async def cog_unload(self):
+        unregister_cog(self.bot, self)
+
+    @message_handler(re.compile("chazz", re.IGNORECASE))
+    async def chazz_reply(self, message, match):
+        if not self.bucket.update_rate_limit(message):
+            await message.channel.send("https://tenor.com/view/confused-white-persian-guardian-why-gif-14053524")
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Chazz(bot))
@@ -2,7 +2,8 @@ from discord.ext import commands
 from .utils import checks
 import discord
 import asyncio
-from .utils import dataIO
+
+INITIAL_COGS_FILE = "data/initial_cogs.json"
 
 
 class Christmas(commands.Cog):
@@ -13,17 +14,18 @@ class Christmas(commands.Cog):
         self.next_role = None
         self.padoru = discord.utils.get(self.bot.emojis, name="PADORUPADORU")
         self.communism = discord.utils.get(self.bot.emojis, name="communism")
-        settings_loader = dataIO.DataIO()
-        initial_cogs = settings_loader.load_json("initial_cogs")
-        initial_cogs.append("cogs.christmas")
-        settings_loader.save_json("initial_cogs", initial_cogs)
+        self.store = bot.settings_store
+        initial_cogs = self.store.load(INITIAL_COGS_FILE, default=list)
+        if "cogs.christmas" not in initial_cogs:
+            initial_cogs.append("cogs.christmas")
+            self.store.changed(INITIAL_COGS_FILE)
 
 
     def cog_unload(self):
-        settings_loader = dataIO.DataIO()
-        initial_cogs = settings_loader.load_json("initial_cogs")
-        initial_cogs.remove("cogs.christmas")
-        settings_loader.save_json("initial_cogs", initial_cogs)
+        initial_cogs = self.store.load(INITIAL_COGS_FILE, default=list)
+        if "cogs.christmas" in initial_cogs:
+            initial_cogs.remove("cogs.christmas")
+            self.store.changed(INITIAL_COGS_FILE)
 
     @commands.command(name="christmas", pass_context=True, hidden=True)
     @checks.is_owner_or_moderator()
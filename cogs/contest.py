@@ -21,7 +21,6 @@ import discord
 import io
 import os.path
 import asyncpg
-import aiohttp
 import asyncio
 import logging
 import mimetypes as mime
@@ -39,13 +38,10 @@ class Contest(commands.Cog):
         self.bot = bot
         self.contestant_role = None
         self.contest_channel = None
-        self.session = aiohttp.ClientSession()
+        self.session = bot.session
         self.bot.loop.create_task(self.setup_database())
         self.bot.loop.create_task(self.load_settings())
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
-
     async def load_settings(self):
         await asyncio.sleep(1)
         async with self.bot.db.acquire() as connection:
@@ -1,10 +1,9 @@
 from discord.ext import commands
-from aiohttp import ClientSession
 import random
 class Dadjoke(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.session = ClientSession()
+        self.session = bot.session
 
     @commands.command(name="dadjoke", aliases=["dad"])
     async def dad_joke(self, ctx):
@@ -26,8 +25,5 @@ class Dadjoke(commands.Cog):
                 joke = "\n".join([random.choice(joke_prefixes), joke_response.get("joke")])
                 await ctx.send(joke)
     
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
-
 async def setup(bot):
     await bot.add_cog(Dadjoke(bot))
@@ -9,12 +9,21 @@ import asyncio
 import re
 import traceback
 from .utils import checks
+from .utils.exceptions import UpstreamUnavailable
 from .utils.paginator import TextPages,FieldPages
 from textwrap import shorten
 import logging
 from os import path
 import typing
 
+SUB_CHANNEL_FILE = 'data/danbooru/sub_channel.json'
+
+
+def load_sub_channel(bot):
+    """the server and channel all public subscriptions are posted in or None if it wasn't set up"""
+    if SUB_CHANNEL_FILE in bot.settings_store.data or os.path.exists(SUB_CHANNEL_FILE):
+        return bot.settings_store.load(SUB_CHANNEL_FILE)
+    return None
 
 
 class DanbooruTypeConverter(commands.Converter):
@@ -233,6 +242,10 @@ class Scheduler:
                 self._write_subs_information_to_file()
                 await asyncio.sleep(10)
                 continue
+            except UpstreamUnavailable as e:
+                self.logger.warning(f"skipping danbooru update for {sub.tags_to_string()}: {e}")
+                await asyncio.sleep(e.retry_after)
+                continue
             except Exception as e:
                 owner = self.bot.get_user(134310073014026242)
                 self._write_subs_information_to_file()
@@ -301,9 +314,8 @@ class Scheduler:
             user_list.append(user)
         else:
             is_private = False
-            if os.path.exists('data/danbooru/sub_channel.json'):
-                with open('data/danbooru/sub_channel.json','r') as f:
-                    sub_channel_file = json.load(f)
+            sub_channel_file = load_sub_channel(self.bot)
+            if sub_channel_file:
                 server = self.bot.get_guild(int(sub_channel_file['server']))
                 channel = self.bot.get_channel(int(sub_channel_file['channel']))
             else:
@@ -413,7 +425,7 @@ class Danbooru(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.auth_file = 'data/danbooru/danbooru.json'
-        self.session = aiohttp.ClientSession()
+        self.session = bot.session
         self.scheduler = Scheduler(self.bot,self.session)
         self.running_task = self.scheduler.schedule_task.start()
         self.helper = Helper(self.session,self.bot,self.auth_file)
@@ -421,13 +433,9 @@ class Danbooru(commands.Cog):
         self.blacklist_tags_file = 'data/danbooru_cog_blacklist.json'
         self.danbooru_channel_file = 'data/danbooru_channel_file.json'
         self.bucket = commands.CooldownMapping.from_cooldown(1, 60, commands.BucketType.member)
-        with open(self.blacklist_tags_file, 'r') as f:
-            self.tags_blacklist = json.load(f)
-        if path.exists(self.danbooru_channel_file):
-            with open(self.danbooru_channel_file, 'r') as file:
-                self.danbooru_channels = json.load(file)
-        else:
-            self.danbooru_channels = []
+        self.store = bot.settings_store
+        self.tags_blacklist = self.store.load(self.blacklist_tags_file, default=list)
+        self.danbooru_channels = self.store.load(self.danbooru_channel_file, default=list)
 
     async def cog_unload(self):
         try:
@@ -438,7 +446,6 @@ class Danbooru(commands.Cog):
             for sub in self.scheduler.subscriptions:
                 sub.write_sub_to_file()
                 del sub
-            self.bot.loop.create_task(self.session.close())
             del self.scheduler
         except Exception as e:
             print(e)
@@ -477,8 +484,7 @@ class Danbooru(commands.Cog):
     async def blacklist_add(self, ctx, tag):
         """adds a tag to the danbooru tag blacklist"""
         self.tags_blacklist.append(tag)
-        with open(self.blacklist_tags_file, 'w') as f:
-            json.dump(self.tags_blacklist, f)
+        self.store.changed(self.blacklist_tags_file)
         await ctx.send("tag `{0}` added".format(tag))
 
 
@@ -490,8 +496,7 @@ class Danbooru(commands.Cog):
         except ValueError:
             await ctx.send("tag not in blacklist")
             return
-        with open(self.blacklist_tags_file, 'w') as f:
-            json.dump(self.tags_blacklist, f)
+        self.store.changed(self.blacklist_tags_file)
         await ctx.send("tag `{0}` removed".format(tag))
 
     @blacklist_tags.command(aliases=['list'])
@@ -513,8 +518,7 @@ class Danbooru(commands.Cog):
             'channel': ctx.message.channel.id,
             'server': ctx.message.guild.id
         })
-        with open(self.danbooru_channel_file,  'w') as f:
-            json.dump(self.danbooru_channels, f)
+        self.store.changed(self.danbooru_channel_file)
         await ctx.send("channel setup for danbooru commands")
 
     def _get_danbooru_channel_of_message(self,message : discord.Message):
@@ -713,11 +717,10 @@ class Danbooru(commands.Cog):
                     sub.write_sub_to_file()
                     await ctx.send('{}\nSuccessfully added to existing sub `{}`'.format(ctx.message.author.mention,sub.tags_to_message()))
                     return
-            if os.path.exists('data/danbooru/sub_channel.json'):
-                with open('data/danbooru/sub_channel.json') as f:
-                    data = json.load(f)
-                    server = self.bot.get_guild(int(data['server']))
-                    channel = self.bot.get_channel(int(data['channel']))
+            data = load_sub_channel(self.bot)
+            if data:
+                server = self.bot.get_guild(int(data['server']))
+                channel = self.bot.get_channel(int(data['channel']))
                 new_sub = Dansub(message.author, tags_list, pool_list, server, channel, is_private)
             else:
                 new_sub = Dansub(message.author, tags_list, pool_list, message.guild, message.channel,is_private)
@@ -845,12 +848,10 @@ class Danbooru(commands.Cog):
         message = ctx.message
         server = message.guild
         channel = message.channel
-        with open('data/danbooru/sub_channel.json', 'w') as f:
-           input = {
-               'server': server.id,
-               'channel': channel.id
-               }
-           json.dump(input,f)
+        self.store.set(SUB_CHANNEL_FILE, {
+            'server': server.id,
+            'channel': channel.id
+        })
         await ctx.send('channel setup for subscription')
 
     @dans.command()
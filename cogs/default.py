@@ -2,8 +2,10 @@ from discord import app_commands
 from .utils import checks
 from .utils import paginator
 from .utils import views
-from .utils.dataIO import DataIO
+from .utils.command_index import get_command_index, closest
 from .utils.exceptions import *
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
+from .utils.permissions import permissions, CREDENTIALS_FILE
 from discord.ext.commands import DefaultHelpCommand, Paginator
 from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
@@ -18,26 +20,6 @@ import traceback
 
 LOG_SIZE = 200 * 1024 * 1024
 
-def levenshtein_distance(user_input: str, command_name: str):
-    rows = len(user_input) + 1
-    cols = len(command_name) + 1
-    dist = [[0 for x in range(cols)] for x in range(rows)]
-    for i in range(1, rows):
-        dist[i][0] = i
-    for i in range(1, cols):
-        dist[0][i] = i
-
-    for col in range(1, cols):
-        for row in range(1, rows):
-            if user_input[row - 1] == command_name[col - 1]:
-                cost = 0
-            else:
-                cost = 1
-            dist[row][col] = min(dist[row-1][col] + 1,
-                                 dist[row][col-1] + 1,
-                                 dist[row-1][col-1] + cost)
-    return dist[-1][-1]
-
 @dataclass
 class CogPage:
     cog: commands.Cog
@@ -123,15 +105,18 @@ class CustomHelpCommand(DefaultHelpCommand):
         await view.start(self.context)
 
     async def command_not_found(self, string):
-        filtered_commands = await self.filter_commands(self.context.bot.commands, sort=True)
-        distances = []
-        for command in filtered_commands:
-            distance = levenshtein_distance(string, command.name)
-            distances.append({"name":command.name, "distance" : distance})
-        list_sorted = sorted(distances, key=lambda element: element["distance"])
-        same_dst_results = [c["name"] for c in list_sorted if c["distance"] == list_sorted[0]["distance"]]
+        bot = self.context.bot
+        # the checks run on more candidates than shown, so a hidden closest match doesn't hide the visible ones
+        ranked = dict(get_command_index(bot).ranked(bot, string))
+        suggested_commands = [bot.get_command(name) for name in ranked]
+        visible = await self.filter_commands([c for c in suggested_commands if c])
+        suggestions = set(closest([(c.qualified_name, ranked[c.qualified_name]) for c in visible]))
+        filtered_commands = sorted((c for c in visible if c.qualified_name in suggestions), key=lambda c: c.name)
+        if not filtered_commands:
+            return f"No command called `{string}` found."
         return (f"No command called `{string}` found."
-                f" Maybe you meant one of the following command(s):\n`{same_dst_results}`")
+                f" Maybe you meant one of the following command(s):\n"
+                f"`{', '.join(c.qualified_name for c in filtered_commands)}`")
 
     async def send_cog_help(self, cog):
         embed = discord.Embed()
@@ -188,8 +173,8 @@ class Default(commands.Cog):
         self.bot.add_check(self.check_for_black_list_user, call_once=True)
         self.bot.add_check(self.check_disabled_command, call_once=True)
         self.bot.tree.on_error = self.app_command_error
-        self.data_io = DataIO()
-        self.credentials = self.data_io.load_json("credentials")
+        self.credentials = bot.settings_store.load(CREDENTIALS_FILE)
+        permissions.bind(bot.settings_store)
         self.logger = logging.getLogger("PoutyBot")
         if not len(self.logger.handlers) > 0:
             handler = RotatingFileHandler(filename='data/pouty.log',
@@ -212,6 +197,7 @@ class Default(commands.Cog):
             self.dm_logger.addHandler(handler)
 
     async def cog_load(self):
+        register_cog(self.bot, self)
         await self.bot.wait_until_ready()
         await self.create_loaded_cogs_table()
         await self.load_cogs()
@@ -235,6 +221,8 @@ class Default(commands.Cog):
         self.bot.extensions_loaded = True
 
     def cog_unload(self):
+        unregister_cog(self.bot, self)
+        permissions.unbind()
         self.bot.remove_listener(self.on_ready, 'on_ready')
         self.bot.remove_listener(self.on_command_error, "on_command_error")
         self.bot.remove_check(self.check_for_black_list_user, call_once=True)
@@ -249,11 +237,10 @@ class Default(commands.Cog):
         print(f'discord.py version: {discord.__version__}')
         print('-' * 8)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if not message.guild and not message.flags.ephemeral:
-            user = message.author
-            self.dm_logger.info(f"{user}({user.id}) message: {message.content}")
+    @message_handler(predicate=lambda self, message: not message.guild and not message.flags.ephemeral)
+    async def log_direct_message(self, message: discord.Message, match):
+        user = message.author
+        self.dm_logger.info(f"{user}({user.id}) message: {message.content}")
 
     async def on_command_error(self, ctx, error):
         if ctx.command and ctx.command.has_error_handler():
@@ -276,6 +263,9 @@ class Default(commands.Cog):
         elif isinstance(error, commands.CheckFailure):
             await ctx.send(error, ephemeral=True)
             return
+        elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, UpstreamUnavailable):
+            await ctx.send(error.original)
+            return
         elif isinstance(error, commands.CommandInvokeError):
             await self.create_and_send_traceback(ctx, error.original)
         else:
@@ -315,24 +305,16 @@ class Default(commands.Cog):
             if checks.user_is_in_whitelist_server(self.bot, ctx.author):
                 return True
             current_guild = ctx.guild
-            guilds_with_disabled_command = [g["server"] for g in owner_cog.disabled_commands]
             if current_guild:
-                disabled_commands = [dc["command"] for dc in owner_cog.disabled_commands
-                                     if dc["server"] == current_guild.id]
-                if ctx.command.name in disabled_commands:
+                if ctx.command.name in owner_cog.disabled_by_guild.get(current_guild.id, ()):
                     raise DisabledCommandException(
                         f"{ctx.author} used disabled command")
             else:
-                for guild_id in guilds_with_disabled_command:
-                    guild = self.bot.get_guild(guild_id)
-                    if not guild:
-                        continue
-                    member = guild.get_member(ctx.author.id)
-                    if not member:
+                for guild_id, disabled_commands in owner_cog.disabled_by_guild.items():
+                    if ctx.command.name not in disabled_commands:
                         continue
-                    disabled_commands = [dc["command"] for dc in owner_cog.disabled_commands
-                                         if dc["server"] == guild.id]
-                    if ctx.command.name in disabled_commands:
+                    guild = self.bot.get_guild(guild_id)
+                    if guild and guild.get_member(ctx.author.id):
                         raise DisabledCommandException(
                             f"{ctx.author} used disabled command")
         return True
@@ -340,7 +322,7 @@ class Default(commands.Cog):
     async def check_for_black_list_user(self, ctx):
         owner_cog = self.bot.get_cog("Owner")
         if owner_cog:
-            if ctx.author.id in owner_cog.global_ignores:
+            if ctx.author.id in owner_cog.ignored_users:
                 bl_user = ctx.author
                 raise BlackListedException(f"blacklisted user: {bl_user} ({bl_user.id}) "
                                            f"tried to use command")
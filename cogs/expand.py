@@ -1,6 +1,4 @@
 from discord.ext.commands.help import Paginator
-import httpx
-import aiohttp
 import asyncio
 import discord
 import io
@@ -8,7 +6,8 @@ import json
 import logging
 import os
 import re
-from discord.ext import commands
+import time
+from discord.ext import commands, tasks
 from discord import app_commands
 from functools import partial 
 from itertools import filterfalse
@@ -19,6 +18,8 @@ from typing import Optional
 
 spoiler_regex = re.compile(r"\|\|\s?(?P<link>.+?)\s?\|\|")
 DEFAULT_FILE_LIMIT = 8388608
+REMUX_CHUNK_SIZE = 64 * 1024
+EXPORT_MAX_AGE = 60 * 60
 class SpoilerLinkConverter(commands.Converter):
     async def convert(self, ctx, argument):
         if (match := spoiler_regex.search(argument)):
@@ -37,8 +38,8 @@ class LinkExpander(commands.Cog):
         if not os.path.exists('export'):
             os.mkdir('export')
         self.bot = bot
-        self.httpx = httpx.AsyncClient()
-        self.session = aiohttp.ClientSession()
+        self.httpx = bot.http_clients.httpx
+        self.session = bot.session
         self.pixiv_headers = {
                 "Referer" : "https://pixiv.net"
                 }
@@ -61,10 +62,54 @@ class LinkExpander(commands.Cog):
         if path_streamable.exists():
             with path_streamable.open('r') as f:
                 self.streamable_auth = json.load(f)
+        self.clean_export_folder.start()
 
     async def cog_unload(self):
-        self.bot.loop.create_task(self.httpx.aclose())
-        self.bot.loop.create_task(self.session.close())
+        self.clean_export_folder.cancel()
+
+    @tasks.loop(minutes=30)
+    async def clean_export_folder(self):
+        """
+        remove leftover downloads from the export folder that are older than an hour
+        """
+        now = time.time()
+        for entry in os.scandir('export'):
+            try:
+                # downloaders can backdate the mtime (Last-Modified), the ctime still is the time of the download
+                stat = entry.stat()
+                if entry.is_file() and now - max(stat.st_mtime, stat.st_ctime) > EXPORT_MAX_AGE:
+                    os.remove(entry.path)
+            except OSError:
+                self.logger.exception(f"could not remove {entry.path} from export folder")
+
+    async def remux_video(self, url, file_limit):
+        """
+        remux a video with ffmpeg straight into memory
+        reading stops and ffmpeg gets killed as soon as the output grows past the file_limit
+        returns a tuple of (buffer, size) where buffer is None if the video was too big or ffmpeg failed
+        """
+        proc = await asyncio.create_subprocess_exec("ffmpeg", "-hide_banner", "-loglevel", "error", "-i", url,
+                                                    "-c", "copy", "-movflags", "frag_keyframe+empty_moov",
+                                                    "-f", "mp4", "pipe:1",
+                                                    stdin=asyncio.subprocess.DEVNULL,
+                                                    stdout=asyncio.subprocess.PIPE)
+        buffer = io.BytesIO()
+        size = 0
+        try:
+            while chunk := await proc.stdout.read(REMUX_CHUNK_SIZE):
+                size += len(chunk)
+                if size > file_limit:
+                    return None, size
+                buffer.write(chunk)
+            if await proc.wait() != 0:
+                self.logger.error(f"ffmpeg exited with code {proc.returncode} while remuxing {url}")
+                return None, size
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        buffer.seek(0)
+        return buffer, size
 
     @commands.command(name="pixiv", aliases=["pix", "pxv"])
     async def pixiv_expand(self, ctx, *, link : SpoilerLinkConverter):
@@ -188,19 +233,18 @@ class LinkExpander(commands.Cog):
                                 entries = [result]
                             for entry in entries:
                                 best_format = next(iter(sorted(entry.get('formats'),key=lambda v: v.get('width', 0) * v.get('height', 0), reverse=True)), None)
-                                filename = f"{entry.get('id')}.{best_format.get('ext')}"
                                 if not best_format:
                                     continue
-                                proc = await asyncio.create_subprocess_exec(f"ffmpeg", "-hide_banner", "-loglevel" , "error", "-i",  best_format.get('url'), '-c', 'copy', '-y', f'export/{filename}')
-                                result, err = await proc.communicate()
-                                file_size = os.path.getsize(filename=f'export/{filename}')
+                                filename = f"{entry.get('id')}.mp4"
                                 file_limit = DEFAULT_FILE_LIMIT
                                 if ctx.guild:
                                     file_limit = ctx.guild.filesize_limit
+                                buffer, file_size = await self.remux_video(best_format.get('url'), file_limit)
                                 if file_size > file_limit:
-                                    os.remove(f"export/{filename}")
-                                    return await ctx.send(f"The video was too big for reupload ({round(file_size/(1024 * 1024), 2)} MB)")
-                                file_list.append(discord.File(f'export/{filename}', filename=filename, spoiler=is_spoiler))
+                                    return await ctx.send(f"The video was too big for reupload (more than {round(file_limit/(1024 * 1024), 2)} MB)")
+                                if not buffer:
+                                    continue
+                                file_list.append(discord.File(buffer, filename=filename, spoiler=is_spoiler))
                         videos_extracted = True
                     else:
                         async with self.session.get(url=f"{m.get('url')}?name=orig") as img:
@@ -228,9 +272,6 @@ class LinkExpander(commands.Cog):
                 await ctx.send(embed=embed, files=file_list)
                 if ctx.guild and ctx.guild.me.guild_permissions.manage_messages:
                     await ctx.message.edit(suppress=True)
-                for file in file_list:
-                    if hasattr(file.fp, 'name'):
-                        os.remove(file.fp.name)
 
             else:
                 self.logger.error(await response.text())
@@ -277,7 +318,7 @@ class LinkExpander(commands.Cog):
                         
             )
         video_url = post_data['url']
-        with YoutubeDL({'quiet': True, 'outtmpl': 'export/%(id)s.%(ext)s'}) as ytdl:
+        with YoutubeDL({'quiet': True, 'outtmpl': 'export/%(id)s.%(ext)s', 'updatetime': False}) as ytdl:
             extract_video = partial(ytdl.extract_info, video_url, download=True)
             result = await self.bot.loop.run_in_executor(None, extract_video)
         
@@ -1,14 +1,19 @@
 from discord.ext import commands
 import discord
-import json
 import asyncio
 import re
-import os
-from aiohttp import ClientSession
+import logging
+from functools import partial
+from .utils.cache import TTLCache
 from .utils.checks import is_owner_or_moderator
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
 from .utils.paginator import FieldPages
 from typing import Union, Optional
 
+tenor_giphy_regex = re.compile(r"^https://(media\.)?(tenor|giphy)?.com/")
+nhentai_link_regex = re.compile(r"https?://nhentai\.net/g/(\d+)")
+FILTER_KEYS = ("gif_filter_channel", "gif_filter_category", "sticker_filter_channel", "sticker_filter_category")
+
 class Filter(commands.Cog):
     """
     filters messages and removes them
@@ -17,79 +22,92 @@ class Filter(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.filter_file_path = "config/tenor_giphy_filter.json"
-        self.session = ClientSession()
-        self.banned_tags = ['lolicon', 'shotacon']
-
-        if os.path.exists(self.filter_file_path):
-            with open(self.filter_file_path, "r") as filter_file:
-                try:
-                    self.settings = json.load(filter_file)
-                    self.blacklisted_channels = [self.bot.get_channel(ch_id) for ch_id in self.settings.get("gif_filter_channel")]
-                    self.blacklisted_categories = [self.bot.get_channel(ch_id) for ch_id in self.settings.get("gif_filter_category")]
-                    self.sticker_blacklist_channels = [self.bot.get_channel(ch_id) for ch_id in self.settings.get("sticker_filter_channel")]
-                    self.sticker_blacklist_categories = [self.bot.get_channel(ch_id) for ch_id in self.settings.get("sticker_filter_category")]
-                except json.JSONDecodeError:
-                    self.settings = None
-                    self.blacklisted_channels = []
-                    self.blacklisted_categories = []
+        self.session = bot.session
+        self.banned_tags = frozenset(['lolicon', 'shotacon'])
+        # gallery id -> tag names, galleries that don't exist are remembered for an hour
+        self.gallery_tags = TTLCache(ttl=24 * 3600, maxsize=4096, negative_ttl=3600)
+        self.logger = logging.getLogger("PoutyBot")
+
+        self.store = bot.settings_store
+        self.settings = self.store.load(self.filter_file_path, default=lambda: {key: [] for key in FILTER_KEYS})
+        for key in FILTER_KEYS:
+            self.settings.setdefault(key, [])
+        self.rebuild_filters(self.settings)
+        self.store.subscribe(self.filter_file_path, self.rebuild_filters)
+
+    def rebuild_filters(self, settings):
+        """
+        rebuild the id sets the message handlers check against, they are swapped in at once
+        so a handler never sees a half updated filter
+        """
+        self.filters = {key: frozenset(settings.get(key, [])) for key in FILTER_KEYS}
+
+    def is_filtered(self, channel, channel_key, category_key):
+        channel_ids = self.filters[channel_key]
+        category_ids = self.filters[category_key]
+        if not channel_ids and not category_ids:
+            return False
+        if channel.id in channel_ids or getattr(channel, "category_id", None) in category_ids:
+            return True
+        if isinstance(channel, discord.Thread):
+            parent = channel.parent
+            return channel.parent_id in channel_ids or (parent is not None and parent.category_id in category_ids)
+        return False
+
+    async def toggle_filter(self, ctx, channel, channel_key, category_key, add):
+        key = category_key if isinstance(channel, discord.CategoryChannel) else channel_key
+        ids = self.settings.setdefault(key, [])
+        if add and channel.id not in ids:
+            ids.append(channel.id)
+        elif not add and channel.id in ids:
+            ids.remove(channel.id)
         else:
-            with open(self.filter_file_path, 'w') as f:
-                self.settings = { 
-                        "gif_filter_channel": [], 
-                        "gif_filter_category": [],
-                        "sticker_filter_channel": [],
-                        "sticker_filter_category": [],
-                                }
-                json.dump(self.settings, f)
-            self.blacklisted_channels = []
-            self.blacklisted_categories = []
-            self.sticker_blacklist_channels = []
-            self.sticker_blacklist_categories = []
+            return await ctx.send("channel is already blacklisted" if add else "channel is not blacklisted")
+        self.store.changed(self.filter_file_path)
+        await ctx.send("channel added successfully" if add else "channel removed successfully")
+
+    def filter_entries(self, channel_key, category_key):
+        """resolve the stored ids to channels, ids that can't be resolved (yet) are skipped"""
+        entries = []
+        for channel_id in self.filters[channel_key]:
+            channel = self.bot.get_channel(channel_id)
+            if channel:
+                entries.append((channel.name, channel.mention))
+        for category_id in self.filters[category_key]:
+            category = self.bot.get_channel(category_id)
+            if category:
+                entries.append((category.name, ','.join(c.mention for c in category.channels) or "no channels"))
+        return entries
+
+    async def cog_load(self):
+        register_cog(self.bot, self)
 
     async def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
+        unregister_cog(self.bot, self)
+        self.store.unsubscribe(self.filter_file_path, self.rebuild_filters)
 
-    @commands.Cog.listener("on_message")
-    async def filter_stickers(self, message):
-        if not message.stickers:
-            return
-        if message.channel in self.sticker_blacklist_channels or message.channel.category in self.sticker_blacklist_categories:
-            await message.delete()
-        if isinstance(message.channel, discord.Thread):
-            parent = message.channel.parent
-            if parent in self.sticker_blacklist_channels or parent.category in self.sticker_blacklist_categories:
-                await message.delete()
-
-    @commands.Cog.listener("on_message")
-    async def tenor_message_filter(self, message: discord.Message):
-        contains_giphy_or_tenor_link_regex = re.compile("https://(media\.)?(tenor|giphy)?.com/")
-        match = contains_giphy_or_tenor_link_regex.match(message.content)
-        if not match:
-            return
-        if message.channel in self.blacklisted_channels or message.channel.category in self.blacklisted_categories:
+    @message_handler(predicate=lambda self, message: bool(message.stickers))
+    async def filter_stickers(self, message, match):
+        if self.is_filtered(message.channel, "sticker_filter_channel", "sticker_filter_category"):
             await message.delete()
-        if isinstance(message.channel, discord.Thread) and (message.channel.parent in self.blacklisted_channels
-                or message.channel.parent.category in self.blacklisted_categories):
+
+    @message_handler(tenor_giphy_regex)
+    async def tenor_message_filter(self, message: discord.Message, match):
+        if self.is_filtered(message.channel, "gif_filter_channel", "gif_filter_category"):
             await message.delete()
-    @commands.Cog.listener("on_message")
-    async def on_message(self, message):
-        contains_nhentai_link = re.compile(r"https?://nhentai\.net/g/(\d+)")
-        matches = contains_nhentai_link.findall(message.content)
-        for match in matches:
-            data = await self.call_nhentai_api(match)
-            if not data:
-                continue
-            tags = [t['name'] for t in data['tags']]
-            for tag in tags:
-                if tag not in self.banned_tags:
-                    continue
-                await message.delete()
-                await message.channel.send(f"{message.author.mention} your link was deleted because it contained"
-                                           f" a forbidden tag: {tag} (Server Rule 5)")
-                admin_cog = self.bot.get_cog("Admin")
-                if admin_cog and admin_cog.check_channel:
-                    await admin_cog.check_channel.send(f"deleted nhentai link by {message.author.mention} "
-                                                        f"because it contained a banned tag: {tag}")
+
+    @message_handler(nhentai_link_regex)
+    async def nhentai_filter(self, message, match):
+        tag = await self.find_banned_tag(nhentai_link_regex.findall(message.content))
+        if not tag:
+            return
+        await message.delete()
+        await message.channel.send(f"{message.author.mention} your link was deleted because it contained"
+                                   f" a forbidden tag: {tag} (Server Rule 5)")
+        admin_cog = self.bot.get_cog("Admin")
+        if admin_cog and admin_cog.check_channel:
+            await admin_cog.check_channel.send(f"deleted nhentai link by {message.author.mention} "
+                                                f"because it contained a banned tag: {tag}")
 
 
     @is_owner_or_moderator()
@@ -98,44 +116,21 @@ class Filter(commands.Cog):
         """
         add a channel or category to the blacklist to filter stickers
         """
-        if not self.settings:
-            return await ctx.send("settings not loaded")
-        if isinstance(channel, discord.CategoryChannel):
-            self.sticker_blacklist_categories.append(channel)
-            self.settings.get("sticker_filter_category").append(channel.id)
-        elif isinstance(channel, discord.TextChannel):
-            self.sticker_blacklist_channels.append(channel)
-            self.settings.get("sticker_filter_channel").append(channel.id)
-        with open(self.filter_file_path, "w") as f:
-            json.dump(self.settings, f)
-        await ctx.send("channel added successfully")
+        await self.toggle_filter(ctx, channel, "sticker_filter_channel", "sticker_filter_category", add=True)
 
     @sticker_filter.command(name="delete")
     async def sticker_filter_delete(self, ctx, channel: Union[discord.TextChannel, discord.CategoryChannel]):
         """
         remove a channel or category from the blacklist
         """
-        if ctx.invoked_subcommand is not None:
-            return
-        if not self.settings:
-            return await ctx.send("settings not loaded")
-        if isinstance(channel, discord.CategoryChannel):
-            self.sticker_blacklist_channels.remove(channel)
-            self.settings.get("sticker_filter_category", []).remove(channel.id)
-        elif isinstance(channel, discord.TextChannel):
-            self.sticker_blacklist_channels.remove(channel)
-            self.settings.get("sticker_filter_channel",[]).remove(channel.id)
-        with open(self.filter_file_path, "w") as f:
-            json.dump(self.settings, f)
-        await ctx.send("channel removed successfully")
+        await self.toggle_filter(ctx, channel, "sticker_filter_channel", "sticker_filter_category", add=False)
 
     @sticker_filter.command(name="list")
     async def sticker_filter_list(self, ctx):
         """
         list all channels that have a sticker blacklist
         """
-        entries = [(c.name, c.mention) for c in self.sticker_blacklist_channels]
-        entries.extend((c.name, ','.join(channel.mention for channel in c.channels)) for c in self.sticker_blacklist_categories)
+        entries = self.filter_entries("sticker_filter_channel", "sticker_filter_category")
         paginator = FieldPages(ctx, entries=entries)
         paginator.embed.title = "List of blacklisted channels"
         await paginator.paginate()
@@ -146,65 +141,58 @@ class Filter(commands.Cog):
         """
         add a channel or category to the blacklist
         """
-        if not self.settings:
-            return await ctx.send("settings not loaded")
-        if isinstance(channel, discord.CategoryChannel):
-            self.blacklisted_categories.append(channel)
-            self.settings.get("gif_filter_category").append(channel.id)
-        elif isinstance(channel, discord.TextChannel):
-            self.blacklisted_channels.append(channel)
-            self.settings.get("gif_filter_channel").append(channel.id)
-        with open(self.filter_file_path, "w") as f:
-            json.dump(self.settings, f)
-        await ctx.send("channel added successfully")
+        await self.toggle_filter(ctx, channel, "gif_filter_channel", "gif_filter_category", add=True)
 
     @tenor_filter.command(name="delete")
     async def tenor_filter_delete(self, ctx, channel: Union[discord.TextChannel, discord.CategoryChannel]):
         """
         remove a channel or category from the blacklist
         """
-        if ctx.invoked_subcommand is not None:
-            return
-        if not self.settings:
-            return await ctx.send("settings not loaded")
-        if isinstance(channel, discord.CategoryChannel):
-            self.blacklisted_categories.remove(channel)
-            self.settings.get("gif_filter_category").remove(channel.id)
-        elif isinstance(channel, discord.TextChannel):
-            self.blacklisted_channels.remove(channel)
-            self.settings.get("gif_filter_channel").remove(channel.id)
-        with open(self.filter_file_path, "w") as f:
-            json.dump(self.settings, f)
-        await ctx.send("channel removed successfully")
+        await self.toggle_filter(ctx, channel, "gif_filter_channel", "gif_filter_category", add=False)
 
     @tenor_filter.command(name="list")
     async def tenor_filter_list(self, ctx):
         """
         list all channels that have a giphy and tenor blacklist
         """
-        entries = [(c.name, c.mention) for c in self.blacklisted_channels]
-        entries.extend((c.name, ','.join(channel.mention for channel in c.channels)) for c in self.blacklisted_categories)
+        entries = self.filter_entries("gif_filter_channel", "gif_filter_category")
         paginator = FieldPages(ctx, entries=entries)
         paginator.embed.title = "List of blacklisted channels"
         await paginator.paginate()
 
     async def check_for_tags(self, message):
-        matches = re.findall(r'\b\d{1,6}\b', message)
-        for match in matches:
-            data = await self.call_nhentai_api(match)
-            if not data:
+        tag = await self.find_banned_tag(re.findall(r'\b\d{1,6}\b', message))
+        return tag is not None, tag
+
+    async def find_banned_tag(self, gallery_ids):
+        """
+        look up all galleries at once and return the first banned tag that was found or None
+        """
+        gallery_ids = list(dict.fromkeys(int(g) for g in gallery_ids))
+        results = await asyncio.gather(*(self.fetch_gallery_tags(g) for g in gallery_ids), return_exceptions=True)
+        for gallery_id, tags in zip(gallery_ids, results):
+            if isinstance(tags, Exception):
+                self.logger.warning(f"could not look up nhentai gallery {gallery_id}: {tags!r}")
                 continue
-            for tag in data['tags']:
-                if tag['name'] in self.banned_tags:
-                    return True, tag['name']
-        return False, None
+            if tags and (banned := tags & self.banned_tags):
+                return min(banned)
+        return None
+
+    async def fetch_gallery_tags(self, id: int):
+        """
+        the tag names of a gallery or None if it doesn't exist, cached
+        """
+        return await self.gallery_tags.get_or_fetch(id, partial(self.call_nhentai_api, id))
 
     async def call_nhentai_api(self, id: int):
-        
         url = f"https://nhentai.net/api/gallery/{id}"
         async with self.session.get(url) as response:
             if response.status == 200:
-                return await response.json()
+                data = await response.json()
+                return frozenset(t['name'] for t in data['tags'])
+            if response.status == 404:
+                return None
+            response.raise_for_status()
 
     @commands.Cog.listener()
     async def on_reaction_add(self, reaction, user):
@@ -229,9 +217,8 @@ class Filter(commands.Cog):
         """
         channel = ctx.message.channel
         self.allowed_channel = channel
-        with open(self.filter_file_path, 'w') as filter_file:
-            settings = {"channel_id" : channel.id}
-            json.dump(settings, filter_file)
+        self.settings["channel_id"] = channel.id
+        self.store.changed(self.filter_file_path)
         await ctx.send("channel {} setup as exception channel".format(channel.mention))
 async def setup(bot):
     await bot.add_cog(Filter(bot))
@@ -2,7 +2,6 @@ import discord
 from discord.ext import commands
 from .utils.dataIO import DataIO
 from .utils.checks import channel_only
-import aiohttp
 import asyncio
 class Suggestions(commands.Cog):
     def __init__(self, bot):
@@ -10,7 +9,7 @@ class Suggestions(commands.Cog):
         dataIO = DataIO()
         self.github_data = dataIO.load_json('github')
         self.token = self.github_data['p_access_token']
-        self.session = aiohttp.ClientSession()
+        self.session = bot.session
 
     @commands.command(name="suggest", aliases=['suggestion', "proposal"])
     @channel_only(191536772352573440, 336912585960194048, 208765039727869954, 390617633147453444)
@@ -6,6 +6,10 @@ from email.mime import base
 from pathlib import Path
 from urllib import parse
 from .utils.converters import SimpleUrlArg
+from .utils.exceptions import UpstreamUnavailable
+from .utils.imagehash import ImageHashCache, phash_bytes
+from dataclasses import dataclass
+from functools import partial
 
 import aiohttp
 import asyncio
@@ -15,11 +19,39 @@ import io
 import json
 import logging
 import mimetypes
+import re
 import sys
 import typing
 import urllib.parse
 import yt_dlp
 
+# seconds each engine gets in the combined search
+ENGINE_TIMEOUT = 20
+# similarity in percent from which a result of the engine is trusted
+CONFIDENT_SIMILARITY = {
+    "iqdb": 90,
+    "saucenao": 80,
+    "trace.moe": 92,
+}
+# largest image that gets downloaded for the search cache
+MAX_HASH_IMAGE_SIZE = 10 * 1024 * 1024
+iqdb_similarity_regex = re.compile(r"(\d+)% similarity")
+
+
+@dataclass
+class SearchResult:
+    engine: str
+    similarity: float
+    url: typing.Optional[str]
+    embed: discord.Embed
+
+
+class SauceNaoError(Exception):
+    def __init__(self, status, info):
+        self.status = status
+        self.info = info
+        super().__init__(f"saucenao responded with status code {status}")
+
 
 class SauceNaoResult:
     def __init__(self, result):
@@ -114,24 +146,19 @@ class Search(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = logging.getLogger('PoutyBot')
-        self.iqdb_session = aiohttp.ClientSession()
-        self.dans_session = aiohttp.ClientSession()
-        self.sauce_session = aiohttp.ClientSession()
-        self.tineye_session = aiohttp.ClientSession()
+        self.session = bot.session
         self.sauce_nao_settings = Path('config/sauce_nao_settings.json')
         if not self.sauce_nao_settings.exists():
             self.sauce_nao_settings.touch()
             self.sauce_nao_settings = {}
         with self.sauce_nao_settings.open('r') as f:
             self.sauce_nao_settings = json.load(f)
-        self.sauce_nao_settings['long_remaining'] = 200
-        self.sauce_nao_settings['short_remaining'] = 6
-        self.reset_time_tasks = []
-    async def _danbooru_api(self, ctx, link):
+        self.hash_cache = ImageHashCache()
+    async def _danbooru_api(self, link):
         """
         looks up information about the image on danbooru
         :param link: must be a valid danbooru link
-        :return: characters, artist, copyright (franchise)
+        :return: characters, artist, copyright (franchise) or None if danbooru responded with an error
         """
 
         # json file with api key and user name for danbooru
@@ -147,7 +174,7 @@ class Search(commands.Cog):
             api_key = data['api_key']
         auth = aiohttp.BasicAuth(user, api_key)
         characters, artist, franchise, source = None, None, None, None
-        async with self.dans_session.get('{}.json'.format(link), auth=auth) as response:
+        async with self.session.get('{}.json'.format(link), auth=auth) as response:
             if response.status == 200:
                 json_dump = await response.json()
                 if json_dump['tag_count_character'] > 0:
@@ -163,21 +190,101 @@ class Search(commands.Cog):
                     source = json_dump['source']
                 return characters, artist, franchise, source
             else:
-                await ctx.send("\n HTTP Error occured with following Status Code:{}".format(response.status))
-
-    def cog_unload(self):
-        loop = self.bot.loop or asyncio.get_event_loop()
-        loop.create_task(self.iqdb_session.close())
-        loop.create_task(self.dans_session.close())
-        loop.create_task(self.sauce_session.close())
-        loop.create_task(self.tineye_session.close())
-        for task in self.reset_time_tasks:
-            task.cancel()
-
+                self.logger.warning("danbooru lookup for {} failed with status code {}".format(link, response.status))
+                return None
 
     def _tag_to_title(self, tag):
         return tag.replace(' ', '\n').replace('_', ' ').title()
 
+    async def _build_danbooru_embed(self, url, danbooru):
+        embed = discord.Embed(colour=discord.Colour(0xa4815f), description=f"Source found via [iqdb](https://iqdb.org/?url={url})")
+        embed.set_thumbnail(url=url)
+        info = await self._danbooru_api(danbooru)
+        if info:
+            characters, artist, franchise, source_url = info
+            if characters:
+                embed.add_field(name="Character", value=characters)
+            if artist or source_url:
+                if source_url and artist:
+                    embed.add_field(name="Artist", value="[{}]({})".format(artist, source_url))
+                elif artist:
+                    embed.add_field(name="Artist", value=artist)
+                else:
+                    embed.add_field(name="Source", value=source_url)
+            if franchise:
+                embed.add_field(name="Copyright", value=franchise)
+        embed.add_field(name="Danbooru", value=danbooru)
+        return embed
+
+    async def image_hash(self, url):
+        """
+        download the image and compute its perceptual hash
+        :return: the hash or None if the link is no image that can be read
+        """
+        try:
+            async with self.session.get(url) as response:
+                if response.status != 200 or not response.content_type.startswith("image/"):
+                    return None
+                if (response.content_length or 0) > MAX_HASH_IMAGE_SIZE:
+                    return None
+                data = await response.read()
+            return await self.bot.loop.run_in_executor(None, phash_bytes, data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamUnavailable, OSError, ValueError, Image.DecompressionBombError):
+            return None
+
+    async def _cached_search(self, engine, url, image_hash, search):
+        """
+        answer the search from the hash cache if a similar image was already searched with the engine,
+        otherwise run the search and store its results
+        """
+        if image_hash is None:
+            image_hash = await self.image_hash(url)
+        if image_hash is not None:
+            results = self.hash_cache.get(engine, image_hash)
+            if results is not None:
+                return results
+        results = await search()
+        if image_hash is not None and results is not None:
+            self.hash_cache.put(engine, image_hash, results)
+        return results
+
+    async def search_iqdb(self, url, image_hash=None) -> typing.List[SearchResult]:
+        """
+        search iqdb for the image, the best danbooru match gets looked up on danbooru
+        :return: the relevant matches in the order iqdb ranks them
+        """
+        return await self._cached_search("iqdb", url, image_hash, partial(self._query_iqdb, url))
+
+    async def _query_iqdb(self, url):
+        async with self.session.post(url='https://iqdb.org', data={'url': url}, raise_for_status=True) as response:
+            soup = BeautifulSoup(await response.text(), 'html.parser')
+        pages = soup.find(id='pages')
+        # the first div only shows the uploaded image
+        match_divs = pages.find_all('div')[1:] if pages else []
+        # stop searching if no relevant match was found
+        if not match_divs or str(match_divs[0].find('th')) == '<th>No relevant matches</th>':
+            return []
+        results = []
+        danbooru_found = False
+        for match in match_divs:
+            link = match.select_one('a')
+            if not link:
+                continue
+            source = link.attrs['href']
+            if source.startswith('//'):
+                source = 'https:' + source
+            similarity = iqdb_similarity_regex.search(match.get_text())
+            similarity = float(similarity.group(1)) if similarity else 0.0
+            if 'danbooru.donmai.us' in source and not danbooru_found:
+                danbooru_found = True
+                embed = await self._build_danbooru_embed(url, source)
+            else:
+                embed = discord.Embed(colour=discord.Colour(0xa4815f), title="IQDB match", url=source,
+                                      description=f"Source found via [iqdb](https://iqdb.org/?url={url})")
+                embed.set_thumbnail(url=url)
+            results.append(SearchResult("iqdb", similarity, source, embed))
+        return results
+
     @commands.command()
     async def iqdb(self, ctx, link=None):
         """Search IQDB for source of an image on danbooru
@@ -198,54 +305,61 @@ class Search(commands.Cog):
             else:
                 url = file[0].url
             url = url.strip("<>|")
-            async with self.iqdb_session.post(url='https://iqdb.org', data={'url': url}) as response:
-                if response.status == 200:
-                    soup = BeautifulSoup(await response.text(), 'html.parser')
-                    # This is for the no relevant matches case
-                    pages_div = soup.find(id='pages').find_all('div')[1]
-                    # stop searching if no relevant match was found
-                    if str(pages_div.find('th')) == '<th>No relevant matches</th>':
-                        await ctx.send('No relevant Match was found')
-                        return
-
-                    matches = soup.find(id='pages')
-                    best_match = matches.select('a')[0].attrs['href']
-                    danbooru_found = False
-                    for match in matches.select('a'):
-                        source = match.attrs['href']
-                        if source.startswith('//danbooru.donmai.us') and not danbooru_found:
-                            danbooru_found = True
-                            danbooru = 'http:'+source
-                            characters, artist, franchise, source_url = await self._danbooru_api(ctx, danbooru)
-                            embed = discord.Embed(colour=discord.Colour(0xa4815f), description=f"Source found via [iqdb](https://iqdb.org/?url={url})")
-
-                            embed.set_thumbnail(url=url)
-
-                            if characters:
-                                embed.add_field(name="Character", value=characters)
-                            if artist or source_url:
-                                if source_url and artist:
-                                    embed.add_field(name="Artist", value="[{}]({})".format(artist, source_url))
-                                elif artist:
-                                    embed.add_field(name="Artist", value=artist)
-                                else:
-                                    embed.add_field(name="Source", value=source_url)
-
-                            if franchise:
-                                embed.add_field(name="Copyright", value=franchise)
-                            embed.add_field(name="Danbooru", value=danbooru)
-
-                            await ctx.send(embed=embed)
-                    if not danbooru_found:
-                        await ctx.send('<{}>'.format(best_match))
-
-    async def reset_long_limit(self):
-        await asyncio.sleep(86400)
-        self.sauce_nao_settings["long_remaining"] = 200
-
-    async def reset_short_limit(self):
-        await asyncio.sleep(30)
-        self.sauce_nao_settings["short_remaining"] = 6
+            results = await self.search_iqdb(url)
+            if not results:
+                await ctx.send('No relevant Match was found')
+                return
+            danbooru = next((r for r in results if 'danbooru.donmai.us' in r.url), None)
+            if danbooru:
+                await ctx.send(embed=danbooru.embed)
+            else:
+                await ctx.send('<{}>'.format(results[0].url))
+
+    async def search_saucenao(self, url, similarity=80, image_hash=None) -> typing.List[SearchResult]:
+        """
+        search saucenao for the image
+        :return: all results over the similarity threshold, best first
+        :raises SauceNaoError: if saucenao responded with an error
+        """
+        results = await self._cached_search("saucenao", url, image_hash, partial(self._query_saucenao, url))
+        return [r for r in results if r.similarity >= float(similarity)]
+
+    async def _query_saucenao(self, url):
+        saucenao_url = 'https://saucenao.com/search.php'
+        search_url = '{}?url={}'.format(saucenao_url,url)
+        params = {
+                'url': url,
+                'output_type': 2,
+                'api_key': self.sauce_nao_settings.get('api_key'),
+                'hide': 2
+                }
+        async with self.session.get(url=saucenao_url, params=params) as response:
+            if response.status != 200:
+                raise SauceNaoError(response.status, await response.json(content_type=None))
+            resp = await response.json()
+        header = resp['header']
+        # saucenao reports its quotas in the response body instead of headers
+        limiter = self.bot.http_clients.limiter
+        limiter.update_quota("saucenao.com", header['short_remaining'], 30, bucket_index=0)
+        limiter.update_quota("saucenao.com", header['long_remaining'], 86400, bucket_index=1)
+        results = []
+        for result in resp.get('results', []):
+            sn_result = SauceNaoResult(result)
+            embed = discord.Embed(title=sn_result.title, description=f"Source found via [saucenao]({search_url})")
+            if sn_result.source_url and sn_result.source_url[0].startswith(("http:", "https:")):
+                embed.url = sn_result.source_url[0]
+            if sn_result.thumbnail:
+                embed.set_thumbnail(url=sn_result.thumbnail)
+            if sn_result.is_anime:
+                embed.add_field(name="Episode", value=sn_result.get('episode'))
+                embed.add_field(name="Est. Time", value=sn_result.get('est_time'))
+                embed.add_field(name="Year", value=sn_result.get('year'))
+            if sn_result.is_manga:
+                embed.add_field(name="Chapter", value=sn_result.get('chapter'))
+                embed.add_field(name="Author", value=sn_result.get('author'))
+                embed.add_field(name="Artist", value=sn_result.get('artist'))
+            results.append(SearchResult("saucenao", sn_result.similarity, embed.url or None, embed))
+        return results
 
     @commands.command(aliases=["source","saucenao"])
     async def sauce(self, ctx, link: typing.Optional[SimpleUrlArg], similarity=80):
@@ -259,10 +373,6 @@ class Search(commands.Cog):
             link = self.get_referenced_message_image(ctx)
         if link is None and not file:
             await ctx.send('Message didn\'t contain Image')
-        if self.sauce_nao_settings.get("short_remaining") == 0:
-            return await ctx.send("Ratelimit reached. Please wait 30 seconds before doing another search")
-        if self.sauce_nao_settings.get("long_remaining") == 0:
-            return await ctx.send("No more searches available for today. Please wait 24 hours before doing another search")
         else:
             try:
                 await ctx.typing()
@@ -274,55 +384,93 @@ class Search(commands.Cog):
             else:
                 url = link
             url = url.strip("<>|")
-            saucenao_url = 'https://saucenao.com/search.php'
-            search_url = '{}?url={}'.format(saucenao_url,url)
-            params = {
-                    'url': url,
-                    'output_type': 2,
-                    'api_key': self.sauce_nao_settings.get('api_key'),
-                    'hide': 2
-                    }
-            async with self.sauce_session.get(url=saucenao_url, params=params) as response:
-                source = None
-                if response.status == 200:
-                    resp = await response.json()
-                    header = resp['header']
-                    results = resp['results']
-                    self.sauce_nao_settings['short_remaining'] = header['short_remaining']
-                    self.sauce_nao_settings['long_remaining'] = header['long_remaining']
-                    if self.sauce_nao_settings.get("short_remaining") == 0:
-                        self.reset_time_tasks.append(self.bot.loop.create_task(self.reset_short_limit()))
-                    if self.sauce_nao_settings.get("long_remaining") == 0:
-                        self.reset_time_tasks.append(self.bot.loop.create_task(self.reset_long_limit()))
-                    for result in results:
-                        if float(similarity) > float(result['header']['similarity']):
-                            break
-                        else:
-                            sn_result = SauceNaoResult(result)
-                            embed = discord.Embed(title=sn_result.title, description=f"Source found via [saucenao]({search_url})")
-                            if sn_result.source_url and sn_result.source_url[0].startswith(("http:", "https:")):
-                                embed.url = sn_result.source_url[0]
-                            if sn_result.thumbnail:
-                                embed.set_thumbnail(url=sn_result.thumbnail)
-                            if sn_result.is_anime:
-                                embed.add_field(name="Episode", value=sn_result.get('episode'))
-                                embed.add_field(name="Est. Time", value=sn_result.get('est_time'))
-                                embed.add_field(name="Year", value=sn_result.get('year'))
-                            if sn_result.is_manga:
-                                embed.add_field(name="Chapter", value=sn_result.get('chapter'))
-                                embed.add_field(name="Author", value=sn_result.get('author'))
-                                embed.add_field(name="Artist", value=sn_result.get('artist'))
-                            return await ctx.send(embed=embed)
-                    if source is None:
-                        await ctx.send('No source over the similarity threshold')
-                else:
-                    info = await response.json()
-                    paginator = commands.Paginator()
-                    paginator.add_line(f"Error when calling saucenao (HTTP STATUS: {response.status}):", empty=True)
-                    for line in json.dumps(info, indent=4).splitlines():
-                        paginator.add_line(line)
-                    for page in paginator.pages:
-                        await ctx.send(page)
+            try:
+                results = await self.search_saucenao(url, similarity)
+            except SauceNaoError as e:
+                paginator = commands.Paginator()
+                paginator.add_line(f"Error when calling saucenao (HTTP STATUS: {e.status}):", empty=True)
+                for line in json.dumps(e.info, indent=4).splitlines():
+                    paginator.add_line(line)
+                for page in paginator.pages:
+                    await ctx.send(page)
+                return
+            if results:
+                await ctx.send(embed=results[0].embed)
+            else:
+                await ctx.send('No source over the similarity threshold')
+
+    async def _run_engine(self, name, search):
+        try:
+            return await asyncio.wait_for(search, timeout=ENGINE_TIMEOUT) or []
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError, SauceNaoError, UpstreamUnavailable) as e:
+            self.logger.warning(f"{name} search failed: {e!r}")
+            return []
+        except Exception:
+            # e.g. a changed response format, the other engines still count
+            self.logger.exception(f"{name} search failed")
+            return []
+
+    @commands.command(name="reverse", aliases=["revsearch", "allsauce"])
+    async def reverse_search(self, ctx, link: typing.Optional[SimpleUrlArg]):
+        """
+        search iqdb, saucenao and trace.moe at the same time
+        the first confident match gets posted right away and is
+        replaced with the best ranked match once every search finished
+        usage:   .reverse <image-link> or
+                 .reverse on image upload comment
+        """
+        if not link and not ctx.message.attachments:
+            link = self.get_referenced_message_image(ctx)
+        if link is None and not ctx.message.attachments:
+            return await ctx.send('Message didn\'t contain Image')
+        url = link if link is not None else ctx.message.attachments[0].url
+        url = url.strip("<>|")
+        message = None
+        results = []
+        async with ctx.typing():
+            image_hash = await self.image_hash(url)
+            searches = [
+                asyncio.ensure_future(self._run_engine("iqdb", self.search_iqdb(url, image_hash=image_hash))),
+                asyncio.ensure_future(self._run_engine("saucenao", self.search_saucenao(url, similarity=50, image_hash=image_hash))),
+                asyncio.ensure_future(self._run_engine("trace.moe", self.search_trace_moe(url, similarity=50, image_hash=image_hash))),
+            ]
+            try:
+                for search in asyncio.as_completed(searches):
+                    results.extend(await search)
+                    if message:
+                        continue
+                    confident = [r for r in results if r.similarity >= CONFIDENT_SIMILARITY[r.engine]]
+                    if confident:
+                        message = await ctx.send(embed=max(confident, key=lambda r: r.similarity).embed)
+            finally:
+                # the command failed or was cancelled, the remaining searches aren't needed anymore
+                for search in searches:
+                    search.cancel()
+        if not results:
+            return await ctx.send('No source found')
+        ranked = sorted(results, key=lambda r: (r.similarity >= CONFIDENT_SIMILARITY[r.engine], r.similarity), reverse=True)
+        best = ranked[0]
+        embed = best.embed.copy()
+        embed.set_footer(text=f"Best match via {best.engine} ({best.similarity:.1f}%) out of {len(ranked)} results")
+        others = [f"{r.engine} ({r.similarity:.1f}%): {r.url}" for r in ranked[1:6] if r.url]
+        if others:
+            embed.add_field(name="Other matches", value="\n".join(others)[:1024], inline=False)
+        if message:
+            await message.edit(embed=embed)
+        else:
+            await ctx.send(embed=embed)
+
+    @commands.command(name="search_cache")
+    async def search_cache_stats(self, ctx):
+        """show how many reverse image searches were answered from the cache"""
+        cache = self.hash_cache
+        embed = discord.Embed(title="Reverse image search cache",
+                              description=f"{len(cache.entries)} images cached, "
+                                          f"{cache.hit_rate():.1%} hit rate overall")
+        for engine in sorted(set(cache.hits) | set(cache.misses)):
+            embed.add_field(name=engine, value=f"{cache.hits[engine]} hits / {cache.misses[engine]} misses "
+                                                f"({cache.hit_rate(engine):.1%})")
+        await ctx.send(embed=embed)
 
     @commands.command()
     async def yt_version(self, ctx):
@@ -402,31 +550,50 @@ class Search(commands.Cog):
             return
         image_link = link if link is not None else ctx.message.attachments[0].url
         image_link = image_link.strip("<>|")
-        image = await TraceMoe.get_frame(image_link, self.sauce_session)
-        if image:
-            request_data = {"image": image}
-            async with self.sauce_session.post(data=request_data, url="https://api.trace.moe/search", raise_for_status=True) as resp:
-                if resp.status == 200:
-                    resp_json = await resp.json()
-                    sorted_found = sorted(resp_json["result"], key=lambda d: d['similarity'], reverse=True)
-                    first_result = sorted_found[0]
-                    threshold = similarity / 100
-                    if first_result["similarity"] >= threshold:
-                        embed = await self.build_embed_for_trace_moe(first_result)
-                        await ctx.send(embed=embed)
-                    else:
-                        await ctx.send("Nothing found, refer to the FAQ to see what the cause could be:\n"
-                                       "https://trace.moe/faq")
-                elif resp.status == 429:
-                    await ctx.send(await resp.read())
-                elif resp.status == 413:
-                    await ctx.send("Image too big please scale it down")
-                if resp.status == 500 or resp.status == 503:
-                    await ctx.send("Internal server error at trace.moe")
-        else:
+        try:
+            results = await self.search_trace_moe(image_link, similarity)
+        except aiohttp.ClientResponseError as e:
+            if e.status == 429:
+                await ctx.send("Too many requests to trace.moe, please try again later")
+            elif e.status == 413:
+                await ctx.send("Image too big please scale it down")
+            elif e.status == 500 or e.status == 503:
+                await ctx.send("Internal server error at trace.moe")
+            else:
+                raise
+            return
+        if results is None:
             await ctx.send("Could not detect filetype, be sure to use actual media files"
                            "\n(for imgur please use the .gif instead of gifv)")
+        elif results:
+            await ctx.send(embed=results[0].embed)
+        else:
+            await ctx.send("Nothing found, refer to the FAQ to see what the cause could be:\n"
+                           "https://trace.moe/faq")
+
+    async def search_trace_moe(self, url, similarity=85, image_hash=None) -> typing.Optional[typing.List[SearchResult]]:
+        """
+        search trace.moe for the anime scene of the image
+        :return: the best result if it is over the similarity threshold or None if the link is no image
+        """
+        results = await self._cached_search("trace.moe", url, image_hash, partial(self._query_trace_moe, url))
+        if results is None:
+            return None
+        return [r for r in results if r.similarity >= similarity]
 
+    async def _query_trace_moe(self, url):
+        image = await TraceMoe.get_frame(url, self.session)
+        if not image:
+            return None
+        request_data = {"image": image}
+        async with self.session.post(data=request_data, url="https://api.trace.moe/search", raise_for_status=True) as resp:
+            resp_json = await resp.json()
+        sorted_found = sorted(resp_json["result"], key=lambda d: d['similarity'], reverse=True)
+        if not sorted_found:
+            return []
+        first_result = sorted_found[0]
+        embed = await self.build_embed_for_trace_moe(first_result)
+        return [SearchResult("trace.moe", first_result["similarity"] * 100, embed.url or None, embed)]
 
     @trace_moe.error
     async def trace_error(self, ctx, error):
@@ -439,10 +606,9 @@ class Search(commands.Cog):
         anilist_url = None
         title = None
         data = None
-        print(first_result)
         if first_result.get('anilist'):
             anilist_url = f"https://anilist.co/anime/{first_result.get('anilist')}"
-            async with self.sauce_session.post(url="https://graphql.anilist.co", json={"query": TraceMoe.anilist_query, "variables": {'id': first_result.get('anilist')}}) as resp:
+            async with self.session.post(url="https://graphql.anilist.co", json={"query": TraceMoe.anilist_query, "variables": {'id': first_result.get('anilist')}}) as resp:
                 if resp.status < 400:
                     anilist_data = await resp.json()
                     data = anilist_data.get("data")
@@ -10,7 +10,6 @@ from typing import List, Optional, Dict
 from textwrap import shorten
 import datetime
 import uuid
-import asyncio
 
 @dataclass
 class Manga:
@@ -60,13 +59,9 @@ class Mangadex(commands.Cog):
         self.bot = bot
         self.api_url = "https://api.mangadex.org"
         self.mangadex_url = re.compile(r"https?://mangadex.org/(?P<type>title|chapter)/(?P<id>[a-f0-9A-F]{8}-(?:[a-f0-9A-F]{4}-){3}[a-f0-9A-F]{12})")
-        self.rate_limit = app_commands.Cooldown(rate=5, per=1)
 
     async def search_for_title(self, title) -> List[Manga]:
         params = {"title": title, "limit": 5 , "order[relevance]": 'desc'}
-        wait = self.rate_limit.update_rate_limit()
-        if wait:
-            await asyncio.sleep(wait)
         async with self.bot.session.get(self.api_url+f"/manga", params=params) as resp:
             resp.raise_for_status()
             response = await resp.json()
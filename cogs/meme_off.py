@@ -3,7 +3,6 @@ from discord.ext import commands
 from discord.utils import get
 from .utils import checks, paginator
 import asyncio
-import aiohttp
 import io
 import typing
 from datetime import datetime, timedelta
@@ -51,7 +50,7 @@ class MemeOff(commands.Cog):
         if not hasattr(self.bot, 'pinned_template'):
             self.bot.pinned_template = None
             self.bot.pinned_by = None
-        self.session = aiohttp.ClientSession()
+        self.session = bot.session
 
     
     async def cog_load(self):
@@ -76,9 +75,6 @@ class MemeOff(commands.Cog):
                 template_submission.add_template(template['link'])
             self.bot.submitted_templates[user] = template_submission
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
-
     @commands.group(name="meme-off", aliases=["meme_off", "memeoff", "mo"])
     @checks.channel_only("memeoff")
     async def meme_off(self, ctx):
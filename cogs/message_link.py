@@ -2,6 +2,15 @@ import discord
 import re
 from textwrap import shorten
 from discord.ext import commands
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
+
+id_regex = re.compile(
+    r'^(?:(?P<channel_id>[0-9]{15,20})-)?(?P<message_id>[0-9]{15,20})$')
+link_regex = re.compile(
+    r'^https?://(?:(ptb|canary|www)\.)?discord(?:app)?\.com/channels/'
+    r'(?P<guild_id>[0-9]{15,20}|@me)'
+    r'/(?P<channel_id>[0-9]{15,20})/(?P<message_id>[0-9]{15,20})/?$'
+)
 
 
 class JumpView(discord.ui.View):
@@ -66,24 +75,16 @@ class MessageLink(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
 
-    @commands.Cog.listener('on_message')
-    async def link_message(self, message: discord.Message):
+    async def cog_load(self):
+        register_cog(self.bot, self)
+
+    async def cog_unload(self):
+        unregister_cog(self.bot, self)
+
+    # Only dispatched if the message sent is a link to a discord message.
+    @message_handler(link_regex, id_regex, predicate=lambda self, message: message.author != self.bot.user)
+    async def link_message(self, message: discord.Message, match):
         """Command for embedding a linked message."""
-        if message.author == self.bot.user:
-            return
-        # Checking if the message sent is a link to a discord message.
-        id_regex = re.compile(
-            r'(?:(?P<channel_id>[0-9]{15,20})-)?(?P<message_id>[0-9]{15,20})$')
-        link_regex = re.compile(
-            r'https?://(?:(ptb|canary|www)\.)?discord(?:app)?\.com/channels/'
-            r'(?P<guild_id>[0-9]{15,20}|@me)'
-            r'/(?P<channel_id>[0-9]{15,20})/(?P<message_id>[0-9]{15,20})/?$'
-        )
-        match = link_regex.match(
-            message.content) or id_regex.match(message.content)
-        # If it's not a message link, we simply return.
-        if not match:
-            return
         # Parsing out the channel ID and message ID from the regular expression.
         data = match.groupdict()
         channel_id, message_id = int(data['channel_id']), int(data['message_id'])
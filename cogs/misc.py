@@ -11,7 +11,6 @@ import asyncio
 import unicodedata
 from functools import partial
 from itertools import filterfalse
-import aiohttp
 
 from datetime import datetime, timedelta, timezone
 from .utils import paginator
@@ -469,7 +468,7 @@ class SCP(commands.Cog):
     """
     def __init__(self, bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
+        self.session = bot.session
 
     @commands.group(invoke_without_command=True)
     async def scp(self, ctx, number):
@@ -505,11 +504,6 @@ class SCP(commands.Cog):
 
 
 
-
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
-
-
 async def setup(bot):
     global logger
     check_folders()
@@ -3,8 +3,8 @@ from discord.ext import commands
 from discord import User
 import discord
 from .utils import checks, views
+from .utils.permissions import permissions
 import traceback
-import json
 import subprocess
 import os
 import asyncio
@@ -17,22 +17,29 @@ from pathlib import Path
 class Owner(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        if os.path.exists("data/ignores.json"):
-            with open("data/ignores.json") as f:
-                self.global_ignores = json.load(f)
-        else:
-            self.global_ignores = []
-        if os.path.exists("data/disabled_commands.json"):
-            with open('data/disabled_commands.json') as f:
-                self.disabled_commands = json.load(f)
-        else:
-            self.disabled_commands = []
+        self.store = bot.settings_store
+        self.ignores_file = 'data/ignores.json'
         self.disabled_commands_file = 'data/disabled_commands.json'
+        self.global_ignores = self.store.load(self.ignores_file, default=list)
+        self.disabled_commands = self.store.load(self.disabled_commands_file, default=list)
+        self.rebuild_ignores(self.global_ignores)
+        self.store.subscribe(self.ignores_file, self.rebuild_ignores)
         self.confirmation_reacts = [
             '\N{WHITE HEAVY CHECK MARK}', '\N{CROSS MARK}'
         ]
         self.last_module: Optional[str] = None
 
+    async def cog_unload(self):
+        self.store.unsubscribe(self.ignores_file, self.rebuild_ignores)
+
+    def rebuild_ignores(self, global_ignores):
+        self.ignored_users = frozenset(global_ignores)
+
+    @property
+    def disabled_by_guild(self):
+        """guild id -> frozenset of disabled command names, rebuilt by the permission context on every change"""
+        return permissions.disabled_commands
+
     def reload_submodules(self, module, prefix='cogs.'):
         module_self = sys.modules.get(prefix + module)
         members = inspect.getmembers(module_self)
@@ -166,6 +173,36 @@ class Owner(commands.Cog):
         await ctx.send('Shutting down...')
         await self.bot.close()
 
+    @commands.command(name='http_stats', hidden=True)
+    @checks.is_owner()
+    async def http_stats(self, ctx):
+        """Show request metrics per host for the shared http clients"""
+        metrics = sorted(self.bot.http_clients.metrics.items(), key=lambda m: m[1].requests, reverse=True)
+        if not metrics:
+            return await ctx.send("No requests made yet")
+        paginator = commands.Paginator()
+        for host, stats in metrics:
+            paginator.add_line(f"{host}: {stats.requests} requests, {stats.errors} errors, "
+                               f"avg {stats.average_time * 1000:.0f}ms")
+        for page in paginator.pages:
+            await ctx.send(page)
+
+    @commands.command(name='pipeline_stats', hidden=True)
+    @checks.is_owner()
+    async def pipeline_stats(self, ctx):
+        """Show timings of the on_message pipeline and its handlers"""
+        pipeline = getattr(self.bot, 'message_pipeline', None)
+        if not pipeline:
+            return await ctx.send("No message handlers registered")
+        paginator = commands.Paginator()
+        scan = pipeline.scan_timings
+        paginator.add_line(f"scan: {scan.calls} messages, avg {scan.average_time * 1e6:.0f}µs")
+        for handler in pipeline.handlers:
+            timings = pipeline.handler_timings[handler.name]
+            paginator.add_line(f"{handler.name}: {timings.calls} calls, avg {timings.average_time * 1000:.1f}ms")
+        for page in paginator.pages:
+            await ctx.send(page)
+
     @commands.group(pass_context=True, aliases=['bl'])
     @checks.is_owner_or_moderator()
     async def blacklist(self, ctx):
@@ -269,10 +306,9 @@ class Owner(commands.Cog):
         if ctx.message.author.id == user.id:
             await ctx.send("Don't blacklist yourself, dummy")
             return
-        if user.id not in self.global_ignores:
+        if user.id not in self.ignored_users:
             self.global_ignores.append(user.id)
-            with open("data/ignores.json", "w") as f:
-                json.dump(self.global_ignores,f)
+            self.store.changed(self.ignores_file)
             await ctx.send('User {} has been blacklisted'.format(user.name))
         else:
             await ctx.send("User {} already is blacklisted".format(user.name))
@@ -280,10 +316,9 @@ class Owner(commands.Cog):
 
     @blacklist.command(name="remove")
     async def _blacklist_remove(self, ctx, user:User):
-        if user.id in self.global_ignores:
+        if user.id in self.ignored_users:
             self.global_ignores.remove(user.id)
-            with open("data/ignores.json", "w") as f:
-                json.dump(self.global_ignores, f)
+            self.store.changed(self.ignores_file)
             await ctx.send("User {} has been removed from blacklist".format(user.name))
         else:
             await ctx.send("User {} is not blacklisted".format(user.name))
@@ -297,17 +332,19 @@ class Owner(commands.Cog):
     @_commands.command(name='disable', pass_context=True)
     async def _commands_disable(self, ctx, command:str ):
         server = ctx.message.guild
+        if command in self.disabled_by_guild.get(server.id, ()):
+            return await ctx.send("command {} is already disabled".format(command))
         self.disabled_commands.append({"server": server.id, "command": command})
-        with open(self.disabled_commands_file, 'w') as f:
-            json.dump(self.disabled_commands, f)
+        self.store.changed(self.disabled_commands_file)
         await ctx.send("command {} disabled".format(command))
 
     @_commands.command(name='enable', pass_context=True)
     async def _commands_enable(self, ctx, command:str ):
         server = ctx.message.guild
+        if command not in self.disabled_by_guild.get(server.id, ()):
+            return await ctx.send("command {} is not disabled".format(command))
         self.disabled_commands.remove({"server": server.id, "command": command})
-        with open(self.disabled_commands_file, 'w') as f:
-            json.dump(self.disabled_commands, f)
+        self.store.changed(self.disabled_commands_file)
         await ctx.send("command {} enabled".format(command))
 
 async def setup(bot):
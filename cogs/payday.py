@@ -3,32 +3,58 @@ import random
 import asyncio
 from discord.ext import commands
 from .utils import checks, paginator, views
+from .utils.cache import TTLCache
+from .utils.ledger import Ledger
 from typing import Optional, TypedDict
 from datetime import datetime, timedelta, timezone
 from discord.ext import menus
-from asyncpg import Record
 from dataclasses import dataclass
 
-class LeaderBoardSource(menus.ListPageSource):
-    def __init__(self, data):
-        super().__init__(data, per_page=10)
+LEADERBOARD_PAGE_SIZE = 10
 
-    async def format_page(self, menu, entries : Record):
-        offset = menu.current_page * self.per_page
+
+class LeaderBoardSource(menus.PageSource):
+    """
+    fetches the leaderboard one page at a time, pages after one that was already shown
+    continue from its last row (keyset pagination), other pages fall back to an offset
+    """
+
+    def __init__(self, payday, total, per_page=LEADERBOARD_PAGE_SIZE):
+        self.payday = payday
+        self.per_page = per_page
+        self.total = total
+        # page number -> (money, user_id) of the last row of that page
+        self.cursors = {}
+
+    def is_paginating(self):
+        return self.total > self.per_page
+
+    def get_max_pages(self):
+        return max(1, -(-self.total // self.per_page))
+
+    async def get_page(self, page_number):
+        cursor = self.cursors.get(page_number - 1)
+        if page_number == 0:
+            rows = await self.payday.fetch_leaderboard_page(self.per_page)
+        elif cursor:
+            rows = await self.payday.fetch_leaderboard_page(self.per_page, after=cursor)
+        else:
+            rows = await self.payday.fetch_leaderboard_page(self.per_page, offset=page_number * self.per_page)
+        if rows:
+            last = rows[-1]
+            self.cursors[page_number] = (last['money'], last['user_id'])
+        return page_number, rows
+
+    async def format_page(self, menu, page):
+        page_number, entries = page
+        offset = page_number * self.per_page
         embed = discord.Embed(title="Leaderboards", colour=discord.Colour.blurple())
         for idx,entry in enumerate(entries, start=offset):
-            user = await self.get_user(entry.get('user_id'), menu.context)
-            embed.add_field(name=f"{idx+1}. {user.display_name}", value=f"{entry.get('money'):,}", inline=False)
+            name = await self.payday.get_display_name(entry.get('user_id'), menu.context.guild)
+            embed.add_field(name=f"{idx+1}. {name}", value=f"{entry.get('money'):,}", inline=False)
+        embed.set_footer(text=f"Page {page_number + 1}/{self.get_max_pages()}")
         return embed
 
-    async def get_user(self, user_id, ctx):
-        user = ctx.guild.get_member(user_id)
-        if not user:
-            user = ctx.bot.get_user(user_id)
-        if not user:
-            user = await ctx.bot.fetch_user(user_id)
-        return user
-
 
 @dataclass
 class PaydayReward:
@@ -85,6 +111,9 @@ class Payday(commands.Cog):
         self.salary = 150
         self.bonus_chance = {}
         self.multiplicator = {}
+        self.ledger = Ledger(bot.db)
+        # names of users that left the guild, so they aren't fetched again on every page
+        self.display_names = TTLCache(ttl=3600, maxsize=2048)
 
     async def cog_load(self):
         self.bot.loop.create_task(self.setup_payday_table())
@@ -94,54 +123,78 @@ class Payday(commands.Cog):
                  "money BIGINT)")
 
         await self.bot.db.execute(query)
+        await self.bot.db.execute("CREATE INDEX IF NOT EXISTS payday_money_idx ON payday (money, user_id)")
 
     async def fetch_money(self, user_id):
-        async with self.bot.db.acquire() as connection:
-            query = ("SELECT money from payday WHERE user_id = $1")
-            statement = await connection.prepare(query)
-            async with connection.transaction():
-                return await statement.fetchrow(user_id)
+        return await self.bot.db.fetchrow("SELECT money from payday WHERE user_id = $1", user_id)
 
     async def insert_new_user(self, user_id, start_amount):
-        async with self.bot.db.acquire() as connection:
-            query = ("INSERT INTO payday VALUES ($1, $2)")
-            statement = await connection.prepare(query)
-            async with connection.transaction():
-                return await statement.fetch(user_id, start_amount)
-
+        await self.bot.db.execute("INSERT INTO payday VALUES ($1, $2) ON CONFLICT (user_id) DO NOTHING",
+                                  user_id, start_amount)
 
     async def subtract_money(self, user_id, amount):
-        async with self.bot.db.acquire() as connection:
-            if amount < 0:
-                raise commands.CommandError("No negative amounts allowed")
-            get_money = ("SELECT money from payday WHERE user_id = $1")
-            set_money = ("UPDATE payday SET money = $2 WHERE user_id = $1 "
-                         "RETURNING money")
-            statement_get = await connection.prepare(get_money)
-            statement_set = await connection.prepare(set_money)
-            async with connection.transaction():
-                money = await statement_get.fetchval(user_id)
-                money -= amount
-                if money < 0:
-                    raise commands.CommandError("Sorry you don't have enough money for this transfer")
-                return await statement_set.fetchval(user_id, money)
+        if amount < 0:
+            raise commands.CommandError("No negative amounts allowed")
+        return await self.ledger.adjust(user_id, -amount)
 
     async def add_money(self, user_id, amount):
-        async with self.bot.db.acquire() as connection:
-            get_money = ("SELECT money from payday WHERE user_id = $1")
-            set_money = ("UPDATE payday SET money = $2 WHERE user_id = $1 "
-                         "RETURNING money")
-            statement_get = await connection.prepare(get_money)
-            statement_set = await connection.prepare(set_money)
-            async with connection.transaction():
-                money = await statement_get.fetchval(user_id)
-                money += amount
-                new_amount = await statement_set.fetchval(user_id, money)
-                return new_amount
+        return await self.ledger.adjust(user_id, amount)
+
+    async def transfer(self, changes):
+        """
+        apply {user_id: amount} to several accounts at once, either all of them change or none
+        returns the new balances
+        """
+        return await self.ledger.transfer(changes)
  
 
-    async def get_leaderboards(self):
-        return await self.bot.db.fetch("SELECT * from payday order by money desc")
+    async def count_accounts(self):
+        return await self.bot.db.fetchval("SELECT count(*) FROM payday")
+
+    async def fetch_leaderboard_page(self, limit, after=None, offset=0):
+        """
+        one page of the leaderboard ordered by money, `after` is the (money, user_id)
+        of the last row of the previous page which lets the index skip straight to this page
+        """
+        if after:
+            return await self.bot.db.fetch("""
+                SELECT user_id, money FROM payday
+                WHERE (money, user_id) < ($1, $2)
+                ORDER BY money DESC, user_id DESC
+                LIMIT $3
+            """, after[0], after[1], limit)
+        return await self.bot.db.fetch("""
+            SELECT user_id, money FROM payday
+            ORDER BY money DESC, user_id DESC
+            LIMIT $1 OFFSET $2
+        """, limit, offset)
+
+    async def fetch_rank(self, user_id):
+        """
+        rank and money of a user, the rank is the number of accounts with more money
+        counted on the money index (ties share a rank like RANK() would)
+        """
+        return await self.bot.db.fetchrow("""
+            SELECT (SELECT count(*) + 1 FROM payday WHERE money > account.money) AS rank, account.money
+            FROM payday account
+            WHERE account.user_id = $1
+        """, user_id)
+
+    async def get_display_name(self, user_id, guild=None):
+        member = guild.get_member(user_id) if guild else None
+        if member:
+            return member.display_name
+        user = self.bot.get_user(user_id)
+        if user:
+            return user.display_name
+        return await self.display_names.get_or_fetch(user_id, lambda: self._fetch_display_name(user_id))
+
+    async def _fetch_display_name(self, user_id):
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            return "Deleted User"
+        return user.display_name
 
     
     def get_bonus(self, user):
@@ -214,12 +267,13 @@ class Payday(commands.Cog):
         """send money to someone"""
         if amount <= 0:
             return await ctx.send("invalid amount please only transfer more than 0.")
-        entry = await self.fetch_money(receiver.id)
-        if not entry:
-            await self.insert_new_user(receiver.id, self.start_amount)
         spender = ctx.author
-        spender_money = await self.subtract_money(spender.id, amount)
-        receiver_money = await self.add_money(receiver.id, amount)
+        if receiver == spender:
+            return await ctx.send("you can't transfer money to yourself.")
+        await self.insert_new_user(receiver.id, self.start_amount)
+        balances = await self.transfer({spender.id: -amount, receiver.id: amount})
+        spender_money = balances[spender.id]
+        receiver_money = balances[receiver.id]
 
         if ctx.guild and ctx.guild.me.colour:
             colour = ctx.guild.me.colour
@@ -246,14 +300,25 @@ class Payday(commands.Cog):
         
 
 
-    @commands.command(name="leaderboards", aliases=["lb"])
+    @commands.group(name="leaderboards", aliases=["lb"], invoke_without_command=True)
     @commands.guild_only()
     async def leaderboards_command(self, ctx):
         """see who is the biggest earner on the server"""
-        leaderboards = await self.get_leaderboards()
-        pages = views.PaginatedView(source=LeaderBoardSource(leaderboards))
+        total = await self.count_accounts()
+        if not total:
+            return await ctx.send("no accounts yet")
+        pages = views.PaginatedView(source=LeaderBoardSource(self, total))
         await pages.start(ctx)
 
+    @leaderboards_command.command(name="rank")
+    async def leaderboards_rank(self, ctx, *, member: Optional[discord.Member]):
+        """see your own or someone elses place on the leaderboard"""
+        member = member or ctx.author
+        entry = await self.fetch_rank(member.id)
+        if not entry:
+            return await ctx.send("This user has no balance value yet")
+        await ctx.send(f"**{member.display_name}** is rank {entry['rank']:,} with {entry['money']:,}")
+
 
 async def setup(bot):
     await bot.add_cog(Payday(bot))
@@ -2,7 +2,6 @@ import asyncpg
 import discord
 import matplotlib.pyplot as plt
 import time
-from aiohttp import ClientSession
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from discord.ext import commands, tasks
@@ -179,7 +178,7 @@ class CombatantView(discord.ui.View):
         super().__init__(timeout=None)
 
     async def get_data(self):
-        client = ClientSession()
+        client = self.bot.session
         self.species = await (
             await client.get(
                 f"https://pokeapi.co/api/v2/pokemon-species/{self.c_data.dex_no}"
@@ -191,7 +190,6 @@ class CombatantView(discord.ui.View):
                 self.default_form = form
             else:
                 self.alternate_forms.append(form)
-        await client.close()
 
     @discord.ui.select(placeholder="Select A Ranking!", options=options)
     async def rank_select(self, inter: discord.Interaction, select: discord.ui.Select):
@@ -277,7 +275,7 @@ class Tourney:
 
         This method always assumes that the current generation has been set.
         """
-        client = ClientSession()
+        client = self.bot.session
         # Setting the generation if it hasn't been set yet.
         gen_response = await (
             await client.get(
@@ -323,7 +321,6 @@ class Tourney:
             view = CombatantView(bot=self.bot, c_data=pkmn)
             await view.start()
             self.bot.add_view(view)
-        await client.close()
 
     async def next_gen(self) -> int:
         # TODO
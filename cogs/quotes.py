@@ -5,13 +5,49 @@ import discord
 from .utils.paginator import TextPages
 from typing import Optional
 from random import randint, choice
+from array import array
 from .utils.checks import channel_only
 
+RANDOM_QUOTE_ATTEMPTS = 3
+
+
+class QuoteNumbers:
+    """
+    the numbers of all quotes in a compact array with their positions,
+    so picking a random quote, adding and removing one are O(1)
+    """
+
+    def __init__(self, numbers=()):
+        self.numbers = array('q', numbers)
+        self.positions = {number: index for index, number in enumerate(self.numbers)}
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def add(self, number):
+        if number not in self.positions:
+            self.positions[number] = len(self.numbers)
+            self.numbers.append(number)
+
+    def remove(self, number):
+        index = self.positions.pop(number, None)
+        if index is None:
+            return
+        last = self.numbers.pop()
+        if index < len(self.numbers):
+            self.numbers[index] = last
+            self.positions[last] = index
+
+    def random(self):
+        return choice(self.numbers) if self.numbers else None
+
+
 class Quotes(commands.Cog):
     """Save and get random quotes provided and added by the users"""
 
     def __init__(self, bot):
         self.bot = bot
+        self.quote_numbers = QuoteNumbers()
 
     async def cog_load(self):
         self.bot.loop.create_task(self.initialize_quote_table())
@@ -23,6 +59,24 @@ class Quotes(commands.Cog):
         async with self.bot.db.acquire() as conn:
             async with conn.transaction():
                 await self.bot.db.execute(query)
+        await self.refresh_quote_numbers()
+
+    async def refresh_quote_numbers(self):
+        rows = await self.bot.db.fetch("SELECT number FROM quotes")
+        self.quote_numbers = QuoteNumbers(row['number'] for row in rows)
+
+    async def fetch_random_quote(self):
+        """pick a random number from the cached numbers and fetch only that quote"""
+        for _ in range(RANDOM_QUOTE_ATTEMPTS):
+            number = self.quote_numbers.random()
+            if number is None:
+                return None
+            quote = await self.fetch_single_quote(number)
+            if quote:
+                return quote
+            # deleted without going through the cog
+            self.quote_numbers.remove(number)
+        return None
 
     async def fetch_quotes(self):
         query = "SELECT * FROM quotes ORDER BY number"
@@ -35,14 +89,18 @@ class Quotes(commands.Cog):
             stmt = await conn.prepare("INSERT INTO quotes (number, text, user_id) VALUES (DEFAULT, $1, $2)\n"
                                       "                                         RETURNING number;")
             async with conn.transaction():
-                return await stmt.fetchval(quote, user_id)
+                number = await stmt.fetchval(quote, user_id)
+        self.quote_numbers.add(number)
+        return number
 
     async def remove_quote(self, number):
         async with self.bot.db.acquire() as conn:
             stmt = await conn.prepare("DELETE FROM quotes WHERE number = $1\n "
                                       "RETURNING *")
             async with conn.transaction():
-                return await stmt.fetchrow(number)
+                quote = await stmt.fetchrow(number)
+        self.quote_numbers.remove(number)
+        return quote
 
     async def fetch_single_quote(self, number):
         async with self.bot.db.acquire() as conn:
@@ -61,19 +119,20 @@ class Quotes(commands.Cog):
     @channel_only(208765039727869954,191536772352573440,336912585960194048,336378555300577281)
     async def quote(self, ctx, number: Optional[int], *, quote: Optional[commands.clean_content]):
         """add a quote by writing it down or get a random or specific quote """
-        quotes = await self.fetch_quotes()
-
         if number and not quote:
-            quote = next(iter(q for q in quotes if q["number"] == number), None)
+            quote = await self.fetch_single_quote(number)
             if quote:
                 await ctx.send(f"{quote['number']}) {quote['text']}")
             else:
-                quote = choice(quotes)
+                quote = await self.fetch_random_quote()
                 await ctx.send("quote was deleted send random quote instead...")
-                await ctx.send(f"{quote['number']}) {quote['text']}")
+                if quote:
+                    await ctx.send(f"{quote['number']}) {quote['text']}")
             return
         elif not quote:
-            quote = choice(quotes)
+            quote = await self.fetch_random_quote()
+            if not quote:
+                return await ctx.send("no quotes saved yet")
             await ctx.send(f"{quote['number']}) {quote['text']}")
         else:
             if not ctx.guild or ctx.guild.id != 336378555300577281:
@@ -149,6 +208,7 @@ class Quotes(commands.Cog):
                 )
                 await ctx.send(result)
                 await con.execute("DELETE FROM quotes WHERE text = '[Removed Quote]'")
+        await self.refresh_quote_numbers()
 
 
 
@@ -8,10 +8,20 @@ import traceback
 from random import choice
 import re
 import asyncio
-from .utils.dataIO import DataIO
+import time
 from .utils.checks import is_owner_or_moderator
+from .utils.raid_detector import RaidDetector, DEFAULT_THRESHOLDS, JOIN_WINDOWS
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
 from cogs.default import CustomHelpCommand
 from io import TextIOWrapper, BytesIO
+from math import ceil
+
+iam_memester_regex = re.compile(r'\.?i\s?a?m\s?meme?(ma)?st[ea]r', re.IGNORECASE)
+# promotions per check and how many of them run at the same time
+PROMOTION_BATCH_SIZE = 200
+PROMOTION_CONCURRENCY = 5
+# failed promotions are moved back so they don't stay at the front of the due queue
+PROMOTION_RETRY_DELAY = datetime.timedelta(hours=1)
 
 class JumpMessageView(discord.ui.View):
     def __init__(self, message: discord.Message):
@@ -52,6 +62,7 @@ class ReadRules(commands.Cog):
                     time_over timestamp
 
                 );
+                CREATE INDEX IF NOT EXISTS new_memesters_time_over_idx ON new_memesters (time_over);
                 '''
         async with self.bot.db.acquire() as con:
             async with con.transaction():
@@ -66,21 +77,27 @@ class ReadRules(commands.Cog):
             async with con.transaction():
                 await statement.fetch(new_user.id, time_over)
 
-    async def fetch_new_memesters(self):
+    async def fetch_due_memesters(self, limit=PROMOTION_BATCH_SIZE):
         query = '''
-            SELECT * FROM new_memesters
+            SELECT user_id FROM new_memesters
+            WHERE time_over < $1
+            ORDER BY time_over
+            LIMIT $2
         '''
-        async with self.bot.db.acquire() as con:
-            async with con.transaction():
-                return await con.fetch(query)
-    async def remove_user_from_new_list(self, user_id):
+        rows = await self.bot.db.fetch(query, datetime.datetime.utcnow(), limit)
+        return [row["user_id"] for row in rows]
+
+    async def remove_users_from_new_list(self, user_ids):
         query = '''
-            DELETE FROM new_memesters WHERE user_id = $1
+            DELETE FROM new_memesters WHERE user_id = ANY($1::bigint[])
         '''
-        async with self.bot.db.acquire() as con:
-            statement = await con.prepare(query)
-            async with con.transaction():
-                await statement.fetch(user_id)
+        await self.bot.db.execute(query, list(user_ids))
+
+    async def postpone_new_memesters(self, user_ids, delay=PROMOTION_RETRY_DELAY):
+        query = '''
+            UPDATE new_memesters SET time_over = $2 WHERE user_id = ANY($1::bigint[])
+        '''
+        await self.bot.db.execute(query, list(user_ids), datetime.datetime.utcnow() + delay)
 
     def __init__(self, bot: commands.Bot):
         self.bucket = commands.CooldownMapping.from_cooldown(3, 600, commands.BucketType.member)
@@ -88,8 +105,10 @@ class ReadRules(commands.Cog):
         self._original_help_command = bot.help_command
         self.bot.help_command = AnimemesHelpFormat()
         self.bot.help_command.cog = self
-        self.data_io = DataIO()
-        self.checkers_channel = self.bot.get_channel(self.data_io.load_json("reddit_settings")["channel"])
+        self.store = bot.settings_store
+        self.join_settings_file = "config/join_limit_settings.json"
+        reddit_settings = self.store.load("data/reddit_settings.json", default=lambda: {"channel": None})
+        self.checkers_channel = self.bot.get_channel(reddit_settings["channel"])
         self.animemes_guild = self.bot.get_guild(187423852224053248)
         if self.animemes_guild:
             self.memester_role = self.animemes_guild.get_role(189594836687519744)
@@ -99,14 +118,15 @@ class ReadRules(commands.Cog):
             self.lockdown_channel = self.animemes_guild.get_channel(596319943612432404)
             self.horny_role = self.animemes_guild.get_role(722561738846896240)
             self.horny_jail = self.animemes_guild.get_role(639138311935361064)
-        self.join_counter = 0
-        self.join_limit = 5
-        self.join_timer = 6
-        with open("config/join_limit_settings.json") as f:
-            settings = json.load(f)
-            self.join_limit = settings["join_limit"]
-            self.join_timer = settings["join_timer"]
-        self.limit_reset.change_interval(hours=self.join_timer)
+        self.join_settings = self.store.load(self.join_settings_file,
+                                             default=lambda: {"join_limit": 5, "join_timer": 6})
+        self.raid_detector = RaidDetector(self.join_settings.get("raid_thresholds"),
+                                          join_limit=self.join_settings["join_limit"],
+                                          join_timer=self.join_settings["join_timer"])
+        # unix time when the rules channel opens again, None if it isn't locked by the bot.
+        # saved with the join settings so a restart during a lockdown still opens the channel again
+        self.lockdown_until = self.join_settings.get("lockdown_until")
+        self.lockdown_task = None
         self.word_filter = re.compile(r"(\bfagg*(ott*)?\b|\bretard)", re.IGNORECASE)
         self.nword_filter = re.compile(r"(?<!s)(?P<main>[n\U0001F1F3]+(?:(?P<_nc>.)(?P=_nc)*)?[i1!|l\U0001f1ee]+(?:(?P<_ic>.)(?P=_ic)*)?[g9\U0001F1EC](?:(?P<_gc>.)(?P=_gc)*)?[g9\U0001F1EC]+(?:(?P<_gc_>.)(?P=_gc_)*)?(?:[e3€£ÉÈëeÊêËéE\U0001f1ea]+(?:(?P<_ec>.)(?P=_ec)*)?[r\U0001F1F7]+|(?P<soft>[a\U0001F1E6])))((?:(?P<_rc>.)(?P=_rc)*)?[s5]+)?(?!rd)", re.IGNORECASE)
 
@@ -114,11 +134,14 @@ class ReadRules(commands.Cog):
         self.bot.loop.create_task(self.init_database())
         self.bot.loop.create_task(self.setup_rules_database())
         self.check_for_new_memester.start()
+        self.lift_lockdown.start()
+        register_cog(self.bot, self)
 
     async def cog_unload(self):
+        unregister_cog(self.bot, self)
         self.bot.help_command = self._original_help_command
         self.check_for_new_memester.stop()
-        self.limit_reset.cancel()
+        self.lift_lockdown.cancel()
 
     @commands.command(name="stuck")
     async def people_stuck(self, ctx):
@@ -205,31 +228,86 @@ class ReadRules(commands.Cog):
         await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
 
-    @tasks.loop(hours=1)
-    async def limit_reset(self):
-        self.join_counter = 0
-        default_role = self.animemes_guild.default_role
+    async def set_rules_channel_locked(self, locked):
+        default_role = self.rules_channel.guild.default_role
         overwrite = self.rules_channel.overwrites_for(default_role)
-        overwrite.send_messages = True
+        overwrite.send_messages = not locked
         await self.rules_channel.set_permissions(default_role, overwrite=overwrite)
 
+    def set_lockdown_until(self, lockdown_until):
+        self.lockdown_until = lockdown_until
+        self.join_settings["lockdown_until"] = lockdown_until
+        self.store.changed(self.join_settings_file)
+
+    def trigger_lockdown(self, rule, seconds):
+        """
+        lock the rules channel in the background so the join that triggered it isn't held up
+        """
+        if self.lockdown_until is not None:
+            self.set_lockdown_until(max(self.lockdown_until, time.time() + seconds))
+            return
+        if self.lockdown_task and not self.lockdown_task.done():
+            return
+        self.lockdown_task = self.bot.loop.create_task(self.start_lockdown(rule, seconds))
+
+    async def start_lockdown(self, rule, seconds):
+        logger = logging.getLogger("PoutyBot")
+        try:
+            await self.set_rules_channel_locked(True)
+        except discord.HTTPException:
+            logger.exception(f"could not lock the rules channel, {rule} was exceeded")
+            return
+        self.set_lockdown_until(time.time() + seconds)
+        logger.warning(f"rules channel locked for {seconds}s, {rule} was exceeded")
+        if self.lockdown_channel:
+            def is_previous_lockdown_message(m):
+                return "join limit was exceeded try again in" in m.content
+            duration = f"{round(seconds / 3600)} hours" if seconds >= 3600 else f"{ceil(seconds / 60)} minutes"
+            try:
+                await self.lockdown_channel.purge(limit=100, check=is_previous_lockdown_message)
+                await self.lockdown_channel.send(f"current join limit was exceeded try again in {duration}")
+            except discord.HTTPException:
+                logger.exception("could not post the lockdown message")
+
+    async def end_lockdown(self):
+        await self.set_rules_channel_locked(False)
+        self.set_lockdown_until(None)
+
+    @tasks.loop(seconds=30)
+    async def lift_lockdown(self):
+        # only opens the channel again if the bot locked it
+        if self.lockdown_until is not None and time.time() >= self.lockdown_until:
+            try:
+                await self.end_lockdown()
+            except discord.HTTPException:
+                # tried again on the next iteration
+                logging.getLogger("PoutyBot").exception("could not unlock the rules channel")
+
+    @lift_lockdown.before_loop
+    async def before_lift_lockdown(self):
+        await self.bot.wait_until_ready()
+
     @is_owner_or_moderator()
     @commands.command(name="join_info", aliases=["ji", "joininfo"])
     async def get_join_info(self, ctx):
         """
-        get info about how many people have joined and what the limit is
+        get info about how many people have joined and what the limits are
         """
-        time_diff = None
-        time_info = ""
-        if self.limit_reset.is_running():
-            time_diff = self.limit_reset.next_iteration - datetime.datetime.now(datetime.timezone.utc) 
-            hours, minutes = divmod(time_diff.seconds, 3600)
-            minutes, seconds = divmod(minutes, 60)
-            time_info = (f"next iteration in {hours} hours and {minutes} minutes")
-        await ctx.send(f"{self.join_counter} users have joined and the limit is {self.join_limit}\n"
-                f"Task running: {self.limit_reset.is_running()} with a cooldown of {self.join_timer} hours {time_info}")
+        detector = self.raid_detector
+        lines = [f"{rule}: {detector.join_count(rule)}/{detector.thresholds[rule] or 'off'}" for rule in JOIN_WINDOWS]
+        lines.append(f"join_limit: {detector.join_count('join_limit')}/{detector.join_limit} "
+                     f"per {detector.join_timer} hours, {'active' if detector.join_limit_active else 'not active'}")
+        if self.lockdown_until:
+            lines.append(f"locked until {discord.utils.format_dt(datetime.datetime.fromtimestamp(self.lockdown_until, tz=datetime.timezone.utc), 'T')}")
+        await ctx.send("\n".join(lines))
 
 
+    def save_join_settings(self):
+        self.join_settings["join_limit"] = self.raid_detector.join_limit
+        self.join_settings["join_timer"] = self.raid_detector.join_timer
+        self.join_settings["raid_thresholds"] = self.raid_detector.thresholds
+        self.store.changed(self.join_settings_file)
+
     @is_owner_or_moderator()
     @commands.command(name="join_limit", aliases=["jl"])
     async def set_join_limit(self, ctx, limit: int):
@@ -238,61 +316,81 @@ class ReadRules(commands.Cog):
         """
         if limit < 1:
             return await ctx.send("please choose a positive number bigger than 0")
-        self.join_limit = limit
-        await ctx.send(f"limit set to {self.join_limit}")
-        with open("config/join_limit_settings.json", "w") as f:
-            settings = {}
-            settings["join_limit"] = self.join_limit
-            settings["join_timer"] = self.join_timer
-            json.dump(settings, f)
+        self.raid_detector.join_limit = limit
+        await ctx.send(f"limit set to {limit}")
+        self.save_join_settings()
 
     @is_owner_or_moderator()
     @commands.command(name="join_timer", aliases=["jt", "jset", "jchange"])
     async def set_join_timer(self, ctx, hours: int, when: int = 0):
         """
-        set a new join timer and also set in how many hours the task should start
+        set the hours the join limit applies to and also set in how many hours the limit should start
         example:
-        `.jt 6 8` which will make the task start every 6 hours after waiting 8 hours first
+        `.jt 6 8` which will limit the joins per 6 hours after waiting 8 hours first
         """
-        self.join_timer = hours
-        was_running = self.limit_reset.is_running()
-        self.limit_reset.cancel()
-        self.limit_reset.change_interval(hours=hours)
-        with open("config/join_limit_settings.json", "w") as f:
-            settings = {}
-            settings["join_limit"] = self.join_limit
-            settings["join_timer"] = self.join_timer
-            json.dump(settings, f)
-        response = f"join timer cooldown changed to {hours} hours"
+        if hours < 1:
+            return await ctx.send("please choose a positive number bigger than 0")
+        self.raid_detector.set_join_timer(hours)
+        self.save_join_settings()
+        response = f"join timer changed to {hours} hours"
         if when > 0 :
             response += f" and will start running in {when} hours"
         await ctx.send(response)
-        if was_running:
-            def is_previous_lockdown_message(m):
-                return "join limit was exceeded try again in" in m.content
-            await self.lockdown_channel.purge(limit=100, check=is_previous_lockdown_message)
-            await self.lockdown_channel.send(f"current join limit was exceeded try again in {when} hours")
+        if when > 0 and self.raid_detector.join_limit_active:
+            self.raid_detector.join_limit_active = False
             await asyncio.sleep(when * 3600)
-            self.limit_reset.start()
+            self.raid_detector.join_limit_active = True
 
     @is_owner_or_moderator()
     @commands.command(name="join_timer_start", aliases=["jstart"])
     async def start_join_timer(self, ctx, when: int = 0):
         """
-        start the join timer either now or in x hours
+        start the join limit either now or in x hours
         """
-        self.limit_reset.cancel()
         if when > 0:
-            await ctx.send(f"join timer will start in {when} hours")
+            await ctx.send(f"join limit will start in {when} hours")
             await asyncio.sleep(when * 3600)
         else:
-            await ctx.send("join timer started")
-        self.limit_reset.start()
+            await ctx.send("join limit started")
+        self.raid_detector.join_limit_active = True
 
     @is_owner_or_moderator()
     @commands.command(name="join_timer_stop", aliases=["jstop"])
     async def stop_join_timer(self, ctx):
-        self.limit_reset.cancel()
+        self.raid_detector.join_limit_active = False
+
+    @is_owner_or_moderator()
+    @commands.group(name="raid", invoke_without_command=True)
+    async def raid(self, ctx):
+        """
+        shows the thresholds of the raid protection, a lockdown starts once one is reached (0 means off)
+        """
+        thresholds = "\n".join(f"{rule}: {value}" for rule, value in self.raid_detector.thresholds.items())
+        await ctx.send(f"```\n{thresholds}\n```")
+
+    @is_owner_or_moderator()
+    @raid.command(name="set")
+    async def raid_set(self, ctx, rule: str, value: int):
+        """
+        change a threshold of the raid protection, e.g. `.raid set joins_1m 15`
+        """
+        try:
+            self.raid_detector.set_threshold(rule, value)
+        except KeyError:
+            return await ctx.send(f"unknown rule, pick one of: {', '.join(DEFAULT_THRESHOLDS)}")
+        except ValueError as e:
+            return await ctx.send(str(e))
+        self.save_join_settings()
+        await ctx.send(f"{rule} set to {value}")
+
+    @is_owner_or_moderator()
+    @raid.command(name="unlock")
+    async def raid_unlock(self, ctx):
+        """
+        ends the current lockdown
+        """
+        await self.end_lockdown()
+        await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
 
     def build_join_message(self, member: discord.Member):
         embed = discord.Embed(title=f"{member} joined the server", colour=discord.Colour.blurple())
@@ -304,32 +402,21 @@ class ReadRules(commands.Cog):
 
         return {'content': member.id, 'embed': embed}
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        channel = message.channel
-        if message.author.id == self.bot.user.id or not message.guild:
-            return
-        if channel.id != self.rules_channel.id:
-            return
+    def in_rules_channel(self, message):
+        return message.guild is not None and message.author.id != self.bot.user.id \
+            and message.channel.id == self.rules_channel.id
 
-        iam_memester_regex = re.compile(r'\.?i\s?a?m\s?meme?(ma)?st[ea]r', re.IGNORECASE)
+    @message_handler(predicate=in_rules_channel)
+    async def rules_channel_message(self, message, match):
+        channel = message.channel
         if iam_memester_regex.match(message.clean_content):
+            # checked before any request so the channel gets locked as early as possible
+            exceeded = self.raid_detector.record_join(message.author)
+            if exceeded:
+                self.trigger_lockdown(*exceeded)
             await message.author.add_roles(self.new_memester)
             await message.delete()
             await self.join_log.send(**self.build_join_message(message.author))
-            if self.limit_reset.is_running():
-                self.join_counter += 1
-            if self.join_counter >= self.join_limit and self.join_limit > 0 and self.limit_reset.is_running():
-                default_role = message.guild.default_role
-                overwrite = message.channel.overwrites_for(default_role)
-                overwrite.send_messages = False
-                await self.rules_channel.set_permissions(default_role, overwrite=overwrite)
-                time_diff = self.limit_reset.next_iteration - datetime.datetime.now(datetime.timezone.utc) 
-                if self.lockdown_channel:
-                    def is_previous_lockdown_message(m):
-                        return "join limit was exceeded try again in" in m.content
-                    await self.lockdown_channel.purge(limit=100, check=is_previous_lockdown_message)
-                    await self.lockdown_channel.send(f"current join limit was exceeded try again in {round(time_diff.seconds / 3600)} hours")
             return
         content = message.content.lower()
         with open("data/rules_channel_phrases.json") as f:
@@ -366,35 +453,65 @@ class ReadRules(commands.Cog):
 
     async def fetch_member_via_api(self, user_id):
         """
-        for fetching the user via the api if the member may not be in the cache
+        for fetching the user via the api if the member may not be in the cache,
+        None if the user isn't in the server anymore
         """
         try:
             return await self.animemes_guild.fetch_member(user_id)
-        except Exception as e:
+        except discord.NotFound:
             logger = logging.getLogger("PoutyBot")
             logger.warning(f"Could not fetch user with user id {user_id}")
             return None
 
+    async def promote_new_memester(self, user_id, limiter):
+        """
+        swaps the new memester role for the memester role,
+        returns whether the user is done and can be removed from the list
+        """
+        async with limiter:
+            try:
+                member = self.animemes_guild.get_member(user_id)
+                if member is None:
+                    member = await self.fetch_member_via_api(user_id)
+                if member is None:
+                    return True
+                # the roles are read after waiting for the limiter so changes made in the meantime are kept
+                current = [role for role in member.roles if not role.is_default()]
+                roles = [role for role in current if role != self.new_memester]
+                if self.memester_role not in roles:
+                    roles.append(self.memester_role)
+                if set(roles) != set(current):
+                    await member.edit(roles=roles, reason="new memester week is over")
+                return True
+            except discord.NotFound:
+                return True
+            except discord.Forbidden:
+                # e.g. the member's roles are above the bot's, trying again won't help
+                logger = logging.getLogger("PoutyBot")
+                logger.warning(f"not allowed to promote new memester {user_id}, removing them from the list")
+                return True
+            except Exception:
+                # the user stays in the list and is tried again later
+                logger = logging.getLogger("PoutyBot")
+                logger.exception(f"could not promote new memester {user_id}")
+                return False
+
     @tasks.loop(minutes=1)
     async def check_for_new_memester(self):
         if not self.animemes_guild:
             return
-        rows = await self.fetch_new_memesters()
         try:
-            for row in rows:
-                if row["time_over"] < datetime.datetime.utcnow():
-                    member = self.animemes_guild.get_member(row["user_id"])
-                    if member is None:
-                        member = await self.fetch_member_via_api(row["user_id"])
-                    if member:
-                        await member.add_roles(self.memester_role)
-                        await member.remove_roles(self.new_memester)
-                    await self.remove_user_from_new_list(row["user_id"])
-        except (discord.NotFound):
-            await self.remove_user_from_new_list(row["user_id"])
-        except (discord.Forbidden, discord.HTTPException):
-            logger = logging.getLogger("PoutyBot")
-            logger.error(traceback.format_exc())
+            user_ids = await self.fetch_due_memesters()
+            if not user_ids:
+                return
+            limiter = asyncio.Semaphore(PROMOTION_CONCURRENCY)
+            results = await asyncio.gather(*(self.promote_new_memester(user_id, limiter) for user_id in user_ids))
+            done = [user_id for user_id, promoted in zip(user_ids, results) if promoted]
+            failed = [user_id for user_id, promoted in zip(user_ids, results) if not promoted]
+            if done:
+                await self.remove_users_from_new_list(done)
+            if failed:
+                await self.postpone_new_memesters(failed)
         except Exception as e: 
             logger = logging.getLogger("PoutyBot")
             logger.error("memester check was cancelled", exc_info=1)
@@ -462,11 +579,8 @@ class ReadRules(commands.Cog):
         else:
             return
 
-    @commands.Cog.listener(name="on_message")
-    async def rules_channel_word_filter(self, message: discord.Message):
-        if message.channel != self.rules_channel:
-            return
-
+    @message_handler(predicate=in_rules_channel)
+    async def rules_channel_word_filter(self, message: discord.Message, match):
         if (match := self.word_filter.search(message.content)) or (match := self.nword_filter.search(message.content)):
             if "Using slurs such as but not limited to" in message.content:
                 return
@@ -4,7 +4,6 @@ import re
 import datetime
 import discord
 from discord.ext import commands, tasks
-from os import path
 from .utils import checks
 import asyncio
 import logging
@@ -26,23 +25,18 @@ class Reddit(commands.Cog):
                 self.auth = httpx.BasicAuth(self.client_id, self.secret)
                 self.headers = {'User-Agent': 'Discord-Bot by /u/Saikimo',
                                 'Content-Type': 'application/json'}
-            self.session = httpx.AsyncClient()
+            self.session = bot.http_clients.httpx
             self.reddit_settings_path = "data/reddit_settings.json"
-            self.checker_channel = None
-            if not path.exists(self.reddit_settings_path):
-                file = open(self.reddit_settings_path, 'w')
-                json.dump({'channel': None}, file)
-            with open(self.reddit_settings_path, 'r') as f:
-                settings = json.load(f)
-                self.checker_channel = self.bot.get_channel(settings['channel'])
-                self.reddit_channel = self.bot.get_channel(settings.get("reddit_channel", None))
+            self.store = bot.settings_store
+            self.settings = self.store.load(self.reddit_settings_path, default=lambda: {'channel': None})
+            self.checker_channel = self.bot.get_channel(self.settings['channel'])
+            self.reddit_channel = self.bot.get_channel(self.settings.get("reddit_channel", None))
             self.last_stickied_post_time = datetime.datetime.utcnow()
 
     async def cog_load(self):
         self.check_reddit_for_pinned_threads.start()
         self.bot.loop.create_task(self.create_last_posts_table())
     async def cog_unload(self):
-        self.bot.loop.create_task(self.session.aclose())
         self.check_reddit_for_pinned_threads.stop()
 
     async def create_last_posts_table(self):
@@ -70,11 +64,8 @@ class Reddit(commands.Cog):
     @checks.is_owner_or_moderator()
     async def setup_reddit_channel(self, ctx):
         """set up the channel for posting stickied threads"""
-        with open(self.reddit_settings_path, 'r+') as f:
-            settings = json.load(f)
-            settings["reddit_channel"] = ctx.channel.id
-            f.seek(0)
-            json.dump(settings, f)
+        self.settings["reddit_channel"] = ctx.channel.id
+        self.store.changed(self.reddit_settings_path)
         self.reddit_channel = ctx.channel
         await ctx.send(f"{ctx.channel.mention} set up as the reddit channel for announcements")
 
@@ -245,12 +236,9 @@ class Reddit(commands.Cog):
     @commands.command(pass_context=True, hidden=True)
     async def setup_checker_channel(self, ctx):
         channel = ctx.message.channel
-        if not path.exists(self.reddit_settings_path):
-            open(self.reddit_settings_path, 'w').close()
-        with open(self.reddit_settings_path, 'w') as f:
-            self.checker_channel = channel
-            settings = {'channel': channel.id}
-            json.dump(settings, f)
+        self.checker_channel = channel
+        self.settings['channel'] = channel.id
+        self.store.changed(self.reddit_settings_path)
 
 
 async def setup(bot):
@@ -13,34 +13,39 @@ import typing
 import re
 from math import ceil
 from random import randint
+from collections import defaultdict
+import asyncio
+
+ROLE_EDITS_PER_GUILD = 2
 
 class RoleSelect(discord.ui.Select):
-    def __init__(self, roles: typing.List[discord.Role]):
+    def __init__(self, roles: typing.List[discord.Role], member_roles: typing.Set[discord.Role]):
         self.roles = roles
-        options = list(discord.SelectOption(label=role.name, value=str(role.id)) for role in roles)           
-        super().__init__(placeholder="Please select a role", options=options, row=1)
+        options = list(discord.SelectOption(label=role.name, value=str(role.id), default=role in member_roles)
+                       for role in roles)
+        super().__init__(placeholder="Please select your roles", options=options, row=1,
+                         min_values=0, max_values=len(options))
 
     async def callback(self, interaction: discord.Interaction):
-        selection = None
-        if not isinstance(interaction.user, discord.Member):
+        if not isinstance(interaction.user, discord.Member) or not self.view:
             return
-        if self.values:
-            selection = self.values[0]
-        if selection and self.view:
-            user_roles = []
-            if interaction.user:
-                user_roles = list(r.id for r in interaction.user.roles)
-            if int(self.values[0]) in user_roles:
-                await interaction.user.remove_roles(discord.Object(int(self.values[0])))
-            else:
-                await interaction.user.add_roles(discord.Object(int(self.values[0])))
-            await self.view.show_page(interaction, self.view.current_page)
+        # the selection is the wanted state of the roles on this page
+        selected = set(int(value) for value in self.values)
+        add = [role for role in self.roles if role.id in selected]
+        remove = [role for role in self.roles if role.id not in selected]
+        await self.view.ctx.cog.edit_member_roles(interaction.user, add=add, remove=remove, reason="self assigned roles")
+        self.view.member_roles.update(add)
+        self.view.member_roles.difference_update(remove)
+        await self.view.show_page(interaction, self.view.current_page)
             
 class RoleMenu(discord.ui.View):
-    def __init__(self, role_list: typing.List[discord.Role], context: commands.Context, **kwargs):
+    def __init__(self, role_list: typing.List[discord.Role], context: commands.Context, descriptions=None, **kwargs):
         super().__init__(**kwargs)
         self.role_list = role_list
         self.ctx = context
+        # roles of the author, kept up to date with the changes made through the menu
+        self.member_roles = set(context.author.roles)
+        self.descriptions = descriptions or {}
         if role_list:
             self.guild = role_list[0].guild
         self.current_page = 0
@@ -51,7 +56,7 @@ class RoleMenu(discord.ui.View):
         right = (self.current_page + 1)* self.page_size
 
         self.displayed_roles = self.role_list[left:right]
-        self.dropdown = RoleSelect(self.displayed_roles)
+        self.dropdown = RoleSelect(self.displayed_roles, self.member_roles)
         self.add_item(self.dropdown)
 
     async def interaction_check(self, interaction: discord.Interaction):
@@ -62,14 +67,14 @@ class RoleMenu(discord.ui.View):
 
     async def embed(self):
         description = (f"""
-        Assign or remove a role from yourself by selecting the role from the dropdown.
+        Assign or remove roles from yourself by selecting or deselecting them in the dropdown.
         To change pages use \N{BLACK LEFT-POINTING TRIANGLE}\N{VARIATION SELECTOR-16} and \N{BLACK RIGHT-POINTING TRIANGLE}\N{VARIATION SELECTOR-16}
         """)
         embed = discord.Embed(title="Assignable Roles", description=description, colour=discord.Colour.blurple())
         embed.set_footer(text=f"Page {self.current_page+1}/{self.max_page}")
         for role in self.displayed_roles:
-            checkmark = '\N{WHITE HEAVY CHECK MARK}' if role in self.ctx.author.roles else ''
-            role_description = await self.ctx.bot.db.fetchval("SELECT description FROM role_info WHERE role_id = $1", role.id) or '\u200b'
+            checkmark = '\N{WHITE HEAVY CHECK MARK}' if role in self.member_roles else ''
+            role_description = self.descriptions.get(role.id) or '\u200b'
             embed.add_field(name=f"{role.name} {checkmark}", value=role_description, inline=False)
         return embed
 
@@ -78,7 +83,7 @@ class RoleMenu(discord.ui.View):
         right = (page + 1) * self.page_size 
         self.displayed_roles = self.role_list[left:right]
         self.remove_item(self.dropdown)
-        self.dropdown = RoleSelect(self.displayed_roles)
+        self.dropdown = RoleSelect(self.displayed_roles, self.member_roles)
         self.add_item(self.dropdown)
         embed = await self.embed()
         await interaction.response.edit_message(embed=embed, view=self)
@@ -111,12 +116,28 @@ class CustomRoleConverter(commands.RoleConverter):
                 return role
         return await super().convert(ctx, argument)
 
+class GuildRoleInfo:
+    """the role_info rows of one guild"""
+    def __init__(self, rows):
+        self.role_ids = frozenset(row['role_id'] for row in rows)
+        self.descriptions = {row['role_id']: row['description'] for row in rows if row['description']}
+        self.pingable = frozenset(row['role_id'] for row in rows if row['pingable'])
+        self.assignable = frozenset(row['role_id'] for row in rows if row['assignable'])
+
+    def __contains__(self, role_id):
+        return role_id in self.role_ids
+
+
 class Roles(commands.Cog):
     """role managing commands"""
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.file_path = 'data/roles.json'
         self.lockdown = False
+        # guild id -> GuildRoleInfo, loaded on first use and refreshed by the roles admin commands
+        self.role_info = {}
+        # limits the concurrent member edits per guild so busy role menus don't run into the rate limits
+        self.edit_limiters = defaultdict(lambda: asyncio.Semaphore(ROLE_EDITS_PER_GUILD))
 
     async def cog_load(self):
         self.bot.loop.create_task(self.create_role_table())
@@ -143,22 +164,51 @@ class Roles(commands.Cog):
                 ADD COLUMN IF NOT EXISTS guild_id BIGINT;
                 """)
 
+    async def refresh_role_info(self, guild: discord.Guild):
+        rows = await self.bot.db.fetch("""
+            SELECT role_id, description, pingable, assignable, guild_id FROM role_info
+            WHERE guild_id = $1 OR guild_id IS NULL
+        """, guild.id)
+        # rows from before the guild_id column only belong to this guild if it has the role
+        rows = [row for row in rows if row['guild_id'] == guild.id or guild.get_role(row['role_id'])]
+        self.role_info[guild.id] = info = GuildRoleInfo(rows)
+        return info
+
+    async def get_role_info(self, guild: discord.Guild):
+        info = self.role_info.get(guild.id)
+        if info is None:
+            info = await self.refresh_role_info(guild)
+        return info
+
+    async def edit_member_roles(self, member: discord.Member, add=(), remove=(), reason=None):
+        """
+        applies the role changes with a single request
+        """
+        current = set(member.roles)
+        add = [role for role in add if role not in current]
+        remove = [role for role in remove if role in current]
+        async with self.edit_limiters[member.guild.id]:
+            # a single change uses the role endpoints which can't overwrite roles changed in the meantime
+            if len(add) + len(remove) == 1:
+                if add:
+                    await member.add_roles(*add, reason=reason)
+                else:
+                    await member.remove_roles(*remove, reason=reason)
+            elif add or remove:
+                roles = [role for role in member.roles if not role.is_default() and role not in remove]
+                roles.extend(add)
+                await member.edit(roles=roles, reason=reason)
+
     async def _fetch_assignable_roles(self, ctx: commands.Context):
-        role_ids = await self.bot.db.fetch("SELECT role_id FROM role_info WHERE guild_id = $1 AND assignable = true", ctx.guild.id)
+        info = await self.get_role_info(ctx.guild)
         roles = []
-        for record in role_ids:
-            if role := ctx.guild.get_role(record["role_id"]):
+        for role_id in info.assignable:
+            if role := ctx.guild.get_role(role_id):
                 roles.append(role)
+        # keep the order of the server's role list
+        roles.sort(reverse=True)
         return roles
 
-    async def fetch_role_info(self, role_id):
-        async with self.bot.db.acquire() as con:
-            statement = await con.prepare("""
-                SELECT description, pingable, assignable from role_info
-                WHERE role_id = $1
-            """)
-            return await statement.fetchrow(role_id)
-
     async def create_role_description(self, role_id, desc, guild):
         async with self.bot.db.acquire() as con:
             statement = await con.prepare("""
@@ -167,6 +217,7 @@ class Roles(commands.Cog):
                 ON CONFLICT (role_id) DO UPDATE SET description = EXCLUDED.description 
             """)
             await statement.fetch(role_id, desc, guild.id)
+        await self.refresh_role_info(guild)
 
     @checks.is_owner_or_moderator()
     @commands.command()
@@ -199,8 +250,7 @@ class Roles(commands.Cog):
             if admin_cog:
                 if hasattr(admin_cog, "mute_role") and admin_cog.mute_role == role:
                     return
-            member = ctx.message.author
-            await member.add_roles(role)
+            await self.edit_member_roles(ctx.author, add=[role])
             await ctx.send(f"Assigned you the following role: {role.name}")
         except discord.Forbidden as fb:
             await ctx.send("Sorry I don't have the permission to give you that role")
@@ -214,8 +264,7 @@ class Roles(commands.Cog):
             await ctx.send("can't remove that role")
             return
         try:
-            member = ctx.message.author
-            await member.remove_roles(role)
+            await self.edit_member_roles(ctx.author, remove=[role])
             chance = randint(0,100)
             if chance >= 90 and "horny" in role.name.lower():
                 await ctx.send("https://youtu.be/rlhRQiVeQPY")
@@ -233,7 +282,8 @@ class Roles(commands.Cog):
         """
         assignable_roles = await self._fetch_assignable_roles(ctx)
         if assignable_roles:
-            role_menu = RoleMenu(assignable_roles, ctx, timeout=180)
+            info = await self.get_role_info(ctx.guild)
+            role_menu = RoleMenu(assignable_roles, ctx, descriptions=info.descriptions, timeout=180)
             await role_menu.start(ctx)
         else:
             await ctx.send("No roles are assignable for you")
@@ -256,7 +306,7 @@ class Roles(commands.Cog):
                     continue
                 embed.add_field(name=role.name, value="{} Member(s)".format(len(role.members)))
         else:
-            info = await self.fetch_role_info(role.id)
+            info = await self.get_role_info(ctx.guild)
             embed.title = role.name
             embed.color = role.colour
             embed.add_field(name="ID", value=role.id)
@@ -266,10 +316,10 @@ class Roles(commands.Cog):
             embed.timestamp = role.created_at
             if role.icon: 
                 embed.set_thumbnail(url=role.icon.url)
-            if info:
-                embed.description = info.get('description', '\u200b')
-                embed.add_field(name='pingable', value='yes' if info.get('pingable', False) else 'no')
-                embed.add_field(name='assignable', value="yes" if info.get('assignable', False) else 'no')
+            if role.id in info:
+                embed.description = info.descriptions.get(role.id, '\u200b')
+                embed.add_field(name='pingable', value='yes' if role.id in info.pingable else 'no')
+                embed.add_field(name='assignable', value="yes" if role.id in info.assignable else 'no')
         await ctx.send(embed=embed)
 
     @commands.has_permissions(manage_roles=True)
@@ -301,10 +351,8 @@ class Roles(commands.Cog):
         ping the role by making it mentionable for the ping and remove
         mentionable again
         """
-        can_ping = await self.bot.db.fetchval("""
-        SELECT pingable FROM role_info WHERE role_id = $1
-        """, role.id)
-        if not can_ping:
+        info = await self.get_role_info(ctx.guild)
+        if role.id not in info.pingable:
             return await ctx.send("I am not allowed to ping this role")
         try:
             await role.edit(mentionable=True)
@@ -333,6 +381,7 @@ class Roles(commands.Cog):
             ON CONFLICT (role_id) DO 
                 UPDATE SET pingable = $2
             """, new_role.id, mentionable, ctx.guild.id)
+            await self.refresh_role_info(ctx.guild)
             await ctx.send("role `{}` created".format(new_role.name))
         except discord.Forbidden:
             await ctx.send("Sorry I don't have the permission add a role")
@@ -347,6 +396,7 @@ class Roles(commands.Cog):
         await ctx.bot.db.execute("""
         DELETE FROM role_info WHERE role_id = $1
         """, role.id)
+        await self.refresh_role_info(ctx.guild)
         try:
             await role.delete()
             await ctx.message.add_reaction("\N{WHITE HEAVY CHECK MARK}")
@@ -365,6 +415,7 @@ class Roles(commands.Cog):
         ON CONFLICT (role_id) DO 
             UPDATE SET pingable = $2
         """, role.id, pingable, ctx.guild.id)
+        await self.refresh_role_info(ctx.guild)
         await ctx.send(f"role updated to {'pingable' if pingable else 'unpingable'}")
 
     @roles.command(name="assignable")
@@ -379,6 +430,7 @@ class Roles(commands.Cog):
         ON CONFLICT (role_id) DO 
             UPDATE SET assignable = $2
         """, role.id, assignable, ctx.guild.id)
+        await self.refresh_role_info(ctx.guild)
         await ctx.send(f"role updated to {'self-assignable' if assignable else 'not self-assignable'}")
 
 
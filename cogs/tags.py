@@ -3,8 +3,65 @@ from discord.ext import commands, menus
 from .utils import checks, views
 import discord
 from discord import app_commands
+from bisect import bisect_left
+from collections import defaultdict
 import itertools
 
+AUTOCOMPLETE_LIMIT = 25
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class GuildTags:
+    """
+    every tag of a guild held in memory: alias -> tag id -> content,
+    plus a sorted name list for prefix and a trigram index for substring autocompletion
+    """
+
+    def __init__(self, rows):
+        self.aliases = {}
+        self.contents = {}
+        self.names = {}
+        self.trigrams = defaultdict(set)
+        for row in rows:
+            self.aliases[row['alias']] = row['tag_id']
+            self.contents[row['tag_id']] = row['content']
+            self.names[row['tag_id']] = row['name']
+        self.sorted_aliases = sorted((alias.lower(), alias) for alias in self.aliases)
+        for lowered, alias in self.sorted_aliases:
+            for trigram in trigrams(lowered):
+                self.trigrams[trigram].add(alias)
+
+    def get(self, alias):
+        tag_id = self.aliases.get(alias)
+        return self.contents.get(tag_id) if tag_id else None
+
+    def starting_with(self, prefix):
+        index = bisect_left(self.sorted_aliases, (prefix,))
+        for lowered, alias in itertools.islice(self.sorted_aliases, index, None):
+            if not lowered.startswith(prefix):
+                break
+            yield alias
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """aliases starting with the query first, then the ones containing it"""
+        query = query.lower()
+        if not query:
+            return [alias for _, alias in self.sorted_aliases[:limit]]
+        results = list(itertools.islice(self.starting_with(query), limit))
+        if len(results) < limit:
+            found = set(results)
+            if len(query) >= 3:
+                candidates = sorted(set.intersection(*(self.trigrams.get(t, set()) for t in trigrams(query))))
+                matches = (alias for alias in candidates if alias not in found and query in alias.lower())
+            else:
+                # too short for the trigram index, scan the names instead
+                matches = (alias for lowered, alias in self.sorted_aliases if alias not in found and query in lowered)
+            results.extend(itertools.islice(matches, limit - len(results)))
+        return results
+
 class TagList(menus.ListPageSource):
     def __init__(self, data, *args, **kwargs):
         super().__init__(data,*args, **kwargs)
@@ -20,22 +77,46 @@ class Tags(commands.Cog):
     """Create, Edit, Delete and Search tags created by moderators"""
     def __init__(self, bot):
         self.bot = bot
-        self.tags = {}
+        self.tag_cache = {}
+        self.listener_connection = None
 
 
     async def cog_load(self):
         await self.init_database()
+        self.listener_connection = await self.bot.db.acquire()
+        await self.listener_connection.add_listener("tag_changed", self.on_tag_changed)
+
+    async def cog_unload(self):
+        if self.listener_connection:
+            await self.listener_connection.remove_listener("tag_changed", self.on_tag_changed)
+            await self.bot.db.release(self.listener_connection)
+
+    def on_tag_changed(self, connection, pid, channel, payload):
+        self.bot.loop.create_task(self.refresh_guild(int(payload)))
+
     async def refresh_cache(self):
-        self.tags = {}
-        all_tags = await self.bot.db.fetch("""
-            SELECT name, guild_id from tag
-            ORDER BY guild_id, name
+        rows = await self.bot.db.fetch("""
+            SELECT tag_alias.guild_id, tag_alias.name AS alias, tag.tag_id, tag.name, tag.content
+            FROM tag_alias
+            INNER JOIN tag ON tag.tag_id = tag_alias.tag_id
         """)
-        for tag in all_tags:
-            if tag.get("guild_id") not in self.tags:
-                self.tags[tag['guild_id']] = [tag.get('name')]
-            else:
-                self.tags[tag['guild_id']].append(tag.get('name'))
+        by_guild = defaultdict(list)
+        for row in rows:
+            by_guild[row['guild_id']].append(row)
+        self.tag_cache = {guild_id: GuildTags(guild_rows) for guild_id, guild_rows in by_guild.items()}
+
+    async def refresh_guild(self, guild_id):
+        rows = await self.bot.db.fetch("""
+            SELECT tag_alias.name AS alias, tag.tag_id, tag.name, tag.content
+            FROM tag_alias
+            INNER JOIN tag ON tag.tag_id = tag_alias.tag_id
+            WHERE tag_alias.guild_id = $1
+        """, guild_id)
+        self.tag_cache[guild_id] = GuildTags(rows)
+
+    def get_tag(self, guild_id, alias):
+        guild_tags = self.tag_cache.get(guild_id)
+        return guild_tags.get(alias) if guild_tags else None
 
     async def init_database(self):
         await self.bot.db.execute("""
@@ -55,19 +136,30 @@ class Tags(commands.Cog):
                 tag_id BIGINT REFERENCES tag(tag_id) ON DELETE CASCADE
             );
         """)
+        # every change to a tag or alias notifies the listener with the guild id, so the cache is rebuilt
+        await self.bot.db.execute("""
+            CREATE OR REPLACE FUNCTION notify_tag_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('tag_changed', COALESCE(NEW.guild_id, OLD.guild_id)::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        async with self.bot.db.acquire() as connection:
+            async with connection.transaction():
+                for table in ("tag", "tag_alias"):
+                    await connection.execute(f"DROP TRIGGER IF EXISTS {table}_changed ON {table}")
+                    await connection.execute(f"""
+                        CREATE TRIGGER {table}_changed AFTER INSERT OR UPDATE OR DELETE ON {table}
+                        FOR EACH ROW EXECUTE FUNCTION notify_tag_changed()
+                    """)
         await self.refresh_cache()
     tags = app_commands.Group(name="tag", description="Commands for handling tags and quickly calling said tags.")
 
     @tags.command(name="get", description="get content of a tag")
     @app_commands.describe(tag="the name of the tag to use")
     async def app_tag(self, interaction: discord.Interaction, tag: str) -> None:
-        result = await self.bot.db.fetchval("""
-            SELECT content
-            FROM tag_alias  
-            INNER JOIN  tag ON tag.tag_id = tag_alias.tag_id
-            WHERE tag_alias.name=$1
-            AND tag_alias.guild_id=$2
-        """, tag, interaction.guild.id)
+        result = self.get_tag(interaction.guild_id, tag)
         if result:
             await interaction.response.send_message(result, allowed_mentions=discord.AllowedMentions.none())
         else:
@@ -75,11 +167,10 @@ class Tags(commands.Cog):
 
     @app_tag.autocomplete("tag")
     async def tag_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice]:
-        guild = interaction.guild_id
-        if guild and guild in self.tags:
-            return [app_commands.Choice(name=t, value=t) for t in self.tags[guild] if current.lower() in t.lower()][:25]
-        else:
+        guild_tags = self.tag_cache.get(interaction.guild_id)
+        if not guild_tags:
             return []
+        return [app_commands.Choice(name=t, value=t) for t in guild_tags.search(current)]
 
     @commands.group(invoke_without_command=True)
     async def tag(self, ctx, *, name):
@@ -87,13 +178,7 @@ class Tags(commands.Cog):
         Command for posting a tag into the current channel
         usable by everyone
         """
-        result = await self.bot.db.fetchval("""
-            SELECT content
-            FROM tag_alias  
-            INNER JOIN  tag ON tag.tag_id = tag_alias.tag_id
-            WHERE tag_alias.name=$1
-            AND tag_alias.guild_id=$2
-        """, name, ctx.guild.id)
+        result = self.get_tag(ctx.guild.id, name)
         if result:
             await ctx.send(result, allowed_mentions=discord.AllowedMentions.none())
         else:
@@ -107,11 +192,8 @@ class Tags(commands.Cog):
         """
         if name in ("add", "search", "alias", "remove", "rm", "delete", "update", "edit", "update"):
             return await ctx.send(f"the name `{name}` is a reserved name of a tag subcommand please use a different name.")
-        result = await self.bot.db.fetchval("""
-            SELECT name FROM tag_alias WHERE name=$1 AND guild_id=$2
-        """, name, ctx.guild.id)
-        if result:
-            await ctx.send("tag already exists choose a different name")
+        if self.get_tag(ctx.guild.id, name):
+            return await ctx.send("tag already exists choose a different name")
         if len(content) > 2000:
             return await ctx.send("tag content too long I can only send messages of length 2000")
         else:
@@ -123,8 +205,8 @@ class Tags(commands.Cog):
                 )
             INSERT INTO tag_alias(guild_id, name, tag_id) VALUES ($1, $2, (SELECT tag_id FROM tag_insert))
             """, ctx.guild.id, name, content)
+            await self.refresh_guild(ctx.guild.id)
             await ctx.send(f"tag `{name}` created.")
-            await self.refresh_cache()
 
     @tag.command(name="edit", aliases=["update"])
     @checks.is_owner_or_moderator()
@@ -142,6 +224,7 @@ class Tags(commands.Cog):
             await self.bot.db.execute("""
             UPDATE tag SET content=$1 WHERE tag_id=$2 AND guild_id = $3
             """, content, result, ctx.guild.id)
+            await self.refresh_guild(ctx.guild.id)
             await ctx.send(f"tag `{name}` edited.")
         else:
             await ctx.send(f"tag {name} doesn't exist")
@@ -160,6 +243,7 @@ class Tags(commands.Cog):
             RETURNING tag_id
         """, ctx.guild.id , name)
         if tag_id:
+            await self.refresh_guild(ctx.guild.id)
             await ctx.send(f"tag `{name}` deleted")
         else:
             await ctx.send(f"tag `{name}` not found")
@@ -170,16 +254,8 @@ class Tags(commands.Cog):
         Search for a tag, query must be contained inside the tag name 
         for example `.tag search test` will find `test` and `testtest` and `detestable`
         """
-        results = await self.bot.db.fetch("""
-            SELECT t.name
-            FROM tag_alias t 
-            WHERE name LIKE $1
-            AND guild_id = $2
-            LIMIT 100;
-        """, f"%{query}%", ctx.guild.id)
-        entries = []
-        for result in results:
-            entries.append(result.get('name'))
+        guild_tags = self.tag_cache.get(ctx.guild.id)
+        entries = guild_tags.search(query, limit=100) if guild_tags else []
         if entries:
             source = TagList(entries, per_page=10)
             view = views.PaginatedView(source)
@@ -192,13 +268,8 @@ class Tags(commands.Cog):
         """
         List all tags of the bot
         """
-        results = await self.bot.db.fetch("""
-            SELECT t.name
-            FROM tag t 
-            WHERE guild_id = $1
-            LIMIT 100;
-        """, ctx.guild.id)
-        entries = [t.get('name') for t in results]
+        guild_tags = self.tag_cache.get(ctx.guild.id)
+        entries = sorted(guild_tags.names.values())[:100] if guild_tags else []
         if entries:
             source = TagList(entries, per_page=10)
             view = views.PaginatedView(source)
@@ -229,6 +300,7 @@ class Tags(commands.Cog):
         await self.bot.db.execute("""
             INSERT INTO tag_alias (name, tag_id, guild_id) VALUES ($1, $2, $3)
         """, alias, tag.get("tag_id"), ctx.guild.id)
+        await self.refresh_guild(ctx.guild.id)
         await ctx.send(f"tag `{name}` now has the alias `{alias}`")
 
 
@@ -247,6 +319,7 @@ class Tags(commands.Cog):
             RETURNING tag_id
         """, ctx.guild.id , alias)
         if tag_id:
+            await self.refresh_guild(ctx.guild.id)
             await ctx.send(f"tag alias `{alias}` deleted")
         else:
             await ctx.send(f"tag alias `{alias}` not found")
@@ -2,6 +2,10 @@ from typing import Optional
 from discord.ext import commands
 from .utils import checks
 from .utils.dataIO import DataIO
+from .utils.join_order import JoinOrderIndex
+from .utils.cache import TTLCache
+from .utils.ratelimit import TokenBucket
+from .utils.name_history import NameHistoryRecorder
 from discord import Member, User, Embed, Role, utils, ActivityType
 import discord
 from datetime import datetime,timedelta, timezone
@@ -11,6 +15,13 @@ from typing import Union, Optional
 import json
 
 snowflake_regex = re.compile(r"(\d{17,19})")
+# fetched users only differ from the cached ones by their banner which rarely changes
+FETCHED_USER_TTL = 30 * 60
+# (requests, per seconds) of banner fetches for userinfo, beyond that the banner is skipped
+BANNER_FETCH_LIMIT = (10, 60)
+NAME_HISTORY_LIMIT = 20
+forbidden_word_regex = re.compile(r'(trap|nigg(a|er)|fag(got)?)')
+
 class ShowAllAvatars(discord.ui.View):
 
     def __init__(self, member: Union[discord.Member, discord.User]):
@@ -37,7 +48,12 @@ class CustomMemberOrUserConverter(commands.MemberConverter):
         try:
             return await super().convert(ctx, argument)
         except (commands.CommandError, commands.BadArgument):
-            return await ctx.bot.fetch_user(argument)
+            if not argument.isdigit():
+                raise
+            user_id = int(argument)
+            if isinstance(ctx.cog, Userinfo):
+                return await ctx.cog.fetch_user(user_id)
+            return await ctx.bot.fetch_user(user_id)
 
 class ObjectConverter(commands.Converter):
     async def convert(self, ctx, argument):
@@ -55,10 +71,35 @@ class Userinfo(commands.Cog):
     """show infos about the current or other users"""
     def __init__(self, bot):
         self.bot = bot
+        self.join_order = JoinOrderIndex()
+        self.fetched_users = TTLCache(ttl=FETCHED_USER_TTL)
+        self.banner_budget = TokenBucket(*BANNER_FETCH_LIMIT)
 
     async def cog_load(self):
+        self.name_history = NameHistoryRecorder(self.bot.db)
         self.bot.loop.create_task(self.create_name_tables())
 
+    async def cog_unload(self):
+        await self.name_history.close()
+
+    async def fetch_user(self, user_id):
+        """
+        fetch a user over the api, concurrent lookups of the same user share one request
+        """
+        return await self.fetched_users.get_or_fetch(user_id, lambda: self.bot.fetch_user(user_id))
+
+    async def fetch_banner(self, user):
+        """
+        the banner of the user or None, the banner is skipped if it isn't cached and the fetch budget is used up
+        """
+        fetched = self.fetched_users.get(user.id)
+        if fetched is None:
+            if self.banner_budget.delay(time.monotonic()):
+                return None
+            self.banner_budget.consume()
+            fetched = await self.fetch_user(user.id)
+        return fetched.banner
+
     @commands.command()
     async def userinfo(self,ctx, *, member: Optional[CustomMemberOrUserConverter]):
         """shows the info about yourself or another user"""
@@ -83,14 +124,14 @@ class Userinfo(commands.Cog):
             nick = member.name
         member_number = 1
         if ctx.guild:
-            server = ctx.message.guild
-            member_number = sorted(server.members, key=lambda m: m.joined_at).index(member) + 1
+            member_number = self.join_order.member_number(member)
         embed = Embed(description="[{0} - {1}]({2})".format(member, nick, avatar_url), color=user_color)
         embed.set_thumbnail(url=avatar_url)
         try:
-            user = await self.bot.fetch_user(member.id)
-            embed.set_image(url=user.banner.url)
-        except:
+            banner = await self.fetch_banner(member)
+            if banner:
+                embed.set_image(url=banner.url)
+        except discord.HTTPException:
             pass
 
         embed.add_field(name="Joined Discord on",
@@ -189,33 +230,35 @@ class Userinfo(commands.Cog):
         await ctx.send(embed=embed)
 
 
-    async def fetch_names(self, member):
-        async with self.bot.db.acquire() as con:
-            stmt = await con.prepare('''
-                SELECT *
-                FROM (
-                    SELECT DISTINCT ON (name) *
-                    from names
-                    where user_id = $1
-                 ) p
-                ORDER BY change_date DESC
-                LIMIT 20
-            ''')
-            return await stmt.fetch(member.id)
-
-    async def fetch_nicknames(self, member):
-        async with self.bot.db.acquire() as con:
-            stmt = await con.prepare('''
-                SELECT *
-                FROM (
-                    SELECT DISTINCT ON (nickname) *
-                    from nicknames
-                    where user_id = $1
-                 ) p
-                ORDER BY change_date DESC
-                LIMIT 20
-            ''')
-            return await stmt.fetch(member.id)
+    async def fetch_names(self, member, limit=NAME_HISTORY_LIMIT, before=None):
+        """
+        the last used distinct names of the member, newest first.
+        pass the change_date of the last row as `before` for the next page
+        """
+        return await self.bot.db.fetch('''
+            SELECT name, max(change_date) AS change_date
+            FROM names
+            WHERE user_id = $1
+            GROUP BY name
+            HAVING $2::timestamp IS NULL OR max(change_date) < $2
+            ORDER BY max(change_date) DESC
+            LIMIT $3
+        ''', member.id, before, limit)
+
+    async def fetch_nicknames(self, member, limit=NAME_HISTORY_LIMIT, before=None):
+        """
+        the last used distinct nicknames of the member, newest first.
+        pass the change_date of the last row as `before` for the next page
+        """
+        return await self.bot.db.fetch('''
+            SELECT nickname, max(change_date) AS change_date
+            FROM nicknames
+            WHERE user_id = $1
+            GROUP BY nickname
+            HAVING $2::timestamp IS NULL OR max(change_date) < $2
+            ORDER BY max(change_date) DESC
+            LIMIT $3
+        ''', member.id, before, limit)
 
     async def create_name_tables(self):
         query = '''
@@ -229,6 +272,8 @@ class Userinfo(commands.Cog):
                     nickname varchar(32),
                     change_date timestamp
                 );
+                CREATE INDEX IF NOT EXISTS names_user_id_change_date_idx ON names (user_id, change_date DESC);
+                CREATE INDEX IF NOT EXISTS nicknames_user_id_change_date_idx ON nicknames (user_id, change_date DESC);
         '''
         async with self.bot.db.acquire() as con:
             async with con.transaction():
@@ -266,6 +311,7 @@ class Userinfo(commands.Cog):
         """
         if not member:
             member = ctx.message.author
+        await self.name_history.flush()
         data_names = await self.fetch_names(member)
         data_nicknames = await self.fetch_nicknames(member)
         nickname_list = []
@@ -284,33 +330,33 @@ class Userinfo(commands.Cog):
         display_names_list_str = discord.utils.escape_markdown(", ".join(nickname_list))
         await ctx.send(message_fmt.format(names_list_str, display_names_list_str))
 
+    @commands.Cog.listener("on_member_join")
+    async def add_to_join_order(self, member):
+        self.join_order.add(member)
+
+    @commands.Cog.listener("on_member_remove")
+    async def remove_from_join_order(self, member):
+        self.join_order.remove(member)
+
+    @commands.Cog.listener("on_guild_remove")
+    async def discard_join_order(self, guild):
+        self.join_order.discard_guild(guild)
+
     @commands.Cog.listener("on_member_update")
     async def save_nickname_change(self, before, after):
-        forbidden_word_regex = re.compile(r'(trap|nigg(a|er)|fag(got)?)')
+        if before.nick == after.nick or not after.nick:
+            return
         if forbidden_word_regex.search(before.display_name) or forbidden_word_regex.search(after.display_name):
             return
-        if before.nick != after.nick and after.nick:
-            async with self.bot.db.acquire() as con:
-                stmt = await con.prepare('''
-                               INSERT INTO nicknames VALUES ($1,$2,current_timestamp)
-                               RETURNING *
-                           ''')
-                async with con.transaction():
-                    new_row = await stmt.fetch(after.id, after.nick)
+        self.name_history.record("nicknames", after.id, after.nick)
 
     @commands.Cog.listener("on_user_update")
     async def save_username_change(self, before, after):
-        forbidden_word_regex = re.compile(r'(trap|nigg(a|er)|fag(got)?)')
+        if before.name == after.name:
+            return
         if forbidden_word_regex.search(before.name) or forbidden_word_regex.search(after.name):
             return
-        if before.name != after.name:
-            async with self.bot.db.acquire() as con:
-                stmt = await con.prepare('''
-                    INSERT INTO names VALUES ($1,$2,current_timestamp)
-                    RETURNING *
-                ''')
-                async with con.transaction():
-                    new_row = await stmt.fetch(after.id, after.name)
+        self.name_history.record("names", after.id, after.name)
 
 
 
@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+import numpy as np
+
+# cards are ints 0-51: rank * 4 + suit, ranks go A, 2-10, J, Q, K
+SUITS = ("\N{WHITE HEART SUIT}", "\N{WHITE SPADE SUIT}", "\N{WHITE DIAMOND SUIT}", "\N{WHITE CLUB SUIT}")
+FACES = ("A", "2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K")
+FULL_DECK = tuple(range(len(FACES) * len(SUITS)))
+# aces count as 1 here, the hand adds 10 if that doesn't bust it
+CARD_VALUES = tuple(min(card // 4 + 1, 10) for card in FULL_DECK)
+CARD_NAMES = tuple(f"{FACES[card // 4]}{SUITS[card % 4]}" for card in FULL_DECK)
+DECK_VALUES = np.array(CARD_VALUES, dtype=np.int8)
+
+BLACKJACK = 21
+DEALER_STANDS_ON = 17
+
+
+class Hand:
+    """cards of a hand with the total kept up to date on every added card"""
+    __slots__ = ('cards', 'hard_total', 'aces')
+
+    def __init__(self, cards=()):
+        self.cards = []
+        self.hard_total = 0
+        self.aces = 0
+        for card in cards:
+            self.add(card)
+
+    def add(self, card):
+        self.cards.append(card)
+        value = CARD_VALUES[card]
+        self.hard_total += value
+        if value == 1:
+            self.aces += 1
+
+    @property
+    def is_soft(self):
+        """an ace is counted as 11"""
+        return self.aces > 0 and self.hard_total <= 11
+
+    @property
+    def value(self):
+        return self.hard_total + 10 if self.is_soft else self.hard_total
+
+    @property
+    def is_blackjack(self):
+        return len(self.cards) == 2 and self.value == BLACKJACK
+
+    def format(self, stop=None):
+        return ', '.join(CARD_NAMES[card] for card in self.cards[:stop])
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+    def __str__(self):
+        return self.format()
+
+
+def card_value(card):
+    """value of a single card with an ace counted as 11"""
+    value = CARD_VALUES[card]
+    return 11 if value == 1 else value
+
+
+@dataclass
+class SimulationResult:
+    hands: int
+    wins: int
+    losses: int
+    pushes: int
+    blackjacks: int
+    total_return: float
+
+    @property
+    def expected_return(self):
+        """average win per bet of 1, negative values are the house edge"""
+        return self.total_return / self.hands if self.hands else 0.0
+
+
+def _hand_values(hard_totals, aces):
+    return np.where(aces & (hard_totals <= 11), hard_totals + 10, hard_totals)
+
+
+def _draw(decks, positions, hard_totals, aces, drawing):
+    rows = np.flatnonzero(drawing)
+    cards = decks[rows, positions[rows]]
+    hard_totals[rows] += cards
+    aces[rows] |= cards == 1
+    positions[rows] += 1
+
+
+def simulate(hands, player_stands_on=DEALER_STANDS_ON, blackjack_payout=1.5,
+             dealer_stands_on=DEALER_STANDS_ON, chunk_size=200_000, seed=None):
+    """
+    play `hands` rounds with the rules of the blackjack game (fresh deck every round,
+    dealer stands on all 17s, naturals pay `blackjack_payout`) with a player that hits
+    below `player_stands_on`. all rounds of a chunk are played at once with numpy.
+    """
+    rng = np.random.default_rng(seed)
+    wins = losses = pushes = blackjacks = 0
+    total_return = 0.0
+    for start in range(0, hands, chunk_size):
+        count = min(chunk_size, hands - start)
+        decks = rng.permuted(np.tile(DECK_VALUES, (count, 1)), axis=1).astype(np.int16)
+        # dealt like the game: two cards for the dealer, then two for the player
+        dealer_hard = decks[:, 0] + decks[:, 1]
+        dealer_aces = (decks[:, 0] == 1) | (decks[:, 1] == 1)
+        player_hard = decks[:, 2] + decks[:, 3]
+        player_aces = (decks[:, 2] == 1) | (decks[:, 3] == 1)
+        positions = np.full(count, 4)
+
+        dealer_natural = _hand_values(dealer_hard, dealer_aces) == BLACKJACK
+        player_natural = _hand_values(player_hard, player_aces) == BLACKJACK
+
+        drawing = ~player_natural & (_hand_values(player_hard, player_aces) < player_stands_on)
+        while drawing.any():
+            _draw(decks, positions, player_hard, player_aces, drawing)
+            drawing &= _hand_values(player_hard, player_aces) < player_stands_on
+        player_values = _hand_values(player_hard, player_aces)
+        player_bust = player_values > BLACKJACK
+
+        drawing = ~player_natural & ~player_bust & (_hand_values(dealer_hard, dealer_aces) < dealer_stands_on)
+        while drawing.any():
+            _draw(decks, positions, dealer_hard, dealer_aces, drawing)
+            drawing &= _hand_values(dealer_hard, dealer_aces) < dealer_stands_on
+        dealer_values = _hand_values(dealer_hard, dealer_aces)
+
+        natural_win = player_natural & ~dealer_natural
+        natural_push = player_natural & dealer_natural
+        played = ~player_natural
+        win = played & ~player_bust & ((dealer_values > BLACKJACK) | (player_values > dealer_values))
+        loss = played & (player_bust | ((dealer_values <= BLACKJACK) & (player_values < dealer_values)))
+        push = natural_push | (played & ~win & ~loss)
+
+        wins += int(win.sum() + natural_win.sum())
+        losses += int(loss.sum())
+        pushes += int(push.sum())
+        blackjacks += int(natural_win.sum())
+        total_return += float(win.sum() - loss.sum() + natural_win.sum() * blackjack_payout)
+    return SimulationResult(hands, wins, losses, pushes, blackjacks, total_return)
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    dict like cache whose entries expire `ttl` seconds after they were stored,
+    beyond `maxsize` entries the oldest ones are dropped.
+    None values are kept for `negative_ttl` seconds instead (e.g. for 404 responses).
+    """
+
+    def __init__(self, ttl, maxsize=1024, negative_ttl=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self._data = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    async def get_or_fetch(self, key, fetch):
+        """
+        return the cached value or await `fetch()` and cache its result,
+        concurrent calls for the same key share a single fetch.
+        nothing gets cached if fetch raises an exception.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.ensure_future(fetch())
+            pending.add_done_callback(lambda future: self._store(key, future))
+        return await asyncio.shield(pending)
+
+    def _store(self, key, future):
+        self._pending.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.set(key, future.result())
@@ -1,15 +1,11 @@
 from discord.ext import commands
-from discord.utils import find
-import json
 import discord
-from os import path
+from .permissions import permissions
 
 
 
 def is_owner_check(message):
-    with open('data/credentials.json', 'r') as f:
-        credentials = json.load(f)
-        return message.author.id == int(credentials['owner'])
+    return permissions.is_owner(message.author.id)
 
 
 def is_owner():
@@ -61,17 +57,5 @@ def channel_only(*channels):
     return commands.check(predicate)
 
 def user_is_in_whitelist_server(bot: commands.Bot, user: discord.User):
-    if not path.exists('data/server_whitelist.json'):
-        f = open('data/server_whitelist.json', 'w')
-        json.dump([], f)
-        f.close()
-    with open('data/server_whitelist.json') as f:
-        server_whitelist = json.load(f)
-        for server_id in server_whitelist:
-            server = bot.get_guild(server_id)
-            if server:
-                member = find(lambda m: m.id == user.id, server.members)
-                if member:
-                    return True
-        return False
+    return permissions.in_whitelist_server(bot, user.id)
 
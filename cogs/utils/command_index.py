@@ -0,0 +1,78 @@
+from collections import defaultdict
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+TRIGRAM_MIN_LENGTH = 3
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CommandIndex:
+    """
+    suggestion index over all command names, aliases and qualified subcommand names.
+    a trigram index narrows the names down to the ones sharing a trigram with the input,
+    only those get scored by edit distance. rebuilt whenever the loaded cogs change.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.names = {}
+        self.trigrams = defaultdict(set)
+
+    def _build(self, bot):
+        names = {}
+        for command in bot.walk_commands():
+            parent = command.full_parent_name
+            for name in (command.name, *command.aliases):
+                names[f"{parent} {name}" if parent else name] = command.qualified_name
+        index = defaultdict(set)
+        for name in names:
+            for trigram in trigrams(name):
+                index[trigram].add(name)
+        self.names = names
+        self.trigrams = index
+
+    def refresh(self, bot):
+        # reloading an extension creates new cog instances, so their ids change
+        key = tuple(id(cog) for cog in bot.cogs.values()), len(bot.all_commands)
+        if key != self.key:
+            self._build(bot)
+            self.key = key
+
+    def candidates(self, text):
+        if len(text) < TRIGRAM_MIN_LENGTH:
+            return self.names.keys()
+        candidates = set()
+        for trigram in trigrams(text):
+            candidates |= self.trigrams.get(trigram, set())
+        return candidates or self.names.keys()
+
+    def ranked(self, bot, text, limit=50):
+        """
+        (qualified name, edit distance) of the commands closest to `text`, closest first
+        """
+        self.refresh(bot)
+        text = text.lower()
+        results = process.extract(text, self.candidates(text), scorer=Levenshtein.distance, limit=limit)
+        ranked = {}
+        for name, distance, _ in results:
+            ranked.setdefault(self.names[name], distance)
+        return list(ranked.items())
+
+
+def closest(ranked):
+    """the names of `ranked` (name, distance) pairs that share the smallest distance"""
+    if not ranked:
+        return []
+    best = min(distance for _, distance in ranked)
+    return [name for name, distance in ranked if distance == best]
+
+
+def get_command_index(bot):
+    index = getattr(bot, 'command_index', None)
+    if index is None:
+        index = bot.command_index = CommandIndex()
+    return index
@@ -1,6 +1,7 @@
 import logging
 from os import path
 import json
+from .settings_store import write_atomic
 class DataIO():
     def __init__(self):
         self.logger = logging.getLogger("PoutyBot")
@@ -9,9 +10,8 @@ class DataIO():
     def save_json(self, filename, data):
         """save file as json file at file path"""
         file_path = self.data_path+filename+".json"
-        with open(self.data_path+filename+".json", encoding="utf-8", mode="w") as file:
-            json.dump(data, file)
-            self.logger.info("save info to {}".format(file_path))
+        write_atomic(file_path, json.dumps(data))
+        self.logger.info("save info to {}".format(file_path))
         return data
 
     def load_json(self, filename, as_list=False):
@@ -5,3 +5,26 @@ class DisabledCommandException(commands.CheckFailure):
     pass
 class BlackListedException(commands.CheckFailure):
     pass
+
+
+class UpstreamUnavailable(commands.CommandError):
+    def __init__(self, host, retry_after, message):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(message)
+class RateLimited(UpstreamUnavailable):
+    def __init__(self, host, retry_after):
+        super().__init__(host, retry_after, f"Too many requests to {host}, please retry in {int(retry_after) + 1} seconds")
+class CircuitOpen(UpstreamUnavailable):
+    def __init__(self, host, retry_after):
+        super().__init__(host, retry_after, f"{host} is currently not responding, please retry in {int(retry_after) + 1} seconds")
+
+
+class InsufficientFunds(commands.CommandError):
+    def __init__(self, user_id, message="Sorry you don't have enough money for this transfer"):
+        self.user_id = user_id
+        super().__init__(message)
+class NoAccount(commands.CommandError):
+    def __init__(self, user_id, message="No bank account create one with `.payday`"):
+        self.user_id = user_id
+        super().__init__(message)
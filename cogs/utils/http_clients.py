@@ -0,0 +1,120 @@
+import aiohttp
+import asyncio
+import httpx
+import time
+from collections import Counter, defaultdict
+from .exceptions import UpstreamUnavailable
+from .ratelimit import HostLimiter
+
+DEFAULT_TIMEOUT = 30
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 10
+KEEPALIVE_TIMEOUT = 30
+DNS_CACHE_TTL = 300
+
+
+class HostMetrics:
+    """request statistics for a single upstream host"""
+    __slots__ = ('requests', 'errors', 'total_time', 'status_codes')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.status_codes = Counter()
+
+    @property
+    def average_time(self):
+        if not self.requests:
+            return 0.0
+        return self.total_time / self.requests
+
+    def record(self, status, elapsed):
+        self.requests += 1
+        self.total_time += elapsed
+        self.status_codes[status] += 1
+        if status >= 400:
+            self.errors += 1
+
+    def record_error(self, elapsed):
+        self.requests += 1
+        self.errors += 1
+        self.total_time += elapsed
+
+
+class HTTPClients:
+    """
+    registry for the http clients shared between all cogs
+    holds one aiohttp session and one httpx client with pooled connections,
+    dns caching and the same default timeout and collects per host metrics for both.
+    every request goes through the per host rate limiter and circuit breaker in `limiter`.
+    cogs should borrow the clients via `bot.session` and `bot.http_clients.httpx`
+    and never close them themselves.
+    """
+
+    def __init__(self):
+        self.metrics = defaultdict(HostMetrics)
+        self.limiter = HostLimiter()
+        self.session = None
+        self.httpx = None
+
+    async def start(self):
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT,
+                                         limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                                         keepalive_timeout=KEEPALIVE_TIMEOUT,
+                                         ttl_dns_cache=DNS_CACHE_TTL)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT),
+                                             trace_configs=[trace_config])
+        self.httpx = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT,
+                                       limits=httpx.Limits(max_connections=CONNECTION_LIMIT,
+                                                           max_keepalive_connections=CONNECTION_LIMIT_PER_HOST,
+                                                           keepalive_expiry=KEEPALIVE_TIMEOUT),
+                                       event_hooks={
+                                           'request': [self._on_httpx_request],
+                                           'response': [self._on_httpx_response]
+                                       })
+        return self
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+        if self.httpx:
+            await self.httpx.aclose()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _on_request_start(self, session, context, params):
+        await self.limiter.acquire(params.url.host)
+        context.start = time.monotonic()
+
+    async def _on_request_end(self, session, context, params):
+        host = params.url.host
+        self.limiter.record_response(host, params.response.status, params.response.headers)
+        self.metrics[host].record(params.response.status, time.monotonic() - context.start)
+
+    async def _on_request_exception(self, session, context, params):
+        if isinstance(params.exception, UpstreamUnavailable):
+            return
+        host = params.url.host
+        if isinstance(params.exception, (aiohttp.ClientError, asyncio.TimeoutError)):
+            self.limiter.record_failure(host)
+        self.metrics[host].record_error(time.monotonic() - getattr(context, 'start', time.monotonic()))
+
+    async def _on_httpx_request(self, request):
+        await self.limiter.acquire(request.url.host)
+        request.extensions['start'] = time.monotonic()
+
+    async def _on_httpx_response(self, response):
+        host = response.request.url.host
+        start = response.request.extensions.get('start', time.monotonic())
+        self.limiter.record_response(host, response.status_code, response.headers)
+        self.metrics[host].record(response.status_code, time.monotonic() - start)
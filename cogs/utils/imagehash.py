@@ -0,0 +1,102 @@
+from PIL import Image
+from collections import Counter
+import io
+import numpy as np
+import time
+
+HASH_SIZE = 8
+PHASH_SCALE = 4
+
+
+def _dct_matrix(size):
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix * np.sqrt(2 / size)
+
+
+_DCT = _dct_matrix(HASH_SIZE * PHASH_SCALE)
+
+
+def _to_int(bits):
+    return int(np.packbits(bits.flatten()).view('>u8')[0])
+
+
+def dhash(image: Image.Image) -> int:
+    """64 bit difference hash: compares each pixel with its right neighbour on a 9x8 grayscale thumbnail"""
+    pixels = np.asarray(image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+    return _to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(image: Image.Image) -> int:
+    """64 bit perceptual hash: the low frequencies of the DCT of a 32x32 grayscale thumbnail compared to their median"""
+    size = HASH_SIZE * PHASH_SCALE
+    pixels = np.asarray(image.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _to_int(low_frequencies > np.median(low_frequencies))
+
+
+def phash_bytes(data: bytes) -> int:
+    """hash the first frame of an encoded image, meant to be run in an executor"""
+    with Image.open(io.BytesIO(data)) as image:
+        return phash(image)
+
+
+class ImageHashCache:
+    """
+    cache for search results keyed by the perceptual hash of the searched image
+    a lookup is a hit if a stored hash is within `max_distance` bits (hamming distance)
+    of the searched hash, so re-encoded or slightly resized copies are found as well
+    """
+
+    def __init__(self, max_distance=6, max_entries=5000, ttl=7 * 24 * 3600):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.entries = []
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def _find(self, image_hash):
+        if not self.entries:
+            return None
+        # hamming distance to every stored hash at once
+        distances = np.unpackbits((self.hashes ^ np.uint64(image_hash)).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+        index = int(distances.argmin())
+        if distances[index] > self.max_distance:
+            return None
+        return index
+
+    def get(self, engine, image_hash):
+        """return the cached results of the engine for a similar image or None"""
+        index = self._find(image_hash)
+        if index is not None:
+            created, results = self.entries[index]
+            if engine in results and time.monotonic() - created < self.ttl:
+                self.hits[engine] += 1
+                return results[engine]
+        self.misses[engine] += 1
+        return None
+
+    def put(self, engine, image_hash, results):
+        index = self._find(image_hash)
+        if index is not None:
+            created, cached = self.entries[index]
+            if time.monotonic() - created < self.ttl:
+                cached[engine] = results
+            else:
+                self.entries[index] = (time.monotonic(), {engine: results})
+                self.hashes[index] = np.uint64(image_hash)
+            return
+        self.entries.append((time.monotonic(), {engine: results}))
+        self.hashes = np.append(self.hashes, np.uint64(image_hash))
+        if len(self.entries) > self.max_entries:
+            overflow = len(self.entries) - self.max_entries
+            del self.entries[:overflow]
+            self.hashes = self.hashes[overflow:]
+
+    def hit_rate(self, engine=None):
+        hits = self.hits[engine] if engine else sum(self.hits.values())
+        total = hits + (self.misses[engine] if engine else sum(self.misses.values()))
+        return hits / total if total else 0.0
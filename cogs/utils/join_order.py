@@ -0,0 +1,71 @@
+from bisect import bisect_left, insort
+
+
+def join_key(member):
+    # members without a join date (shouldn't happen for cached members) go to the end
+    joined_at = member.joined_at.timestamp() if member.joined_at else float('inf')
+    return joined_at, member.id
+
+
+class JoinOrder:
+    """
+    members of a guild sorted by their join date, the member number is a binary search.
+    new members join at the end so adding them is an append.
+    """
+
+    def __init__(self, members=()):
+        self.keys = sorted(join_key(member) for member in members)
+        self.by_member = {member_id: (joined_at, member_id) for joined_at, member_id in self.keys}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, member):
+        if member.id in self.by_member:
+            self.remove(member)
+        key = join_key(member)
+        self.by_member[member.id] = key
+        insort(self.keys, key)
+
+    def remove(self, member):
+        key = self.by_member.pop(member.id, None)
+        if key is None:
+            return
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+
+    def member_number(self, member):
+        """1-based position of the member in the join order"""
+        key = self.by_member.get(member.id, join_key(member))
+        return bisect_left(self.keys, key) + 1
+
+
+class JoinOrderIndex:
+    """guild id -> JoinOrder, built on first use and kept up to date with the member events"""
+
+    def __init__(self):
+        self.guilds = {}
+
+    def get(self, guild):
+        join_order = self.guilds.get(guild.id)
+        # rebuild if members were missed, e.g. the index was built before the guild was chunked
+        if join_order is None or len(join_order) != len(guild.members):
+            join_order = self.guilds[guild.id] = JoinOrder(guild.members)
+        return join_order
+
+    def member_number(self, member):
+        return self.get(member.guild).member_number(member)
+
+    def add(self, member):
+        join_order = self.guilds.get(member.guild.id)
+        if join_order is not None:
+            join_order.add(member)
+
+    def remove(self, member):
+        join_order = self.guilds.get(member.guild.id)
+        if join_order is not None:
+            join_order.remove(member)
+
+    def discard_guild(self, guild):
+        self.guilds.pop(guild.id, None)
@@ -0,0 +1,65 @@
+from .exceptions import InsufficientFunds, NoAccount
+
+# asyncpg keeps prepared statements per connection in its statement cache,
+# so using the same query text on a pooled connection reuses the prepared statement
+ADJUST_QUERY = """
+    UPDATE payday SET money = money + $2
+    WHERE user_id = $1 AND money + $2 >= 0
+    RETURNING money
+"""
+# locks the accounts in user id order so concurrent transfers can't deadlock
+TRANSFER_QUERY = """
+    WITH locked AS (
+        SELECT user_id FROM payday
+        WHERE user_id = ANY($1::bigint[])
+        ORDER BY user_id
+        FOR UPDATE
+    )
+    UPDATE payday SET money = payday.money + changes.delta
+    FROM unnest($1::bigint[], $2::bigint[]) AS changes(user_id, delta)
+    INNER JOIN locked ON locked.user_id = changes.user_id
+    WHERE payday.user_id = changes.user_id AND payday.money + changes.delta >= 0
+    RETURNING payday.user_id, payday.money
+"""
+
+
+class Ledger:
+    """
+    money updates of the payday accounts as single statements,
+    the balance check and the update happen in the database so concurrent games can't lose updates
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def balance(self, user_id):
+        return await self.pool.fetchval("SELECT money FROM payday WHERE user_id = $1", user_id)
+
+    async def adjust(self, user_id, delta):
+        """add `delta` (can be negative) to the account and return the new balance"""
+        async with self.pool.acquire() as connection:
+            money = await connection.fetchval(ADJUST_QUERY, user_id, delta)
+            if money is None:
+                await self._raise_failure(connection, user_id)
+            return money
+
+    async def transfer(self, changes):
+        """
+        apply {user_id: delta} to all accounts in one transaction and return {user_id: new balance},
+        nothing is changed if one account is missing or would go below 0
+        """
+        user_ids = list(changes)
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                rows = await connection.fetch(TRANSFER_QUERY, user_ids, [changes[u] for u in user_ids])
+                balances = {row['user_id']: row['money'] for row in rows}
+                for user_id in user_ids:
+                    if user_id not in balances:
+                        # raising rolls back the updates of the other accounts
+                        await self._raise_failure(connection, user_id)
+        return balances
+
+    async def _raise_failure(self, connection, user_id):
+        if await connection.fetchval("SELECT 1 FROM payday WHERE user_id = $1", user_id):
+            raise InsufficientFunds(user_id)
+        raise NoAccount(user_id)
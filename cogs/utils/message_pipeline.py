@@ -0,0 +1,162 @@
+import asyncio
+import inspect
+import logging
+import re
+import time
+from collections import defaultdict
+
+# regex flags that can be expressed as scoped inline flags inside the combined matcher
+SCOPED_FLAGS = {re.IGNORECASE: 'i', re.MULTILINE: 'm', re.DOTALL: 's', re.VERBOSE: 'x'}
+named_group_regex = re.compile(r"\(\?P<\w+>")
+
+
+def message_handler(*patterns, predicate=None):
+    """
+    mark a cog method as handler of the shared on_message pipeline
+
+    the method gets called as `handler(self, message, match)` if `predicate(self, message)` is true
+    (or no predicate is given) and one of the precompiled `patterns` matches the message content,
+    `match` is the first successful `re.Match` or None for handlers without patterns.
+    register the marked methods with `register_cog` in `cog_load`.
+    """
+    def decorator(func):
+        func.__message_handler__ = ([re.compile(p) for p in patterns], predicate)
+        return func
+    return decorator
+
+
+class Handler:
+    __slots__ = ('cog', 'callback', 'patterns', 'predicate', 'name', 'combined')
+
+    def __init__(self, cog, callback, patterns, predicate):
+        self.cog = cog
+        self.callback = callback
+        self.patterns = patterns
+        self.predicate = predicate
+        self.name = f"{type(cog).__name__}.{callback.__name__}"
+        self.combined = all(_combinable(p) for p in patterns)
+
+    def match(self, content):
+        for pattern in self.patterns:
+            match = pattern.search(content)
+            if match:
+                return match
+        return None
+
+
+class StageTimings:
+    __slots__ = ('calls', 'total_time')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total_time += elapsed
+
+    @property
+    def average_time(self):
+        return self.total_time / self.calls if self.calls else 0.0
+
+
+def _scoped_pattern(pattern):
+    """the pattern as a non capturing group carrying its own flags, so it can be joined with others"""
+    source = named_group_regex.sub("(?:", pattern.pattern)
+    flags = ''.join(letter for flag, letter in SCOPED_FLAGS.items() if pattern.flags & flag)
+    return f"(?{flags}:{source})" if flags else f"(?:{source})"
+
+
+def _combinable(pattern):
+    if not isinstance(pattern.pattern, str) or pattern.flags & re.ASCII or '(?P=' in pattern.pattern:
+        return False
+    try:
+        re.compile(_scoped_pattern(pattern))
+    except re.error:
+        return False
+    return True
+
+
+class MessagePipeline:
+    """
+    single on_message listener that cogs register their message handlers with.
+    all patterns that can be merged are compiled into one alternation so a message
+    that matches none of them is rejected with a single scan of its content,
+    only handlers whose predicate passes and whose pattern matches get dispatched.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self.combined = None
+        self.logger = logging.getLogger("PoutyBot")
+        self.scan_timings = StageTimings()
+        self.handler_timings = defaultdict(StageTimings)
+
+    def _rebuild(self):
+        patterns = [_scoped_pattern(p) for h in self.handlers if h.combined for p in h.patterns]
+        self.combined = re.compile('|'.join(patterns)) if patterns else None
+
+    def register_cog(self, cog):
+        for name, func in inspect.getmembers(type(cog), inspect.isfunction):
+            options = getattr(func, '__message_handler__', None)
+            if options:
+                self.handlers.append(Handler(cog, getattr(cog, name), *options))
+        self._rebuild()
+
+    def unregister_cog(self, cog):
+        self.handlers = [h for h in self.handlers if h.cog is not cog]
+        self._rebuild()
+
+    async def _run(self, handler, message, match):
+        start = time.perf_counter()
+        try:
+            await handler.callback(message, match)
+        except Exception:
+            self.logger.exception(f"message handler {handler.name} failed")
+        finally:
+            self.handler_timings[handler.name].record(time.perf_counter() - start)
+
+    async def dispatch(self, message):
+        start = time.perf_counter()
+        content = message.content
+        any_match = None
+        dispatched = []
+        for handler in self.handlers:
+            if handler.predicate:
+                try:
+                    if not handler.predicate(handler.cog, message):
+                        continue
+                except Exception:
+                    # a broken predicate must not stop the handlers of the other cogs
+                    self.logger.exception(f"message handler predicate of {handler.name} failed")
+                    continue
+            match = None
+            if handler.patterns:
+                if handler.combined:
+                    if any_match is None:
+                        any_match = bool(self.combined and self.combined.search(content))
+                    if not any_match:
+                        continue
+                match = handler.match(content)
+                if not match:
+                    continue
+            dispatched.append(self._run(handler, message, match))
+        self.scan_timings.record(time.perf_counter() - start)
+        if dispatched:
+            await asyncio.gather(*dispatched)
+
+
+def get_pipeline(bot):
+    pipeline = getattr(bot, 'message_pipeline', None)
+    if pipeline is None:
+        pipeline = bot.message_pipeline = MessagePipeline()
+        bot.add_listener(pipeline.dispatch, 'on_message')
+    return pipeline
+
+
+def register_cog(bot, cog):
+    get_pipeline(bot).register_cog(cog)
+
+
+def unregister_cog(bot, cog):
+    get_pipeline(bot).unregister_cog(cog)
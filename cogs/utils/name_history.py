@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# table -> name column, the tables are created by the Userinfo cog
+NAME_TABLES = {
+    "names": "name",
+    "nicknames": "nickname",
+}
+# remembered last names per table for the dedup, older users are dropped first
+MAX_REMEMBERED = 50_000
+# buffered changes per table while the database can't be written, the oldest are dropped beyond that
+MAX_PENDING = 10_000
+
+
+class NameHistoryRecorder:
+    """
+    buffers name and nickname changes and writes them in batches,
+    a change to the name that was recorded last for the user is dropped
+    """
+
+    def __init__(self, pool, delay=10, max_batch=500):
+        self.pool = pool
+        self.delay = delay
+        self.max_batch = max_batch
+        self.logger = logging.getLogger("PoutyBot")
+        self.pending = {table: [] for table in NAME_TABLES}
+        self.last_names = {table: OrderedDict() for table in NAME_TABLES}
+        self._lock = asyncio.Lock()
+        self._flush_task = None
+        self._closed = False
+
+    def __len__(self):
+        return sum(len(rows) for rows in self.pending.values())
+
+    def record(self, table, user_id, name):
+        last_names = self.last_names[table]
+        if last_names.get(user_id) == name:
+            return
+        last_names[user_id] = name
+        last_names.move_to_end(user_id)
+        if len(last_names) > MAX_REMEMBERED:
+            last_names.popitem(last=False)
+        pending = self.pending[table]
+        pending.append((user_id, name, datetime.now(timezone.utc)))
+        if len(pending) > MAX_PENDING:
+            del pending[:len(pending) - MAX_PENDING]
+        if len(self) >= self.max_batch:
+            self._schedule_flush(0)
+        else:
+            self._schedule_flush(self.delay)
+
+    def _schedule_flush(self, delay):
+        if self._closed:
+            return
+        if self._flush_task and not self._flush_task.done():
+            if delay:
+                return
+            self._flush_task.cancel()
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_later(delay))
+        self._flush_task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        # the write failed or changes came in while it was running
+        if not task.cancelled() and len(self):
+            self._schedule_flush(self.delay)
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        # a cancelled timer must not abort a write that already started
+        await asyncio.shield(self.flush())
+
+    async def flush(self):
+        """write all buffered changes now"""
+        async with self._lock:
+            batches = {table: rows for table, rows in self.pending.items() if rows}
+            if not batches:
+                return
+            self.pending = {table: [] for table in NAME_TABLES}
+            try:
+                async with self.pool.acquire() as con:
+                    async with con.transaction():
+                        for table, rows in batches.items():
+                            user_ids, names, dates = zip(*rows)
+                            # the columns are timestamps without time zone, the cast converts like current_timestamp did
+                            await con.execute(f"""
+                                INSERT INTO {table} (user_id, {NAME_TABLES[table]}, change_date)
+                                SELECT user_id, name, change_date::timestamp
+                                FROM unnest($1::bigint[], $2::varchar[], $3::timestamptz[]) AS rows(user_id, name, change_date)
+                            """, list(user_ids), list(names), list(dates))
+            except Exception:
+                for table, rows in batches.items():
+                    pending = self.pending[table]
+                    pending[:0] = rows
+                    if len(pending) > MAX_PENDING:
+                        self.logger.warning(f"dropping {len(pending) - MAX_PENDING} buffered {table} changes")
+                        del pending[:len(pending) - MAX_PENDING]
+                self.logger.exception("could not save name history")
+                self._schedule_flush(self.delay)
+
+    async def close(self):
+        self._closed = True
+        task = self._flush_task
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if len(self):
+            self.logger.error(f"{len(self)} name history changes could not be saved before closing")
@@ -0,0 +1,76 @@
+import json
+from collections import defaultdict
+
+CREDENTIALS_FILE = 'data/credentials.json'
+SERVER_WHITELIST_FILE = 'data/server_whitelist.json'
+DISABLED_COMMANDS_FILE = 'data/disabled_commands.json'
+
+
+class PermissionContext:
+    """
+    in memory view of everything the global checks need: the owner id, the whitelisted servers
+    and the disabled commands per server. bound to the settings store so it's rebuilt whenever
+    one of the files is changed through the store, instead of reading them on every check.
+    """
+
+    def __init__(self):
+        self.store = None
+        self._owner_id = None
+        self.whitelist_guilds = frozenset()
+        self.disabled_commands = {}
+
+    def bind(self, store):
+        if self.store is not None:
+            self.unbind()
+        self.store = store
+        for path, callback, default in self._sources():
+            callback(store.load(path, default=default))
+            store.subscribe(path, callback)
+
+    def unbind(self):
+        if self.store is None:
+            return
+        for path, callback, _ in self._sources():
+            self.store.unsubscribe(path, callback)
+        self.store = None
+
+    def _sources(self):
+        return ((CREDENTIALS_FILE, self._load_credentials, dict),
+                (SERVER_WHITELIST_FILE, self._load_whitelist, list),
+                (DISABLED_COMMANDS_FILE, self._load_disabled_commands, list))
+
+    def _load_credentials(self, credentials):
+        self._owner_id = int(credentials['owner']) if credentials.get('owner') else None
+
+    def _load_whitelist(self, server_whitelist):
+        self.whitelist_guilds = frozenset(server_whitelist)
+
+    def _load_disabled_commands(self, disabled_commands):
+        index = defaultdict(set)
+        for entry in disabled_commands:
+            index[entry["server"]].add(entry["command"])
+        self.disabled_commands = {guild_id: frozenset(commands) for guild_id, commands in index.items()}
+
+    @property
+    def owner_id(self):
+        if self._owner_id is None and self.store is None:
+            # checks can run before the default cog bound the context, read the file once in that case
+            with open(CREDENTIALS_FILE) as f:
+                self._load_credentials(json.load(f))
+        return self._owner_id
+
+    def is_owner(self, user_id):
+        return user_id == self.owner_id
+
+    def in_whitelist_server(self, bot, user_id):
+        for guild_id in self.whitelist_guilds:
+            guild = bot.get_guild(guild_id)
+            if guild and guild.get_member(user_id):
+                return True
+        return False
+
+    def is_command_disabled(self, guild_id, command_name):
+        return command_name in self.disabled_commands.get(guild_id, ())
+
+
+permissions = PermissionContext()
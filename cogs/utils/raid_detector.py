@@ -0,0 +1,152 @@
+import re
+import time
+from collections import Counter, deque
+from math import ceil
+
+# rule name -> (window seconds, bucket seconds) of the join counters
+JOIN_WINDOWS = {
+    "joins_10s": (10, 1),
+    "joins_1m": (60, 5),
+    "joins_10m": (600, 30),
+}
+YOUNG_ACCOUNT_WINDOW = (60, 5)
+# joins within this many seconds are compared for account creation and name clusters
+CLUSTER_WINDOW = 600
+# 0 disables a rule
+DEFAULT_THRESHOLDS = {
+    "joins_10s": 5,
+    "joins_1m": 10,
+    "joins_10m": 30,
+    "young_accounts_1m": 4,
+    "account_age_days": 7,
+    "same_creation_hour_10m": 5,
+    "similar_names_10m": 4,
+    "lockdown_minutes": 10,
+}
+MIN_NAME_PATTERN_LENGTH = 3
+digits_regex = re.compile(r"\d+")
+separator_regex = re.compile(r"[\W_]+")
+
+
+class RingCounter:
+    """
+    event count over the last `window` seconds, kept in a ring of `resolution` second buckets.
+    buckets are reused once they are older than the window so nothing has to be cleaned up
+    """
+    __slots__ = ('resolution', 'counts', 'slots')
+
+    def __init__(self, window, resolution):
+        size = max(1, ceil(window / resolution))
+        self.resolution = resolution
+        self.counts = [0] * size
+        # the absolute bucket number every cell currently counts
+        self.slots = [-1] * size
+
+    def add(self, now, amount=1):
+        slot = int(now // self.resolution)
+        index = slot % len(self.counts)
+        if self.slots[index] != slot:
+            self.slots[index] = slot
+            self.counts[index] = 0
+        self.counts[index] += amount
+
+    def count(self, now):
+        oldest = int(now // self.resolution) - len(self.counts) + 1
+        return sum(count for count, slot in zip(self.counts, self.slots) if slot >= oldest)
+
+    def clear(self):
+        self.counts = [0] * len(self.counts)
+        self.slots = [-1] * len(self.slots)
+
+
+def name_pattern(name):
+    """name with numbers and separators collapsed, `raider_01` and `Raider-02` both become `raider#`"""
+    pattern = digits_regex.sub("#", separator_regex.sub("", name.lower()))
+    return pattern if len(pattern.replace("#", "")) >= MIN_NAME_PATTERN_LENGTH else None
+
+
+class RaidDetector:
+    """
+    sliding window join rates plus account age and name clusters,
+    everything is in memory so a join is checked without any request
+    """
+
+    def __init__(self, thresholds=None, join_limit=0, join_timer=6):
+        self.thresholds = dict(DEFAULT_THRESHOLDS)
+        self.thresholds.update(thresholds or {})
+        self.joins = {rule: RingCounter(window, resolution) for rule, (window, resolution) in JOIN_WINDOWS.items()}
+        self.young_accounts = RingCounter(*YOUNG_ACCOUNT_WINDOW)
+        # (join time, creation hour, name pattern) of the joins within the cluster window
+        self.recent = deque()
+        self.creation_hours = Counter()
+        self.name_patterns = Counter()
+        # the old `join_limit` joins per `join_timer` hours, only checked while `join_limit_active`
+        self.join_limit = join_limit
+        self.join_limit_active = False
+        self.set_join_timer(join_timer)
+
+    def set_join_timer(self, hours):
+        self.join_timer = hours
+        self.long_joins = RingCounter(hours * 3600, max(hours * 60, 1))
+
+    def set_threshold(self, rule, value):
+        if rule not in DEFAULT_THRESHOLDS:
+            raise KeyError(rule)
+        if value < 0:
+            raise ValueError("thresholds can't be negative")
+        self.thresholds[rule] = value
+
+    def join_count(self, rule, now=None):
+        now = time.time() if now is None else now
+        if rule == "join_limit":
+            return self.long_joins.count(now)
+        return self.joins[rule].count(now)
+
+    def _expire_recent(self, now):
+        while self.recent and self.recent[0][0] <= now - CLUSTER_WINDOW:
+            _, creation_hour, pattern = self.recent.popleft()
+            self.creation_hours[creation_hour] -= 1
+            if not self.creation_hours[creation_hour]:
+                del self.creation_hours[creation_hour]
+            if pattern:
+                self.name_patterns[pattern] -= 1
+                if not self.name_patterns[pattern]:
+                    del self.name_patterns[pattern]
+
+    def record_join(self, member, now=None):
+        """
+        count the join and return (rule, lockdown seconds) of the first exceeded rule or None
+        """
+        now = time.time() if now is None else now
+        thresholds = self.thresholds
+        for counter in self.joins.values():
+            counter.add(now)
+        self.long_joins.add(now)
+
+        created_at = member.created_at.timestamp()
+        young = now - created_at < thresholds["account_age_days"] * 86400
+        if young:
+            self.young_accounts.add(now)
+        self._expire_recent(now)
+        creation_hour = int(created_at // 3600)
+        pattern = name_pattern(member.name)
+        self.recent.append((now, creation_hour, pattern))
+        self.creation_hours[creation_hour] += 1
+        if pattern:
+            self.name_patterns[pattern] += 1
+
+        lockdown = thresholds["lockdown_minutes"] * 60
+        for rule, counter in self.joins.items():
+            if thresholds[rule] and counter.count(now) >= thresholds[rule]:
+                return rule, lockdown
+        checks = (
+            ("young_accounts_1m", self.young_accounts.count(now) if young else 0),
+            ("same_creation_hour_10m", self.creation_hours[creation_hour]),
+            ("similar_names_10m", self.name_patterns[pattern] if pattern else 0),
+        )
+        for rule, count in checks:
+            if thresholds[rule] and count >= thresholds[rule]:
+                return rule, lockdown
+        if self.join_limit_active and self.join_limit and self.long_joins.count(now) >= self.join_limit:
+            return "join_limit", self.join_timer * 3600
+        return None
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from .exceptions import CircuitOpen, RateLimited
+
+# (requests, per seconds) buckets per upstream host, hosts missing here are only guarded by the circuit breaker
+HOST_LIMITS = {
+    "saucenao.com": [(6, 30), (200, 86400)],
+    "api.trace.moe": [(10, 60)],
+    "graphql.anilist.co": [(90, 60)],
+    "api.mangadex.org": [(5, 1)],
+    "danbooru.donmai.us": [(10, 1)],
+    "www.reddit.com": [(60, 60)],
+    "api.twitter.com": [(300, 900)],
+    "api.jikan.moe": [(3, 1)],
+}
+DEFAULT_MAX_WAIT = 10
+FAILURE_THRESHOLD = 5
+RECOVERY_TIME = 60
+
+
+class TokenBucket:
+    """
+    token bucket that hands out reservations, callers wait for the returned delay
+    so concurrent requests queue up in the order they arrived
+    """
+    __slots__ = ('rate', 'per', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, per):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    def delay(self, now):
+        self._refill(now)
+        wait = max(self.blocked_until - now, 0.0)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) * self.per / self.rate)
+        return wait
+
+    def consume(self):
+        self.tokens -= 1
+
+    def refund(self):
+        self.tokens = min(self.rate, self.tokens + 1)
+
+    def update(self, remaining, reset_after=None):
+        """sync the bucket with the quota the upstream reported"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0 and reset_after:
+            self.blocked_until = max(self.blocked_until, now + reset_after)
+
+
+class CircuitBreaker:
+    """
+    opens after `threshold` consecutive failures and rejects requests for `recovery_time` seconds,
+    afterwards requests are let through again and the first success closes it
+    """
+    __slots__ = ('threshold', 'recovery_time', 'failures', 'opened_at')
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, recovery_time=RECOVERY_TIME):
+        self.threshold = threshold
+        self.recovery_time = recovery_time
+        self.failures = 0
+        self.opened_at = None
+
+    def retry_after(self, now):
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.recovery_time - now, 0.0)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class HostLimiter:
+    """
+    token bucket rate limits and a circuit breaker per upstream host.
+    requests wait for a free token for up to `max_wait` seconds and are shed
+    with a `RateLimited` error if it would take longer, while the circuit of a host
+    is open requests fail fast with `CircuitOpen`.
+    """
+
+    def __init__(self, limits=None, max_wait=DEFAULT_MAX_WAIT):
+        self.limits = HOST_LIMITS if limits is None else limits
+        self.max_wait = max_wait
+        self.buckets = {}
+        self.breakers = {}
+        # backoff of hosts without configured buckets, from 429s and quota headers
+        self.blocked_until = {}
+
+    def get_buckets(self, host):
+        buckets = self.buckets.get(host)
+        if buckets is None:
+            buckets = self.buckets[host] = [TokenBucket(rate, per) for rate, per in self.limits.get(host, [])]
+        return buckets
+
+    def get_breaker(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker()
+        return breaker
+
+    async def acquire(self, host, max_wait=None):
+        max_wait = self.max_wait if max_wait is None else max_wait
+        now = time.monotonic()
+        retry_after = self.get_breaker(host).retry_after(now)
+        if retry_after:
+            raise CircuitOpen(host, retry_after)
+        buckets = self.get_buckets(host)
+        wait = max((bucket.delay(now) for bucket in buckets), default=0.0)
+        wait = max(wait, self.blocked_until.get(host, 0.0) - now)
+        if wait > max_wait:
+            raise RateLimited(host, wait)
+        for bucket in buckets:
+            bucket.consume()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def update_quota(self, host, remaining, reset_after=None, bucket_index=0):
+        """apply a quota reported by the upstream (from headers or the response body) to one of the host's buckets"""
+        buckets = self.get_buckets(host)
+        if bucket_index < len(buckets):
+            buckets[bucket_index].update(remaining, reset_after)
+        elif remaining <= 0 and reset_after:
+            blocked_until = time.monotonic() + reset_after
+            self.blocked_until[host] = max(self.blocked_until.get(host, 0.0), blocked_until)
+
+    def record_response(self, host, status, headers):
+        breaker = self.get_breaker(host)
+        if status >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        self._parse_quota_headers(host, status, headers)
+
+    def record_failure(self, host):
+        self.get_breaker(host).record_failure()
+
+    def _parse_quota_headers(self, host, status, headers):
+        retry_after = parse_seconds(headers.get('Retry-After'))
+        if status == 429:
+            self.update_quota(host, 0, retry_after or RECOVERY_TIME)
+            return
+        remaining = headers.get('X-RateLimit-Remaining') or headers.get('X-Ratelimit-Remaining')
+        if remaining is None:
+            return
+        try:
+            remaining = float(remaining)
+        except ValueError:
+            return
+        reset_after = parse_seconds(headers.get('X-RateLimit-Reset-After') or headers.get('X-RateLimit-Reset')
+                                    or headers.get('X-Ratelimit-Reset'))
+        self.update_quota(host, remaining, reset_after)
+
+
+def parse_seconds(value):
+    """
+    parse a Retry-After or X-RateLimit-Reset value which can be seconds,
+    a unix timestamp or a http date into seconds from now
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+    if seconds > 1e9:
+        return max(seconds - time.time(), 0.0)
+    return seconds
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from collections import defaultdict
+
+SAVE_DELAY = 2
+
+
+def write_atomic(file_path, data):
+    """write to a temporary file next to `file_path` and rename it over the old one, so a crash never truncates it"""
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SettingsStore:
+    """
+    in memory view of the json settings files of all cogs.
+    cogs load a file once, mutate the returned object and call `changed(path)`,
+    writes are collected for `delay` seconds and done in a thread with an atomic rename.
+    subscribers of a path get called with the new value after every change.
+    """
+
+    def __init__(self, delay=SAVE_DELAY):
+        self.delay = delay
+        self.data = {}
+        self.dirty = set()
+        self.subscribers = defaultdict(list)
+        self.logger = logging.getLogger("PoutyBot")
+        self._save_task = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def load(self, path, default=dict):
+        """
+        return the settings of `path`, the file is only read the first time,
+        `default` is called to create the settings if the file doesn't exist
+        """
+        if path in self.data:
+            return self.data[path]
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    value = json.load(f)
+            except json.JSONDecodeError:
+                self.logger.error(f"could not parse {path}, using the default settings")
+                value = default()
+        else:
+            value = default()
+            self.dirty.add(path)
+        self.data[path] = value
+        return value
+
+    def get(self, path, default=None):
+        return self.data.get(path, default)
+
+    def set(self, path, value):
+        self.data[path] = value
+        self.changed(path)
+
+    def changed(self, path):
+        """mark the settings of `path` as changed, notify the subscribers and schedule a write"""
+        self.dirty.add(path)
+        for callback in self.subscribers[path]:
+            try:
+                callback(self.data[path])
+            except Exception:
+                self.logger.exception(f"settings subscriber for {path} failed")
+        self._schedule_save()
+
+    def subscribe(self, path, callback):
+        self.subscribers[path].append(callback)
+
+    def unsubscribe(self, path, callback):
+        try:
+            self.subscribers[path].remove(callback)
+        except ValueError:
+            pass
+
+    def _schedule_save(self):
+        if self._save_task and not self._save_task.done():
+            return
+        try:
+            self._save_task = asyncio.get_running_loop().create_task(self._save_later())
+            self._save_task.add_done_callback(self._save_done)
+        except RuntimeError:
+            # no running loop (e.g. during shutdown), write right away
+            for path, data in self._snapshot().items():
+                write_atomic(path, data)
+
+    async def _save_later(self):
+        await asyncio.sleep(self.delay)
+        # a shutdown while writing must not abort the write
+        await asyncio.shield(self.flush())
+
+    def _save_done(self, task):
+        # paths changed while the write was running or the write failed, try again after the delay
+        if not task.cancelled() and self.dirty:
+            self._schedule_save()
+
+    def _snapshot(self):
+        # serialized on the loop so the thread never sees an object that is being mutated
+        snapshot = {path: json.dumps(self.data[path]) for path in self.dirty if path in self.data}
+        self.dirty.clear()
+        return snapshot
+
+    async def flush(self):
+        """write all pending changes now"""
+        async with self._lock:
+            snapshot = self._snapshot()
+            if not snapshot:
+                return
+            try:
+                await asyncio.to_thread(self._write_all, snapshot)
+            except Exception:
+                self.dirty.update(snapshot)
+                self.logger.exception("could not save settings")
+
+    def _write_all(self, snapshot):
+        for path, data in snapshot.items():
+            write_atomic(path, data)
+
+    async def close(self):
+        task = self._save_task
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
@@ -1,5 +1,4 @@
 from discord.ext import commands
-import aiohttp
 class Waifu2x(commands.Cog):
     """
     For upscaling images and removing image noise
@@ -7,10 +6,7 @@ class Waifu2x(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
-
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
+        self.session = bot.session
 
     @commands.command(pass_context=True)
     async def upscale(self,  ctxctx, url=None, scale='2x', noise='medium'):
@@ -1,4 +1,3 @@
-import aiohttp
 import discord
 import json
 import textwrap
@@ -50,7 +49,7 @@ class Wolfram(commands.Cog):
         self.json_file = 'data/wolfram.json'
         with open(self.json_file) as f:
             self.api_key = json.load(f)['api_key']
-        self.session = aiohttp.ClientSession()
+        self.session = bot.session
         self.logger =  logging.getLogger("PoutyBot")
 
     @commands.command()
@@ -81,8 +80,6 @@ class Wolfram(commands.Cog):
 
 
 
-    def cog_unload(self):
-        self.bot.loop.create_task(self.session.close())
 
 
 async def setup(bot):
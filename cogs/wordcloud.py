@@ -11,6 +11,7 @@ import re
 import io
 from PIL import Image
 import numpy as np
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
 
 class Confirm(discord.ui.View):
 
@@ -44,7 +45,9 @@ class Wordcloud(commands.Cog):
 
     async def cog_load(self):
         self.create_table = self.bot.loop.create_task(self.init_table())
+        register_cog(self.bot, self)
     async def cog_unload(self):
+        unregister_cog(self.bot, self)
         self.clean_db.stop()
 
     async def init_table(self):
@@ -67,10 +70,8 @@ class Wordcloud(commands.Cog):
     ###################
     # Listener
     ###################
-    @commands.Cog.listener("on_message")
-    async def record_message(self, message):
-        if not message.guild:
-            return
+    @message_handler(predicate=lambda self, message: message.guild is not None)
+    async def record_message(self, message, match):
         await asyncio.wait_for(self.create_table, timeout=None)
         context = await self.bot.get_context(message)
         if context and context.command:
@@ -1,5 +1,7 @@
 from discord.ext import commands
+from .utils.message_pipeline import message_handler, register_cog, unregister_cog
 import discord
+import re
 import regex
 
 
@@ -68,16 +70,16 @@ class Youtube(commands.Cog):
         """links the Radio Touhou Night Playlist"""
         await ctx.send("https://www.youtube.com/playlist?list={}".format(self.playlist))
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
-        if self.status and message.author == self.user and self.check_if_link(message.content):
-            await self.insert_videos_into_playlist(message.content)
-        else:
-            return
+    async def cog_load(self):
+        register_cog(self.bot, self)
+
+    async def cog_unload(self):
+        unregister_cog(self.bot, self)
 
-    @staticmethod    
-    def check_if_link(content):
-        return 'https://www.youtube' in content or 'https://youtu.be' in content
+    @message_handler(re.compile(r"https://(?:www\.youtube|youtu\.be)"),
+                     predicate=lambda self, message: self.status and message.author == self.user)
+    async def collect_links(self, message, match):
+        await self.insert_videos_into_playlist(message.content)
 
 
     async def insert_videos_into_playlist(self, link):
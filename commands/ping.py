@@ -27,9 +27,14 @@ async def setup(bot: commands.Bot):
     async def at_role_ping(interaction: discord.Interaction, role: discord.Role, message: Optional[str], image: Optional[discord.Attachment]):
         """
         """
-        can_ping = await bot.db.fetchval("""
-        SELECT pingable FROM role_info WHERE role_id = $1
-        """, role.id)
+        roles_cog = bot.get_cog("Roles")
+        if roles_cog:
+            info = await roles_cog.get_role_info(role.guild)
+            can_ping = role.id in info.pingable
+        else:
+            can_ping = await bot.db.fetchval("""
+            SELECT pingable FROM role_info WHERE role_id = $1
+            """, role.id)
         if not can_ping:
             await interaction.response.send_message(content="can't ping this role", ephemeral=True)
             return